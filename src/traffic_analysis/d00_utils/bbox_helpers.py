@@ -103,6 +103,71 @@ def bbox_intersection_over_union(bbox_a, bbox_b) -> float:
     return iou
 
 
+def bbox_intersection_over_union_paired(bboxes_a: np.ndarray,
+                                        bboxes_b: np.ndarray,
+                                        bbox_format: str = "cvlib",
+                                        dtype=np.float64) -> np.ndarray:
+    """Compute intersection over union elementwise for two arrays of bounding boxes, i.e. the iou
+    of bboxes_a[i] with bboxes_b[i]. The arrays are broadcast against each other, so that e.g.
+    bbox_intersection_over_union_matrix can compare every box with every other box.
+
+    Args:
+        bboxes_a -- array of shape (..., 4)
+        bboxes_b -- array of shape (..., 4), broadcastable with bboxes_a
+        bbox_format -- "cvlib" if the boxes are in format (xmin, ymin, xmin+width, ymin+height),
+                       "cv2" if they are in format (xmin, ymin, width, height)
+        dtype -- float type used for the computation, e.g. np.float32 or np.float64
+    Returns:
+        ious -- array of the broadcast shape without the last axis. The iou is 0 for boxes which
+                don't overlap, including boxes with zero area.
+    """
+    bboxes_a = np.asarray(bboxes_a, dtype=dtype)
+    bboxes_b = np.asarray(bboxes_b, dtype=dtype)
+    assert bboxes_a.shape[-1] == 4 and bboxes_b.shape[-1] == 4
+    assert bbox_format in ["cvlib", "cv2"], f"Unknown bbox format {bbox_format}"
+
+    xmin_a, ymin_a, xmax_a, ymax_a = np.moveaxis(bboxes_a, -1, 0)
+    xmin_b, ymin_b, xmax_b, ymax_b = np.moveaxis(bboxes_b, -1, 0)
+    if bbox_format == "cv2":
+        xmax_a, ymax_a = xmin_a + xmax_a, ymin_a + ymax_a
+        xmax_b, ymax_b = xmin_b + xmax_b, ymin_b + ymax_b
+
+    # intersection rectangle, which is empty if the boxes don't overlap
+    inter_w = np.maximum(np.minimum(xmax_a, xmax_b) - np.maximum(xmin_a, xmin_b), 0)
+    inter_h = np.maximum(np.minimum(ymax_a, ymax_b) - np.maximum(ymin_a, ymin_b), 0)
+    inter_area = inter_w * inter_h
+
+    bbox_a_area = np.abs((xmax_a - xmin_a) * (ymax_a - ymin_a))
+    bbox_b_area = np.abs((xmax_b - xmin_b) * (ymax_b - ymin_b))
+    union_area = bbox_a_area + bbox_b_area - inter_area
+
+    ious = np.zeros(inter_area.shape, dtype=dtype)
+    np.divide(inter_area, union_area, out=ious, where=inter_area > 0)
+    return ious
+
+
+def bbox_intersection_over_union_matrix(bboxes_a: np.ndarray,
+                                        bboxes_b: np.ndarray,
+                                        bbox_format: str = "cvlib",
+                                        dtype=np.float64) -> np.ndarray:
+    """Compute intersection over union for every pair of bounding boxes from bboxes_a and bboxes_b
+
+    Args:
+        bboxes_a -- N bboxes, array of shape (N, 4)
+        bboxes_b -- M bboxes, array of shape (M, 4)
+        bbox_format -- "cvlib" or "cv2", see bbox_intersection_over_union_paired
+        dtype -- float type used for the computation, e.g. np.float32 or np.float64
+    Returns:
+        ious -- array of shape (N, M), with ious[i, j] the iou of bboxes_a[i] and bboxes_b[j]
+    """
+    bboxes_a = np.asarray(bboxes_a, dtype=dtype).reshape(-1, 4)
+    bboxes_b = np.asarray(bboxes_b, dtype=dtype).reshape(-1, 4)
+    return bbox_intersection_over_union_paired(bboxes_a[:, np.newaxis, :],
+                                               bboxes_b[np.newaxis, :, :],
+                                               bbox_format=bbox_format,
+                                               dtype=dtype)
+
+
 def display_bboxes_on_frame(frame: np.ndarray, 
                             bboxes: list, 
                             colors: list, 
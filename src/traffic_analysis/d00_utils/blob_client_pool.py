@@ -0,0 +1,115 @@
+import threading
+
+import pandas as pd
+import requests
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient
+
+
+class BlobClientPool:
+    """
+    Process-wide cache of blob service clients, one per connection string, and of their container
+    clients. All the clients of a connection string share one HTTP session, so connections to the
+    storage account are kept alive and reused by every DataLoaderBlob of the process, instead of each
+    loader paying for a new TLS handshake.
+
+    The number of clients created and reused, and of connections opened for the requests sent, are
+    recorded to check that connections are reused.
+    """
+
+    def __init__(self, max_connections: int = 32):
+        """
+        Args:
+            max_connections -- maximum number of connections kept alive per storage host, at least the
+                               number of threads using the clients at the same time
+        """
+        self.max_connections = max_connections
+        self.sessions = {}
+        self.service_clients = {}
+        self.container_clients = {}
+        self.counts = dict.fromkeys(['service_clients_created', 'service_clients_reused',
+                                     'container_clients_created', 'container_clients_reused'], 0)
+        self.lock = threading.Lock()
+
+    def get_service_client(self, connection_string: str) -> BlobServiceClient:
+        """Get the blob service client of a connection string, created on first use
+        """
+        with self.lock:
+            service_client, created = self.get_or_create_service_client(connection_string)
+            self.counts['service_clients_created' if created else 'service_clients_reused'] += 1
+            return service_client
+
+    def get_container_client(self, connection_string: str, container: str):
+        """Get a container client sharing the connections of the service client of connection_string. Only
+        counted as a container client lookup, not as a service client lookup.
+        """
+        with self.lock:
+            service_client, created = self.get_or_create_service_client(connection_string)
+            if created:
+                self.counts['service_clients_created'] += 1
+
+            key = (connection_string, container)
+            if key in self.container_clients:
+                self.counts['container_clients_reused'] += 1
+            else:
+                self.container_clients[key] = service_client.get_container_client(container=container)
+                self.counts['container_clients_created'] += 1
+            return self.container_clients[key]
+
+    def get_or_create_service_client(self, connection_string: str) -> (BlobServiceClient, bool):
+        """Look up the service client of a connection string, creating it and its session if needed. Must be
+        called with the lock held, and doesn't update the counts.
+
+        Returns:
+            service_client: the blob service client
+            created: whether it was created by this call
+        """
+        if connection_string in self.service_clients:
+            return self.service_clients[connection_string], False
+
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=self.max_connections)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        # the session isn't closed with the client, so it stays open for the life of the process
+        transport = RequestsTransport(session=session, session_owner=False)
+
+        service_client = BlobServiceClient.from_connection_string(connection_string, transport=transport)
+        self.sessions[connection_string] = session
+        self.service_clients[connection_string] = service_client
+        return service_client, True
+
+    def report_metrics(self) -> pd.DataFrame:
+        """Report how often clients and connections were reused
+
+        Returns:
+            metrics_df: one row per metric, with the client counts and, over the sessions of the pool,
+                        the number of connections opened and of requests sent through them
+        """
+        with self.lock:
+            metrics = dict(self.counts)
+            metrics['connections_opened'] = 0
+            metrics['requests_sent'] = 0
+            for session in self.sessions.values():
+                for adapter in set(session.adapters.values()):
+                    pools = adapter.poolmanager.pools
+                    for connection_pool in filter(None, map(pools.get, pools.keys())):
+                        metrics['connections_opened'] += connection_pool.num_connections
+                        metrics['requests_sent'] += connection_pool.num_requests
+
+        return pd.DataFrame({'metric': list(metrics.keys()), 'value': list(metrics.values())})
+
+    def clear(self):
+        """Close the sessions and forget all clients, e.g. after forking
+        """
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+            self.service_clients = {}
+            self.container_clients = {}
+            self.counts = dict.fromkeys(self.counts, 0)
+
+
+# shared by all DataLoaderBlob instances of the process
+blob_client_pool = BlobClientPool()
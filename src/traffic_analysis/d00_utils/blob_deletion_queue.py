@@ -0,0 +1,57 @@
+import threading
+
+import pandas as pd
+
+
+class BlobDeletionQueue:
+    """
+    Collects blobs (and folders of blobs) to delete while a pipeline runs, and deletes them all with
+    batch requests when flushed, e.g. once at the end of the run instead of after every chunk. Blobs
+    queued more than once are deleted once. Safe to add to from several threads.
+    """
+
+    def __init__(self, data_loader, n_threads: int = 8):
+        """
+        Args:
+            data_loader -- DataLoaderBlob or DataLoaderLocal the blobs are deleted from
+            n_threads -- maximum number of concurrent deletes if batch deletes aren't available
+        """
+        self.data_loader = data_loader
+        self.n_threads = n_threads
+        self.blobs = []
+        self.prefixes = []
+        self.lock = threading.Lock()
+
+    def add(self, blobs: list):
+        """Queue blobs for deletion
+        """
+        with self.lock:
+            self.blobs += [blob for blob in blobs if blob not in self.blobs]
+
+    def add_prefix(self, prefix: str):
+        """Queue all blobs whose path starts with prefix at the time of the flush for deletion
+        """
+        with self.lock:
+            if prefix not in self.prefixes:
+                self.prefixes.append(prefix)
+
+    def flush(self) -> pd.DataFrame:
+        """Delete the queued blobs and empty the queue
+
+        Returns:
+            deletions_df: one row per blob with whether it was deleted
+        """
+        with self.lock:
+            blobs, prefixes = self.blobs, self.prefixes
+            self.blobs, self.prefixes = [], []
+
+        for prefix in prefixes:
+            prefix_blobs, elapsed_time = self.data_loader.list_blobs(prefix=prefix)
+            blobs += [blob for blob in prefix_blobs if blob not in blobs]
+
+        deletions_df = self.data_loader.batch_delete_blobs(blobs, n_threads=self.n_threads)
+        n_failed = (~deletions_df['success']).sum()
+        if n_failed:
+            print(f"Could not delete {n_failed} of {len(deletions_df)} blobs")
+
+        return deletions_df
@@ -1,8 +1,16 @@
 import json
 import time
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
 from traffic_analysis.d00_utils.load_confs import load_paths
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient
+from traffic_analysis.d00_utils.blob_client_pool import blob_client_pool
+from azure.storage.blob import BlobClient, ContainerClient
+
+
+# maximum number of sub-requests in a blob batch request
+max_blobs_per_batch = 256
 
 
 class DataLoaderBlob:
@@ -11,13 +19,16 @@ class DataLoaderBlob:
                  blob_credentials: dict):
 
         self.blob_credentials = blob_credentials
-        self.client = BlobServiceClient.from_connection_string(blob_credentials['connection_string'])
+        # clients are shared by all loaders of the process, so that connections are reused
+        self.client = blob_client_pool.get_service_client(blob_credentials['connection_string'])
+        self.container_client = blob_client_pool.get_container_client(blob_credentials['connection_string'],
+                                                                      container="pipeline")
 
         return
 
     def read_json(self, file_path):
 
-        blob_client = self.client.get_blob_client(container="pipeline", blob=file_path)
+        blob_client = self.container_client.get_blob_client(blob=file_path)
         try:
             result = blob_client.download_blob()
         except:
@@ -28,7 +39,7 @@ class DataLoaderBlob:
 
     def save_json(self, data, file_path):
 
-        blob_client = self.client.get_blob_client(container="pipeline", blob=file_path)
+        blob_client = self.container_client.get_blob_client(blob=file_path)
         try:
             blob_client.upload_blob(json.dumps(data))
         except:
@@ -59,22 +70,34 @@ class DataLoaderBlob:
 
 
         try:
-            blob_client = self.client.get_blob_client(container="pipeline", blob=path_of_file_to_download)
-
-            with open(path_to_download_file_to, "wb") as download_file:
-                download_file.write(blob_client.download_blob().readall())
+            self.download_blob_to_file(path_of_file_to_download=path_of_file_to_download,
+                                       path_to_download_file_to=path_to_download_file_to)
 
         except:
             print("Could not download " + path_of_file_to_download)
 
         return
 
+    def download_blob_to_file(self,
+                              path_of_file_to_download,
+                              path_to_download_file_to) -> int:
+        """Stream a blob to a local file chunk by chunk, without holding the whole blob in memory.
+        Unlike download_blob, failures are raised so that the caller can retry.
+
+        Returns:
+            n_bytes: size of the downloaded file
+        """
+        blob_client = self.container_client.get_blob_client(blob=path_of_file_to_download)
+
+        with open(path_to_download_file_to, "wb") as download_file:
+            return blob_client.download_blob().readinto(download_file)
+
     def upload_blob(self,
                     path_of_file_to_upload,
                     path_to_upload_file_to):
 
         try:
-            blob_client = self.client.get_blob_client(container="pipeline", blob=path_to_upload_file_to)
+            blob_client = self.container_client.get_blob_client(blob=path_to_upload_file_to)
 
             with open(path_of_file_to_upload, "rb") as data:
                 blob_client.upload_blob(data)
@@ -88,8 +111,7 @@ class DataLoaderBlob:
                    prefix=None):
 
         start = time.time()
-        container_client = self.client.get_container_client(container="pipeline")
-        blobs = container_client.list_blobs(name_starts_with=prefix)
+        blobs = self.container_client.list_blobs(name_starts_with=prefix)
         blob_names = []
         for blob in blobs:
             blob_names.append(blob.name)
@@ -98,26 +120,143 @@ class DataLoaderBlob:
 
         return blob_names, elapsed_time
 
-    def copy_blob(self, file_to_move, new_file, paths):
+    def get_blob_md5(self, file_path):
+
+        blob_client = self.container_client.get_blob_client(blob=file_path)
+        try:
+            content_md5 = blob_client.get_blob_properties().content_settings.content_md5
+        except:
+            print("Could not get properties of " + file_path)
+            return
+
+        # md5 is only stored by the service for some uploads
+        if content_md5:
+            return bytes(content_md5).hex()
 
-        path_to_download_file_to = paths["temp_video"] + \
-                                   file_to_move.split('/')[-1]
+    def copy_blob(self, file_to_move, new_file, paths=None):
+        """Copy a blob within the container, with a server-side copy if possible, else by streaming it
+        through this machine (without writing it to disk). paths is no longer used.
 
-        self.download_blob(path_of_file_to_download=file_to_move, path_to_download_file_to=path_to_download_file_to)
-        self.upload_blob(path_of_file_to_upload=path_to_download_file_to, path_to_upload_file_to=new_file)
+        Returns:
+            success: whether the blob was copied
+        """
+        try:
+            if self.copy_blob_server_side(file_to_copy=file_to_move, new_file=new_file):
+                return True
+        except Exception as e:
+            print(f"Server-side copy of {file_to_move} failed due to {e}, copying it through this machine")
+
+        try:
+            self.copy_blob_streamed(file_to_copy=file_to_move, new_file=new_file)
+        except:
+            print("Could not copy " + file_to_move)
+            return False
 
         return True
 
+    def copy_blob_server_side(self, file_to_copy, new_file, timeout=300):
+        """Ask the storage service to copy a blob, and wait for the copy to finish
+
+        Returns:
+            success: False if the copy failed or didn't finish within timeout seconds
+        """
+        source_client = self.container_client.get_blob_client(blob=file_to_copy)
+        destination_client = self.container_client.get_blob_client(blob=new_file)
+
+        copy = destination_client.start_copy_from_url(source_client.url)
+        copy_status = copy['copy_status']
+        start = time.time()
+        # copies within a storage account usually finish straight away
+        while copy_status == 'pending':
+            if time.time() - start > timeout:
+                destination_client.abort_copy(copy['copy_id'])
+                return False
+            time.sleep(0.5)
+            copy_status = destination_client.get_blob_properties().copy.status
+
+        return copy_status == 'success'
+
+    def copy_blob_streamed(self, file_to_copy, new_file):
+        """Copy a blob by uploading the chunks of its download as they arrive. Failures are raised.
+        """
+        source_client = self.container_client.get_blob_client(blob=file_to_copy)
+        destination_client = self.container_client.get_blob_client(blob=new_file)
+
+        destination_client.upload_blob(source_client.download_blob().chunks(), overwrite=True)
+
+    def move_blob(self, file_to_move, new_file):
+        """Copy a blob to new_file and delete the original once the copy succeeded
+
+        Returns:
+            success: whether the blob was moved
+        """
+        return self.copy_blob(file_to_move=file_to_move, new_file=new_file) and \
+            self.delete_blob(file_to_move)
+
+    def move_blobs(self, files_to_move: list, new_files: list, n_threads=8) -> pd.DataFrame:
+        """Copy blobs concurrently, with at most n_threads copies at a time, then delete the blobs which
+        were copied with batch requests
+
+        Args:
+            files_to_move: paths of the blobs to move
+            new_files: paths to move them to
+            n_threads: maximum number of concurrent copies
+        Returns:
+            moves_df: one row per blob with its old and new path, and whether it was copied and deleted
+        """
+        with ThreadPoolExecutor(max_workers=max(1, n_threads)) as executor:
+            copied = list(executor.map(self.copy_blob, files_to_move, new_files))
+
+        moves_df = pd.DataFrame({'blob_path': pd.Series(files_to_move, dtype=object),
+                                 'new_blob_path': pd.Series(new_files, dtype=object),
+                                 'copied': pd.Series(copied, dtype=bool)})
+        deletions_df = self.batch_delete_blobs(moves_df.loc[moves_df['copied'], 'blob_path'], n_threads=n_threads)
+        moves_df['deleted'] = moves_df['blob_path'].isin(deletions_df.loc[deletions_df['success'], 'blob_path'])
+        moves_df['success'] = moves_df['copied'] & moves_df['deleted']
+
+        return moves_df
+
     def delete_blobs(self, blobs):
+        """Delete blobs, carrying on past failures
 
-        for blob in blobs:
+        Returns:
+            success: whether all the blobs were deleted
+        """
+        deletions_df = self.batch_delete_blobs(blobs)
+        for blob in deletions_df.loc[~deletions_df['success'], 'blob_path']:
+            print("Could not delete " + str(blob))
 
+        return bool(deletions_df['success'].all())
+
+    def batch_delete_blobs(self, blobs, n_threads=8) -> pd.DataFrame:
+        """Delete blobs in batch requests of at most max_blobs_per_batch blobs. If the service rejects a
+        batch request, the blobs of that batch are deleted one at a time, n_threads at a time.
+
+        Returns:
+            deletions_df: one row per blob with whether it was deleted
+        """
+        blobs = list(blobs)
+        success = []
+        for i in range(0, len(blobs), max_blobs_per_batch):
+            batch = blobs[i:i + max_blobs_per_batch]
             try:
-                blob_client = self.client.get_blob_client(container="pipeline", blob=blob)
-                blob_client.delete_blob()
+                responses = self.container_client.delete_blobs(*batch, raise_on_any_failure=False)
+                success += [response.status_code == 202 for response in responses]
+            except Exception as e:
+                print(f"Batch delete failed due to {e}, deleting blobs one at a time")
+                with ThreadPoolExecutor(max_workers=max(1, n_threads)) as executor:
+                    success += list(executor.map(self.delete_blob, batch))
 
-            except:
-                print("Could not delete " + str(blob))
-                return False
+        # success stays boolean when there are no blobs, so that it can be used as a mask
+        return pd.DataFrame({'blob_path': pd.Series(blobs, dtype=object),
+                             'success': pd.Series(success, dtype=bool)})
+
+    def delete_blob(self, blob) -> bool:
+
+        try:
+            blob_client = self.container_client.get_blob_client(blob=blob)
+            blob_client.delete_blob()
+        except:
+            return False
 
         return True
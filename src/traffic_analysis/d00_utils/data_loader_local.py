@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+
+class DataLoaderLocal:
+    """
+    Stand-in for DataLoaderBlob backed by a local folder, with the same methods. Blob names are paths
+    relative to root_dir, e.g. for running the pipeline without blob storage, or for checking code that
+    moves videos around before running it against the real container.
+    """
+
+    def __init__(self,
+                 root_dir: str):
+
+        self.root_dir = root_dir
+        os.makedirs(root_dir, exist_ok=True)
+
+        return
+
+    def get_local_path(self, file_path):
+
+        return os.path.join(self.root_dir, *file_path.split('/'))
+
+    def read_json(self, file_path):
+
+        try:
+            with open(self.get_local_path(file_path)) as f:
+                return json.load(f)
+        except:
+            print("Failed to download " + file_path)
+            return
+
+    def save_json(self, data, file_path):
+
+        local_path = self.get_local_path(file_path)
+        if os.path.exists(local_path):
+            print("Replacing JSON file: " + str(file_path))
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path, "w") as f:
+            json.dump(data, f)
+
+    def file_exists(self, file_path):
+
+        return os.path.isfile(self.get_local_path(file_path))
+
+    def download_blob(self,
+                      path_of_file_to_download,
+                      path_to_download_file_to):
+
+        try:
+            self.download_blob_to_file(path_of_file_to_download=path_of_file_to_download,
+                                       path_to_download_file_to=path_to_download_file_to)
+
+        except:
+            print("Could not download " + path_of_file_to_download)
+
+        return
+
+    def download_blob_to_file(self,
+                              path_of_file_to_download,
+                              path_to_download_file_to) -> int:
+        """Copy a file to a local path. Failures are raised, as for DataLoaderBlob.
+
+        Returns:
+            n_bytes: size of the downloaded file
+        """
+        shutil.copyfile(self.get_local_path(path_of_file_to_download), path_to_download_file_to)
+
+        return os.path.getsize(path_to_download_file_to)
+
+    def upload_blob(self,
+                    path_of_file_to_upload,
+                    path_to_upload_file_to):
+
+        local_path = self.get_local_path(path_to_upload_file_to)
+        if os.path.exists(local_path):
+            print("File already exists!")
+            return
+
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        shutil.copyfile(path_of_file_to_upload, local_path)
+
+        return
+
+    def list_blobs(self,
+                   prefix=None):
+
+        start = time.time()
+        blob_names = []
+        for dir_path, _, file_names in os.walk(self.root_dir):
+            for file_name in file_names:
+                blob_name = os.path.relpath(os.path.join(dir_path, file_name), self.root_dir).replace(os.sep, '/')
+                if prefix is None or blob_name.startswith(prefix):
+                    blob_names.append(blob_name)
+
+        elapsed_time = time.time() - start
+
+        return sorted(blob_names), elapsed_time
+
+    def get_blob_md5(self, file_path):
+
+        try:
+            with open(self.get_local_path(file_path), "rb") as f:
+                md5 = hashlib.md5()
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    md5.update(chunk)
+        except:
+            print("Could not get properties of " + file_path)
+            return
+
+        return md5.hexdigest()
+
+    def copy_blob(self, file_to_move, new_file, paths=None):
+
+        try:
+            local_path = self.get_local_path(new_file)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            shutil.copyfile(self.get_local_path(file_to_move), local_path)
+        except:
+            print("Could not copy " + file_to_move)
+            return False
+
+        return True
+
+    def move_blob(self, file_to_move, new_file):
+
+        return self.copy_blob(file_to_move=file_to_move, new_file=new_file) and \
+            self.delete_blob(file_to_move)
+
+    def move_blobs(self, files_to_move: list, new_files: list, n_threads=8) -> pd.DataFrame:
+
+        with ThreadPoolExecutor(max_workers=max(1, n_threads)) as executor:
+            copied = list(executor.map(self.copy_blob, files_to_move, new_files))
+
+        moves_df = pd.DataFrame({'blob_path': pd.Series(files_to_move, dtype=object),
+                                 'new_blob_path': pd.Series(new_files, dtype=object),
+                                 'copied': pd.Series(copied, dtype=bool)})
+        deletions_df = self.batch_delete_blobs(moves_df.loc[moves_df['copied'], 'blob_path'], n_threads=n_threads)
+        moves_df['deleted'] = moves_df['blob_path'].isin(deletions_df.loc[deletions_df['success'], 'blob_path'])
+        moves_df['success'] = moves_df['copied'] & moves_df['deleted']
+
+        return moves_df
+
+    def delete_blobs(self, blobs):
+
+        deletions_df = self.batch_delete_blobs(blobs)
+        for blob in deletions_df.loc[~deletions_df['success'], 'blob_path']:
+            print("Could not delete " + str(blob))
+
+        return bool(deletions_df['success'].all())
+
+    def batch_delete_blobs(self, blobs, n_threads=8) -> pd.DataFrame:
+
+        blobs = list(blobs)
+        with ThreadPoolExecutor(max_workers=max(1, n_threads)) as executor:
+            success = list(executor.map(self.delete_blob, blobs))
+
+        # success stays boolean when there are no blobs, so that it can be used as a mask
+        return pd.DataFrame({'blob_path': pd.Series(blobs, dtype=object),
+                             'success': pd.Series(success, dtype=bool)})
+
+    def delete_blob(self, blob) -> bool:
+
+        try:
+            os.remove(self.get_local_path(blob))
+        except:
+            return False
+
+        return True
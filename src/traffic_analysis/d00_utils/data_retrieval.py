@@ -7,6 +7,8 @@ import re
 import shutil
 import glob
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 
 def load_video_names(paths):
@@ -30,6 +32,19 @@ def load_videos_into_np(folder):
     return video_dict
 
 
+def load_videos_as_streams(folder):
+    # Open files as streaming videos, which only decode frames when they are read
+    video_dict = {}
+    for filename in glob.glob(folder + '*.mp4'):
+        try:
+            video_name = re.split(r"\\|/", filename)[-1]
+            video_dict[video_name] = StreamingVideo(filename)
+        except Exception as e:
+            print(f"Could not open {filename} as a video due to {e}")
+
+    return video_dict
+
+
 def download_video_and_convert_to_numpy(local_folder, s3_profile, bucket, filenames: list):
     """Downloads videos from s3 to a local temp directory and then loads them into numpy arrays, before
     deleting the temp directory (default behavior).
@@ -58,6 +73,90 @@ def download_video_and_convert_to_numpy(local_folder, s3_profile, bucket, filena
     return load_videos_into_np(local_folder)
 
 
+def get_local_video_name(filename: str) -> str:
+    """Name under which a video from blob storage is saved locally"""
+    return filename.split('/')[-1].replace(':', '-').replace(" ", "_")
+
+
+def download_blob_with_retries(data_loader,
+                               path_of_file_to_download: str,
+                               path_to_download_file_to: str,
+                               n_retries: int = 3,
+                               retry_delay: float = 1.) -> dict:
+    """Download one file with data_loader.download_blob_to_file, retrying failed attempts after an
+    exponentially increasing delay
+
+    Returns:
+        download_info: path of the blob, size in bytes, time taken in seconds, number of attempts
+                       and whether the download succeeded
+    """
+    start = time.time()
+    n_bytes = 0
+    success = False
+    for attempt in range(n_retries + 1):
+        if attempt > 0:
+            time.sleep(retry_delay * 2 ** (attempt - 1))
+        try:
+            n_bytes = data_loader.download_blob_to_file(path_of_file_to_download=path_of_file_to_download,
+                                                        path_to_download_file_to=path_to_download_file_to)
+            success = True
+            break
+        except Exception as e:
+            print(f"Attempt {attempt + 1} to download {path_of_file_to_download} failed due to {e}")
+
+    if not success:
+        print("Could not download " + path_of_file_to_download)
+        if os.path.exists(path_to_download_file_to):
+            os.remove(path_to_download_file_to)
+
+    return {'blob_path': path_of_file_to_download,
+            'n_bytes': n_bytes,
+            'elapsed_time': time.time() - start,
+            'n_attempts': attempt + 1,
+            'success': success}
+
+
+def download_blobs_concurrently(data_loader,
+                                file_names: list,
+                                local_folder: str,
+                                n_threads: int = 4,
+                                n_retries: int = 3,
+                                retry_delay: float = 1.) -> pd.DataFrame:
+    """Download files from blob storage to a local folder, with at most n_threads downloads at a time.
+    Each file is streamed to disk, and failed downloads are retried.
+
+    Args:
+        data_loader: DataLoaderBlob, or DataLoaderLocal to download from a local folder
+        file_names: paths of the files on blob storage
+        local_folder: local folder to download the files to (including trailing slash), under the
+                      names given by get_local_video_name
+        n_threads: maximum number of concurrent downloads
+        n_retries: number of times a failed download is retried
+        retry_delay: delay in seconds before the first retry, doubled for each following one
+    Returns:
+        downloads_df: one row per file with its size in bytes, download time, number of attempts and
+                      whether it succeeded
+    """
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, n_threads)) as executor:
+        futures = [executor.submit(download_blob_with_retries,
+                                   data_loader=data_loader,
+                                   path_of_file_to_download=filename,
+                                   path_to_download_file_to=local_folder + get_local_video_name(filename),
+                                   n_retries=n_retries,
+                                   retry_delay=retry_delay)
+                   for filename in file_names]
+        downloads_df = pd.DataFrame([future.result() for future in futures],
+                                    columns=['blob_path', 'n_bytes', 'elapsed_time', 'n_attempts', 'success'])
+
+    elapsed_time = time.time() - start
+    n_megabytes = downloads_df['n_bytes'].sum() / 1e6
+    print(f"Downloaded {downloads_df['success'].sum()}/{len(file_names)} files ({n_megabytes:.1f} MB) "
+          f"in {elapsed_time:.1f} seconds ({n_megabytes / max(elapsed_time, 1e-6):.2f} MB/s)")
+
+    return downloads_df
+
+
 def delete_and_recreate_dir(temp_dir):
     """
     Creates an empty local directory for downloading from s3.
@@ -92,6 +191,76 @@ def mp4_to_npy(local_mp4_path):
     return buf
 
 
+class StreamingVideo:
+    """
+    Video source which reads frames from a local mp4 on demand instead of decoding the whole video
+    into one numpy array. Only the requested frames are decoded into arrays, frames in between are
+    skipped with cap.grab(), so memory use does not depend on the length of the video.
+    """
+
+    def __init__(self, local_mp4_path: str):
+        cap = cv2.VideoCapture(local_mp4_path)
+        if not cap.isOpened():
+            raise Exception('Could not open video')
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        cap.release()
+
+        if frame_count == 0:
+            raise Exception('Video has no frames')
+
+        self.local_mp4_path = local_mp4_path
+        # same layout as the array returned by mp4_to_npy
+        self.shape = (frame_count, frame_height, frame_width, 3)
+
+    def read_frames(self, frame_inds):
+        """Yield (frame_ind, frame) for the requested frames, in increasing order of frame_ind
+
+        Args:
+            frame_inds: indices of the frames to decode
+        """
+        frame_inds = np.unique(frame_inds)
+        if frame_inds.size == 0:
+            return
+
+        cap = cv2.VideoCapture(self.local_mp4_path)
+        try:
+            next_ind = 0
+            for frame_ind in frame_inds:
+                # skip frames up to the requested one without converting them
+                while next_ind < frame_ind:
+                    if not cap.grab():
+                        return
+                    next_ind += 1
+                ret, frame = cap.read()
+                next_ind += 1
+                if not ret:
+                    return
+                yield frame_ind, frame
+        finally:
+            cap.release()
+
+
+def read_video_frames(video, frame_inds):
+    """Yield (frame_ind, frame) for the requested frames of a video, which can either be a numpy
+    array as returned by mp4_to_npy or a StreamingVideo
+    """
+    if isinstance(video, StreamingVideo):
+        yield from video.read_frames(frame_inds)
+    else:
+        for frame_ind in frame_inds:
+            yield frame_ind, video[frame_ind]
+
+
+def get_video_frames(video, frame_inds) -> np.ndarray:
+    """Get the requested frames of a video (numpy array or StreamingVideo) as one numpy array
+    """
+    if isinstance(video, StreamingVideo):
+        return np.array([frame for _, frame in video.read_frames(frame_inds)])
+    return video[frame_inds]
+
+
 def connect_to_bucket(profile_dir, bucket_name):
     """Connects to the s3 bucket"""
     # Set up boto3 session
@@ -0,0 +1,75 @@
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+class StageTimer:
+    """
+    Accumulates the time spent in each stage of a process separately for each item processed
+    (e.g. each video), so that it can be reported where the time goes.
+    """
+
+    def __init__(self, stages: list):
+        """
+        Args:
+            stages -- names of the stages, in the order in which they are reported
+        """
+        self.stages = stages
+        self.timings = {}
+
+    @contextmanager
+    def time_stage(self, item: str, stage: str, add_to_total: bool = False):
+        """Context manager adding the time spent in its block to the stage of an item
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_timing(item=item, stage=stage, elapsed_time=time.perf_counter() - start_time,
+                               add_to_total=add_to_total)
+
+    def record_timing(self, item: str, stage: str, elapsed_time: float, add_to_total: bool = False):
+        """Add elapsed_time to the running total of a stage for an item
+
+        Args:
+            item: name of the item, e.g. a video name
+            stage: one of the stages of the timer, or "total"
+            elapsed_time: time taken in seconds
+            add_to_total: also add elapsed_time to the total of the item, for stages timed outside
+                          of the block whose total is recorded
+        """
+        assert stage in self.stages or stage == 'total', f"Unknown stage {stage}"
+        timings = self.timings.setdefault(item, dict.fromkeys(self.stages + ['total'], 0.))
+        timings[stage] += elapsed_time
+        if add_to_total:
+            timings['total'] += elapsed_time
+
+    def add_timings(self, item: str, timings: dict):
+        """Add the timings of an item recorded by another timer with the same stages, e.g. in a worker process
+
+        Args:
+            item: name of the item
+            timings: time in seconds of each stage and of the total, as in the timings of that timer
+        """
+        for stage, elapsed_time in timings.items():
+            self.record_timing(item=item, stage=stage, elapsed_time=elapsed_time)
+
+    def reset(self):
+        self.timings = {}
+
+    def report_timings(self) -> pd.DataFrame:
+        """Report the time spent in each stage for each item. If the total time of an item was recorded,
+        the time not spent in any of the stages is reported as "other".
+
+        Returns:
+            timings_df: one row per item with the time in seconds of each stage
+        """
+        column_names = ['item'] + self.stages + ['other', 'total']
+        rows = []
+        for item, timings in self.timings.items():
+            stage_times = [timings[stage] for stage in self.stages]
+            total_time = timings['total'] if timings['total'] else sum(stage_times)
+            rows.append([item] + stage_times + [total_time - sum(stage_times), total_time])
+
+        return pd.DataFrame(rows, columns=column_names)
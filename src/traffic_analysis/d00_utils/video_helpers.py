@@ -1,6 +1,8 @@
 import imageio
 import numpy as np
 import os
+import queue
+import threading
 import dateutil
 import datetime
 import re
@@ -20,6 +22,77 @@ def write_mp4(local_mp4_dir: str, mp4_name: str, video: np.ndarray, fps: int):
     imageio.mimwrite(local_mp4_path_out, video, fps=fps)
 
 
+class Mp4Writer:
+    """
+    Writes a video to an mp4 file one frame at a time, so that the frames don't need to be kept in memory.
+    In background mode the frames are encoded by a thread, fed through a queue of at most queue_size
+    frames, so that encoding doesn't hold up the code producing the frames.
+    """
+
+    def __init__(self,
+                 local_mp4_dir: str,
+                 mp4_name: str,
+                 fps: int,
+                 background: bool = False,
+                 queue_size: int = 16):
+        """
+        Args:
+            local_mp4_dir -- path to directory to store vids in
+            mp4_name -- desired name for video. Please include .mp4 extension
+            fps -- provide the frames per second of the video
+            background -- if true, encode the frames in a background thread
+            queue_size -- maximum number of frames waiting to be encoded in background mode
+        """
+        self.local_mp4_path_out = os.path.join(local_mp4_dir, mp4_name)
+        self.writer = imageio.get_writer(self.local_mp4_path_out, fps=fps)
+        self.error = None
+        self.frames = None
+        self.thread = None
+        if background:
+            self.frames = queue.Queue(maxsize=max(1, queue_size))
+            self.thread = threading.Thread(target=self.write_queued_frames, daemon=True)
+            self.thread.start()
+
+    def append(self, frame: np.ndarray):
+        """Add a frame at the end of the video. In background mode the frame must not be modified afterwards.
+        """
+        if self.thread is None:
+            self.writer.append_data(frame)
+            return
+        if self.error is not None:
+            raise self.error
+        self.frames.put(frame)
+
+    def write_queued_frames(self):
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                return
+            if self.error is None:
+                try:
+                    self.writer.append_data(frame)
+                except Exception as e:
+                    # raised again in the thread appending the frames
+                    self.error = e
+
+    def close(self):
+        """Finish writing the queued frames and close the file
+        """
+        if self.thread is not None:
+            self.frames.put(None)
+            self.thread.join()
+            self.thread = None
+        self.writer.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 def parse_video_or_annotation_name(video_name: str) -> (str, datetime.datetime):
     """Helper function to parse the jamcam video/annotation names into camera_id and 
        upload datetime, in the types we need them in 
@@ -0,0 +1,186 @@
+import os
+import json
+import hashlib
+
+from traffic_analysis.d00_utils.data_loader_blob import DataLoaderBlob
+
+
+def compute_file_md5(file_path: str, chunk_size: int = 4 * 1024 * 1024) -> str:
+    """Compute the md5 checksum of a local file, reading it in chunks
+
+    Args:
+        file_path: path to the local file
+        chunk_size: number of bytes read at a time
+    Returns:
+        md5 checksum as a hex string
+    """
+    md5 = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class DetectionModelArtifactManager:
+    """
+    Makes sure the files of a detection model (cfg, weights, class names, ...) are available
+    locally before any detection is run. Files are downloaded from blob storage if needed, checked
+    against the md5 checksums stored on blob storage, and described in a manifest.json written next
+    to them. On later runs the local files are only checked against the size and modification time
+    recorded in the manifest, which is cheap, so blob storage is only contacted (and checksums only
+    computed) if a file is missing or was changed. The manifests of prepared models are kept in
+    memory; use get_model_artifact_manager to share one manager per process.
+    """
+
+    manifest_file_name = "manifest.json"
+
+    def __init__(self, paths: dict, blob_credentials: dict):
+        """
+        Args:
+            paths: dictionary of paths from yml file
+            blob_credentials: blob credentials
+        """
+        self.paths = paths
+        self.blob_credentials = blob_credentials
+        self.manifest = {}
+
+    def prepare_model(self, model_name: str) -> dict:
+        """Check the local files of model_name, downloading those which are missing or changed
+
+        Args:
+            model_name: name of the detection model, as used for its folder on blob storage
+        Returns:
+            model_manifest: dict with file names as keys and dicts of local_path, md5, size and mtime as values
+        """
+        if model_name in self.manifest:
+            return self.manifest[model_name]
+
+        local_folder_path_model = os.path.join(self.paths['local_detection_model'], model_name)
+        model_manifest = self.load_local_manifest(local_folder_path_model)
+
+        if model_manifest is None or not self.verify_local_files(model_manifest):
+            print(f"Checking detection model {model_name} against blob storage")
+            model_manifest = self.download_model(model_name=model_name,
+                                                 local_folder_path_model=local_folder_path_model,
+                                                 local_manifest=model_manifest or {})
+
+        self.manifest[model_name] = model_manifest
+        return model_manifest
+
+    def get_file_path(self, model_name: str, file_name: str) -> str:
+        """Get the local path of one of the files of a prepared model
+        """
+        return self.manifest[model_name][file_name]['local_path']
+
+    def load_local_manifest(self, local_folder_path_model: str) -> dict:
+        """Load the manifest saved with the local model files, if there is one
+        """
+        manifest_path = os.path.join(local_folder_path_model, self.manifest_file_name)
+        if not os.path.exists(manifest_path):
+            return None
+
+        with open(manifest_path, "r") as f:
+            model_manifest = json.load(f)
+
+        for file_name, file_info in model_manifest.items():
+            file_info['local_path'] = os.path.join(local_folder_path_model, file_name)
+        return model_manifest
+
+    @staticmethod
+    def is_unchanged(file_info: dict) -> bool:
+        """Check that a file exists locally with the size and modification time recorded in its manifest entry
+        """
+        local_path = file_info['local_path']
+        if not os.path.exists(local_path):
+            return False
+        stat = os.stat(local_path)
+        return stat.st_size == file_info['size'] and stat.st_mtime == file_info.get('mtime')
+
+    @classmethod
+    def verify_local_files(cls, model_manifest: dict) -> bool:
+        """Check that every file in the manifest is unchanged since it was verified
+        """
+        if not model_manifest:
+            return False
+
+        for file_name, file_info in model_manifest.items():
+            if not cls.is_unchanged(file_info):
+                print(f"Detection model file {file_info['local_path']} is missing or changed")
+                return False
+
+        return True
+
+    def download_model(self, model_name: str, local_folder_path_model: str, local_manifest: dict) -> dict:
+        """Download the files of model_name from blob storage which are missing or changed locally, validate
+        them against the md5 checksums stored on blob storage, and save the manifest locally. Local files
+        without a manifest entry (e.g. from before manifests were saved) are kept if their md5 matches.
+
+        Raises:
+            ValueError: if no files are found for the model, a file can't be downloaded, or a
+                        downloaded file does not match the checksum stored on blob storage
+        """
+        dl = DataLoaderBlob(self.blob_credentials)
+        os.makedirs(local_folder_path_model, exist_ok=True)
+
+        files_to_download, elapsed_time = dl.list_blobs(
+            prefix=self.paths['blob_detection_model'] + model_name + '/')
+        if not files_to_download:
+            raise ValueError(f"No files found on blob storage for detection model {model_name}")
+
+        model_manifest = {}
+        for path_of_file_to_download in files_to_download:
+            blob_file_path, file_name = os.path.split(path_of_file_to_download)
+            path_to_download_file_to = os.path.join(local_folder_path_model, file_name)
+            blob_md5 = dl.get_blob_md5(path_of_file_to_download)
+
+            file_info = local_manifest.get(file_name)
+            if file_info is not None and self.is_unchanged(file_info):
+                model_manifest[file_name] = file_info
+                continue
+            if os.path.exists(path_to_download_file_to) and blob_md5 is not None and \
+                    compute_file_md5(path_to_download_file_to) == blob_md5:
+                model_manifest[file_name] = self.describe_file(path_to_download_file_to, blob_md5)
+                continue
+
+            print(f"Downloading {path_of_file_to_download}")
+            try:
+                dl.download_blob_to_file(path_of_file_to_download=path_of_file_to_download,
+                                         path_to_download_file_to=path_to_download_file_to)
+            except Exception as e:
+                raise ValueError(f"Could not download file {file_name} of detection model {model_name} "
+                                 f"from {path_of_file_to_download}") from e
+
+            local_md5 = compute_file_md5(path_to_download_file_to)
+            if blob_md5 is not None and blob_md5 != local_md5:
+                raise ValueError(f"Downloaded file {path_to_download_file_to} does not match "
+                                 f"the checksum of {path_of_file_to_download}")
+
+            model_manifest[file_name] = self.describe_file(path_to_download_file_to, local_md5)
+
+        with open(os.path.join(local_folder_path_model, self.manifest_file_name), "w") as f:
+            json.dump({file_name: {key: value for key, value in file_info.items() if key != 'local_path'}
+                       for file_name, file_info in model_manifest.items()}, f, indent=2)
+
+        return model_manifest
+
+    @staticmethod
+    def describe_file(local_path: str, md5: str) -> dict:
+        stat = os.stat(local_path)
+        return {'md5': md5,
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'local_path': local_path}
+
+
+# one manager per local model folder, shared by all analysers (and backends) of the process
+model_artifact_managers = {}
+
+
+def get_model_artifact_manager(paths: dict, blob_credentials: dict) -> DetectionModelArtifactManager:
+    """Get the artifact manager of the process for the local model folder in paths, created on first use
+    """
+    local_detection_model = paths['local_detection_model']
+    if local_detection_model not in model_artifact_managers:
+        model_artifact_managers[local_detection_model] = DetectionModelArtifactManager(
+            paths=paths, blob_credentials=blob_credentials)
+    return model_artifact_managers[local_detection_model]
@@ -5,63 +5,112 @@ import pandas as pd
 from traffic_analysis.d00_utils.data_loader_blob import DataLoaderBlob
 from traffic_analysis.d00_utils.data_loader_sql import DataLoaderSQL
 from traffic_analysis.d00_utils.data_retrieval import (delete_and_recreate_dir,
-                                                       load_videos_into_np)
+                                                       download_blobs_concurrently,
+                                                       load_videos_as_streams)
 
 
 def update_frame_level_table(analyser,
                              file_names: list,
                              paths: dict,
-                             creds: dict) -> pd.DataFrame:
+                             creds: dict,
+                             data_loader=None,
+                             n_download_threads: int = 4,
+                             n_download_retries: int = 3) -> pd.DataFrame:
     """ Update the frame level table on PSQL based on the videos in the files list
     Args:
         analyser: analyser object for doing traffic analysis
         file_names: list of s3 filepaths for the videos to be processed
         paths: dictionary of paths from yml file
         creds: dictionary of credentials from yml file
+        data_loader: loader the videos are downloaded with, DataLoaderBlob by default
+        n_download_threads: maximum number of videos downloaded at a time
+        n_download_retries: number of times a failed download is retried
 
     Returns:
         frame_level_df: dataframe of frame level information returned by 
                         analyser object
     """
-    blob_credentials = creds[paths['blob_creds']]
-    dl = DataLoaderBlob(blob_credentials)
+    if data_loader is None:
+        data_loader = DataLoaderBlob(creds[paths['blob_creds']])
 
-    delete_and_recreate_dir(paths["temp_video"])
+    download_videos(data_loader=data_loader,
+                    file_names=file_names,
+                    local_folder=paths["temp_video"],
+                    n_download_threads=n_download_threads,
+                    n_download_retries=n_download_retries)
+    frame_level_df = analyse_videos(analyser=analyser,
+                                    local_folder=paths["temp_video"])
+
+    if frame_level_df is None:
+        return None
+    write_frame_level_table(frame_level_df=frame_level_df,
+                            paths=paths,
+                            creds=creds)
+
+    return frame_level_df
+
+
+def download_videos(data_loader,
+                    file_names: list,
+                    local_folder: str,
+                    n_download_threads: int = 4,
+                    n_download_retries: int = 3) -> pd.DataFrame:
+    """Download the videos in the files list to an empty local folder
+    Args:
+        data_loader: DataLoaderBlob or DataLoaderLocal
+        file_names: list of s3 filepaths for the videos to be processed
+        local_folder: folder to download the videos to (including trailing slash), wiped first
+        n_download_threads: maximum number of videos downloaded at a time
+        n_download_retries: number of times a failed download is retried
+
+    Returns:
+        downloads_df: download report returned by download_blobs_concurrently
+    """
+    delete_and_recreate_dir(local_folder)
     # Download the video file_names using the file list
-    for filename in file_names:
-        path_to_download_file_to = paths["temp_video"] + \
-            filename.split('/')[-1].replace(':', '-').replace(" ", "_")
-        dl.download_blob(path_of_file_to_download=filename,
-                         path_to_download_file_to=path_to_download_file_to)
+    return download_blobs_concurrently(data_loader=data_loader,
+                                       file_names=file_names,
+                                       local_folder=local_folder,
+                                       n_threads=n_download_threads,
+                                       n_retries=n_download_retries)
 
-    video_dict = load_videos_into_np(paths["temp_video"])
-    delete_and_recreate_dir(paths["temp_video"])
 
+def analyse_videos(analyser, local_folder: str) -> pd.DataFrame:
+    """Construct the frame level df of the videos in a local folder, which is deleted afterwards
+    Args:
+        analyser: analyser object for doing traffic analysis
+        local_folder: folder the videos were downloaded to (including trailing slash)
+
+    Returns:
+        frame_level_df: dataframe of frame level information returned by
+                        analyser object, None if nothing was detected
+    """
+    # frames are decoded from the downloaded files while they are analysed, so the
+    # files are only deleted once the analyser is done with them
+    video_dict = load_videos_as_streams(local_folder)
     frame_level_df = analyser.construct_frame_level_df(video_dict)
-    if frame_level_df.empty:
+    delete_and_recreate_dir(local_folder)
+
+    if frame_level_df is None or frame_level_df.empty:
         return None
     frame_level_df.dropna(how='any', inplace=True)
     frame_level_df = frame_level_df.astype(
         {'frame_id': 'int64',
          'vehicle_id': 'int64'})
+    return frame_level_df
+
 
-    frame_level_sql_df = pd.DataFrame.copy(frame_level_df)
-    x, y, w, h = [], [], [], []
-    for vals in frame_level_sql_df['bboxes'].values:
-        if isinstance(vals, list) and len(vals) > 3:
-            x.append(int(vals[0]))
-            y.append(int(vals[1]))
-            w.append(int(vals[2]))
-            h.append(int(vals[3]))
-    frame_level_sql_df['bbox_x'] = x
-    frame_level_sql_df['bbox_y'] = y
-    frame_level_sql_df['bbox_w'] = w
-    frame_level_sql_df['bbox_h'] = h
-    frame_level_sql_df.drop('bboxes', axis=1, inplace=True)
+def write_frame_level_table(frame_level_df: pd.DataFrame, paths: dict, creds: dict):
+    """Add the frame level df to the frame level table on PSQL
+    """
+    # the table stores the boxes as integers, the frame level df passed on to the video level keeps them as tracked
+    frame_level_sql_df = frame_level_df.astype(
+        {'bbox_x': 'int64',
+         'bbox_y': 'int64',
+         'bbox_w': 'int64',
+         'bbox_h': 'int64'})
     frame_level_sql_df['creation_datetime'] = datetime.datetime.now()
 
     db_obj = DataLoaderSQL(creds=creds, paths=paths)
     db_obj.add_to_sql(df=frame_level_sql_df,
                       table_name=paths['db_frame_level'])
-
-    return frame_level_df
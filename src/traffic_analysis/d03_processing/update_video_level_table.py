@@ -40,26 +40,24 @@ def update_video_level_table(analyser,
             paths['db_frame_level'], filter_string)
         frame_level_df = db_obj.select_from_table(sql=sql_string)
 
-        bboxes = []
-        for x, y, w, h in zip(frame_level_df['bbox_x'].values, 
-                              frame_level_df['bbox_y'].values, 
-                              frame_level_df['bbox_w'].values, 
-                              frame_level_df['bbox_h'].values):
-            bboxes.append([x, y, w, h])
-
-        frame_level_df['bboxes'] = bboxes
-        frame_level_df.drop('bbox_x', axis=1, inplace=True)
-        frame_level_df.drop('bbox_y', axis=1, inplace=True)
-        frame_level_df.drop('bbox_w', axis=1, inplace=True)
-        frame_level_df.drop('bbox_h', axis=1, inplace=True)
-
     # Create video level table and add to database
     video_level_df = analyser.construct_video_level_df(frame_level_df)
     if video_level_df.empty:
         return
-    video_level_df['creation_datetime'] = datetime.datetime.now()
-
-    db_obj.add_to_sql(df=video_level_df, table_name=paths['db_video_level'])
+    write_video_level_table(video_level_df=video_level_df, paths=paths, creds=creds, db_obj=db_obj)
 
     if return_data:
         return video_level_df
+
+
+def write_video_level_table(video_level_df: pd.DataFrame,
+                            paths: dict,
+                            creds: dict,
+                            db_obj: DataLoaderSQL = None):
+    """Add the video level df to the video level table on the database, with its creation time
+    """
+    if db_obj is None:
+        db_obj = DataLoaderSQL(creds=creds, paths=paths)
+
+    video_level_df['creation_datetime'] = datetime.datetime.now()
+    db_obj.add_to_sql(df=video_level_df, table_name=paths['db_video_level'])
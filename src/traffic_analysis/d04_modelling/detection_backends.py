@@ -0,0 +1,177 @@
+import gc
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from traffic_analysis.d02_ref.detection_model_artifacts import (DetectionModelArtifactManager,
+                                                               get_model_artifact_manager)
+from traffic_analysis.d04_modelling.detection_model_registry import DarknetModelRegistry, model_registry
+from traffic_analysis.d04_modelling.perform_detection_opencv import detect_objects_cv_batch, get_selected_label_mask
+
+
+class DetectionBackend(ABC):
+    """
+    All object detection backends should inherit from this interface. A backend is created once
+    per analyser and holds whatever model state it needs between calls.
+    """
+    # whether frames of several videos can be passed to detect_objects_in_frames in one call
+    supports_chunk_batching = False
+
+    def __init__(self,
+                 params: dict,
+                 paths: dict,
+                 blob_credentials: dict,
+                 model_artifacts: DetectionModelArtifactManager):
+        """
+        Args:
+            params -- yaml with modelling parameters
+            paths -- yaml with paths
+            blob_credentials -- blob credentials
+            model_artifacts -- manager used to make the model files available locally
+        """
+        self.params = params
+        self.paths = paths
+        self.blob_credentials = blob_credentials
+        self.detection_model = params['detection_model']
+        self.selected_labels = params['selected_labels']
+
+    @abstractmethod
+    def detect_objects_in_frames(self, frames: np.ndarray) -> (list, list, list):
+        """Should return lists of bboxes (cv2 format), labels and confs, with one entry per frame
+        """
+        pass
+
+    def cleanup(self):
+        """Release the resources held by the backend
+        """
+        gc.collect()
+
+
+class OpenCVDetectionBackend(DetectionBackend):
+    """Darknet yolo models run through opencv's dnn module
+    """
+    supports_chunk_batching = True
+
+    def __init__(self,
+                 params: dict,
+                 paths: dict,
+                 blob_credentials: dict,
+                 model_artifacts: DetectionModelArtifactManager,
+                 registry: DarknetModelRegistry = model_registry):
+        super().__init__(params, paths, blob_credentials, model_artifacts)
+        self.detection_batch_size = params['detection_batch_size']
+        self.registry = registry
+        model_artifacts.prepare_model(self.detection_model)
+        self.selected_label_mask = None
+        if self.selected_labels is not None:
+            self.selected_label_mask = get_selected_label_mask(model_name=self.detection_model,
+                                                               paths=paths,
+                                                               selected_labels=self.selected_labels)
+
+    def detect_objects_in_frames(self, frames: np.ndarray) -> (list, list, list):
+        return detect_objects_cv_batch(images=frames,
+                                       params=self.params,
+                                       paths=self.paths,
+                                       selected_labels=self.selected_labels,
+                                       batch_size=self.detection_batch_size,
+                                       registry=self.registry,
+                                       selected_label_mask=self.selected_label_mask)
+
+
+class TensorflowDetectionBackend(DetectionBackend):
+    """Yolov3 converted to tensorflow. Tensorflow is only imported when this backend is created.
+    """
+
+    def __init__(self,
+                 params: dict,
+                 paths: dict,
+                 blob_credentials: dict,
+                 model_artifacts: DetectionModelArtifactManager,
+                 **kwargs):
+        super().__init__(params, paths, blob_credentials, model_artifacts)
+        import tensorflow as tf
+        from traffic_analysis.d04_modelling.perform_detection_tensorflow import initialize_tensorflow_model
+
+        # the tensorflow model is built from the darknet yolov3 files
+        model_artifacts.prepare_model('yolov3')
+
+        self.tf = tf
+        self.sess = tf.Session()
+        self.model_initializer, self.init_data, self.detection_model = initialize_tensorflow_model(
+            params=self.params,
+            paths=self.paths,
+            s3_credentials=self.blob_credentials,
+            sess=self.sess)
+        self.selected_label_mask = None
+        if self.selected_labels is not None:
+            self.selected_label_mask = get_selected_label_mask(model_name=self.detection_model,
+                                                               paths=paths,
+                                                               selected_labels=self.selected_labels)
+
+    def detect_objects_in_frames(self, frames: np.ndarray) -> (list, list, list):
+        from traffic_analysis.d04_modelling.perform_detection_tensorflow import detect_objects_tf
+
+        return detect_objects_tf(images=frames,
+                                 paths=self.paths,
+                                 detection_model=self.detection_model,
+                                 model_initializer=self.model_initializer,
+                                 init_data=self.init_data,
+                                 sess=self.sess,
+                                 selected_labels=self.selected_labels,
+                                 selected_label_mask=self.selected_label_mask)
+
+    def cleanup(self):
+        self.sess.close()
+        self.tf.reset_default_graph()
+        super().cleanup()
+
+
+# maps the detection_model parameter to the backend which runs it
+detection_backends = {'yolov3': OpenCVDetectionBackend,
+                      'yolov3-tiny': OpenCVDetectionBackend,
+                      'yolov3_tf': TensorflowDetectionBackend}
+
+
+def register_detection_backend(detection_model: str, backend_class: type):
+    """Make a new detection backend selectable through the detection_model parameter
+
+    Args:
+        detection_model: value of the detection_model parameter selecting this backend
+        backend_class: subclass of DetectionBackend
+    """
+    assert issubclass(backend_class, DetectionBackend)
+    detection_backends[detection_model] = backend_class
+
+
+def create_detection_backend(params: dict,
+                             paths: dict,
+                             blob_credentials: dict,
+                             model_artifacts: DetectionModelArtifactManager = None,
+                             **backend_kwargs) -> DetectionBackend:
+    """Create the detection backend selected by the detection_model parameter
+
+    Args:
+        params: dictionary of parameters from yml file
+        paths: dictionary of paths from yml file
+        blob_credentials: blob credentials
+        model_artifacts: manager used to make the model files available locally, by default the one
+                         shared by the process
+        backend_kwargs: passed on to the backend, e.g. the registry for the opencv backend
+    Returns:
+        backend: initialized detection backend
+    Raises:
+        ValueError: if no backend is registered for the detection model
+    """
+    detection_model = params['detection_model']
+    if detection_model not in detection_backends:
+        raise ValueError(f"No detection backend for detection_model {detection_model}. "
+                         f"Available models are: {', '.join(detection_backends.keys())}")
+
+    if model_artifacts is None:
+        model_artifacts = get_model_artifact_manager(paths=paths, blob_credentials=blob_credentials)
+
+    return detection_backends[detection_model](params=params,
+                                               paths=paths,
+                                               blob_credentials=blob_credentials,
+                                               model_artifacts=model_artifacts,
+                                               **backend_kwargs)
@@ -0,0 +1,111 @@
+import os
+import time
+
+import cv2
+import pandas as pd
+
+
+class DarknetModelRegistry:
+    """
+    Process-wide cache of darknet detection models loaded into OpenCV. Each
+    (model_name, cfg, weights) combination is read from disk once, and the loaded
+    network is kept together with the names of its output layers so that
+    subsequent detection calls only pay for the forward pass. Load and inference
+    times are recorded per model so that the two costs can be reported separately.
+    """
+
+    def __init__(self):
+        self.models = {}
+        self.timings = {}
+
+    @staticmethod
+    def get_model_key(model_name: str, paths: dict) -> (str, str, str):
+        """Get the key under which a model is stored in the registry
+
+        Args:
+            model_name: name of the model to use
+            paths: dictionary of paths from yml file
+        Returns:
+            model_key: tuple of model name, config file path and weights file path
+        """
+        config_file_path = os.path.join(
+            paths['local_detection_model'], model_name, model_name + '.cfg')
+        weights_file_path = os.path.join(
+            paths['local_detection_model'], model_name, model_name + '.weights')
+
+        return model_name, config_file_path, weights_file_path
+
+    def get_model(self, model_name: str, paths: dict) -> (cv2.dnn_Net, list):
+        """Return the loaded network for model_name, reading it from disk if this is
+        the first time it is requested in this process
+
+        Args:
+            model_name: name of the model to use
+            paths: dictionary of paths from yml file
+        Returns:
+            net: darknet network loaded into opencv
+            names_of_output_layers (list(str)): names of the output layers of the network
+        """
+        model_key = self.get_model_key(model_name=model_name, paths=paths)
+
+        if model_key not in self.models:
+            start_time = time.time()
+            _, config_file_path, weights_file_path = model_key
+            net = cv2.dnn.readNetFromDarknet(config_file_path, weights_file_path)
+            names_of_output_layers = list(net.getUnconnectedOutLayersNames())
+
+            self.models[model_key] = (net, names_of_output_layers)
+            self.record_timing(model_key=model_key,
+                               stat='load',
+                               elapsed_time=time.time() - start_time)
+
+        return self.models[model_key]
+
+    def record_timing(self, model_key: tuple, stat: str, elapsed_time: float):
+        """Add elapsed_time to the running total for one of the timing stats of a model
+
+        Args:
+            model_key: key returned by get_model_key
+            stat: either "load" or "inference"
+            elapsed_time: time taken in seconds
+        """
+        timings = self.timings.setdefault(model_key, {'load_time': 0.,
+                                                      'n_loads': 0,
+                                                      'inference_time': 0.,
+                                                      'n_inferences': 0})
+        timings[stat + '_time'] += elapsed_time
+        timings['n_' + stat + 's'] += 1
+
+    def evict(self, model_name: str = None):
+        """Remove loaded networks from the registry so that their memory can be freed.
+        Timing stats are kept.
+
+        Args:
+            model_name: if specified, only evict networks for this model, else evict all
+        """
+        for model_key in list(self.models.keys()):
+            if model_name is None or model_key[0] == model_name:
+                del self.models[model_key]
+
+    def report_timings(self) -> pd.DataFrame:
+        """Report the time spent loading each model versus the time spent passing
+        images through it
+
+        Returns:
+            timings_df: one row per model with total and mean load/inference times
+        """
+        column_names = ['model_name', 'n_loads', 'load_time',
+                        'n_inferences', 'inference_time', 'mean_inference_time']
+        rows = []
+        for (model_name, _, _), timings in self.timings.items():
+            mean_inference_time = (timings['inference_time'] / timings['n_inferences']
+                                   if timings['n_inferences'] else 0.)
+            rows.append([model_name, timings['n_loads'], timings['load_time'],
+                         timings['n_inferences'], timings['inference_time'],
+                         mean_inference_time])
+
+        return pd.DataFrame(rows, columns=column_names)
+
+
+# registry shared by all detection calls in this process
+model_registry = DarknetModelRegistry()
@@ -0,0 +1,98 @@
+import queue
+import threading
+
+from traffic_analysis.d00_utils.data_retrieval import read_video_frames
+
+# queued by the worker after the last detections, which can come before the end of frame_inds if the
+# video has fewer frames than its header says
+end_of_detections = object()
+
+
+class DetectionWorker:
+    """
+    Runs object detection on the detection frames of one video in a background thread, so that
+    detection of the upcoming frames overlaps with tracking of the earlier ones. The results are
+    passed to the tracker in frame order through a bounded queue: the worker stops decoding and
+    detecting once it is queue_size frames ahead of the tracker.
+
+    OpenCV releases the GIL while it runs the network and the trackers, so the two threads can run
+    on separate cores.
+    """
+
+    def __init__(self,
+                 detect_objects_in_frames,
+                 video,
+                 frame_inds,
+                 batch_size: int,
+                 queue_size: int):
+        """
+        Args:
+            detect_objects_in_frames -- function returning (all_bboxes, all_labels, all_confs) for a list of frames
+            video -- np array of video or StreamingVideo
+            frame_inds -- indices of the frames to run detection on, in increasing order
+            batch_size -- number of frames passed to detect_objects_in_frames at a time
+            queue_size -- maximum number of frames whose detections wait in the queue
+        """
+        self.detect_objects_in_frames = detect_objects_in_frames
+        self.video = video
+        self.frame_inds = frame_inds
+        self.batch_size = max(1, batch_size)
+        self.results = queue.Queue(maxsize=max(1, queue_size))
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        """Detect objects in batches of frames, and queue the detections of each frame
+        """
+        try:
+            batch = []
+            for _, frame in read_video_frames(self.video, self.frame_inds):
+                batch.append(frame)
+                if len(batch) == self.batch_size:
+                    self.put_detections(batch)
+                    batch = []
+                if self.stop_event.is_set():
+                    return
+            if batch:
+                self.put_detections(batch)
+        except Exception as e:
+            # raised again in the tracking thread when it gets to this point
+            self.put(e)
+        finally:
+            self.put(end_of_detections)
+
+    def put_detections(self, frames: list):
+        all_bboxes, all_labels, all_confs = self.detect_objects_in_frames(frames)
+        for detections in zip(all_bboxes, all_labels, all_confs):
+            self.put(detections)
+
+    def put(self, item):
+        # wait for space in the queue, unless the tracker has stopped reading it
+        while not self.stop_event.is_set():
+            try:
+                self.results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def __iter__(self):
+        """Yield (bboxes, labels, confs) for each detection frame which could be read, waiting for the
+        worker if needed
+        """
+        while True:
+            item = self.results.get()
+            if item is end_of_detections:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def stop(self):
+        """Stop the worker, e.g. if tracking failed before all the detections were used
+        """
+        self.stop_event.set()
+        self.thread.join()
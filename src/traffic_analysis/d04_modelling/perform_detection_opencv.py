@@ -1,23 +1,28 @@
 import os
+import time
+import functools
 
 import numpy as np
 import cv2
 
-from traffic_analysis.d02_ref.download_detection_model_from_blob import download_detection_model_from_blob
+from traffic_analysis.d04_modelling.detection_model_registry import DarknetModelRegistry, model_registry
 
 
 def detect_objects_cv(image_capture: np.ndarray,
                       params: dict,
                       paths: dict,
-                      blob_credentials: dict,
-                      selected_labels: list = None) -> (list, list, list):
-    """Unifying function that defines the detected objects in an image
+                      selected_labels: list = None,
+                      registry: DarknetModelRegistry = model_registry,
+                      selected_label_mask: np.ndarray = None) -> (list, list, list):
+    """Unifying function that defines the detected objects in an image. The model files are
+    expected to be available locally already (see DetectionModelArtifactManager).
     Args:
         image_capture: numpy array containing the captured image (width, height, rbg)
         params: dictionary of parameters from yml file
         paths: dictionary of paths from yml file
-        blob_credentials: blob credentials
         selected_labels: list of labels if supplied that returns only bboxes with these labels
+        registry: registry holding the loaded detection networks, defaults to the process-wide one
+        selected_label_mask: mask from get_selected_label_mask, computed from selected_labels if not given
 
     Returns:
         bboxes(list(list(int))): list of bottom-left coordinates, width, height of detection bboxes
@@ -25,16 +30,101 @@ def detect_objects_cv(image_capture: np.ndarray,
         confs (list(float)): list of detection scores
     """
 
-    conf_thresh = params['detection_confidence_threshold']
-    detection_iou_threshold = params['detection_iou_threshold']
     model_name = params['detection_model']
 
-    download_detection_model_from_blob(model_name=model_name,
-                                       paths=paths,
-                                       blob_credentials=blob_credentials)
     network_output = pass_image_through_nn(image_capture=image_capture,
                                            model_name=model_name,
-                                           paths=paths)
+                                           paths=paths,
+                                           registry=registry)
+    boxes, labels, confs = process_network_output(image_capture=image_capture,
+                                                  network_output=network_output,
+                                                  params=params,
+                                                  paths=paths,
+                                                  selected_labels=selected_labels,
+                                                  selected_label_mask=selected_label_mask)
+
+    return boxes, labels, confs
+
+
+def detect_objects_cv_batch(images: np.ndarray,
+                            params: dict,
+                            paths: dict,
+                            selected_labels: list = None,
+                            batch_size: int = None,
+                            registry: DarknetModelRegistry = model_registry,
+                            selected_label_mask: np.ndarray = None) -> (list, list, list):
+    """Batched version of detect_objects_cv. Images are passed through the network batch_size
+    at a time, in a single forward pass per batch, and the outputs are split back into
+    per-image detections
+    Args:
+        images: numpy array (or list) of images, each in format (height, width, rbg)
+        params: dictionary of parameters from yml file
+        paths: dictionary of paths from yml file
+        selected_labels: list of labels if supplied that returns only bboxes with these labels
+        batch_size: number of images per forward pass, defaults to detection_batch_size in params
+        registry: registry holding the loaded detection networks, defaults to the process-wide one
+        selected_label_mask: mask from get_selected_label_mask, computed from selected_labels if not given
+
+    Returns:
+        all_bboxes(list(list(list(int)))): for each image, bottom-left coordinates, width, height of detection bboxes
+        all_labels (list(list(str))): for each image, detection labels
+        all_confs (list(list(float))): for each image, detection scores
+    """
+    model_name = params['detection_model']
+    if batch_size is None:
+        batch_size = params['detection_batch_size']
+    if selected_label_mask is None and selected_labels is not None:
+        selected_label_mask = get_selected_label_mask(model_name=model_name,
+                                                      paths=paths,
+                                                      selected_labels=selected_labels)
+
+    all_bboxes = []
+    all_labels = []
+    all_confs = []
+
+    for batch_start in range(0, len(images), batch_size):
+        batch = images[batch_start:batch_start + batch_size]
+        network_outputs = pass_images_through_nn(images=batch,
+                                                 model_name=model_name,
+                                                 paths=paths,
+                                                 registry=registry)
+        for image_capture, network_output in zip(batch, network_outputs):
+            boxes, labels, confs = process_network_output(image_capture=image_capture,
+                                                          network_output=network_output,
+                                                          params=params,
+                                                          paths=paths,
+                                                          selected_label_mask=selected_label_mask)
+            all_bboxes.append(boxes)
+            all_labels.append(labels)
+            all_confs.append(confs)
+
+    return all_bboxes, all_labels, all_confs
+
+
+def process_network_output(image_capture: np.ndarray,
+                           network_output: list,
+                           params: dict,
+                           paths: dict,
+                           selected_labels: list = None,
+                           selected_label_mask: np.ndarray = None) -> (list, list, list):
+    """Turns the raw network output for one image into labelled detections
+    Args:
+        image_capture: numpy array containing the captured image (width, height, rbg)
+        network_output (list(nparray)): list of neural network outputs for this image
+        params: dictionary of parameters from yml file
+        paths: dictionary of paths from yml file
+        selected_labels: list of labels if supplied that returns only bboxes with these labels
+        selected_label_mask: mask from get_selected_label_mask, used instead of selected_labels if given
+
+    Returns:
+        bboxes(list(list(int))): list of bottom-left coordinates, width, height of detection bboxes
+        labels (list(str)): list of detection labels
+        confs (list(float)): list of detection scores
+    """
+    conf_thresh = params['detection_confidence_threshold']
+    detection_iou_threshold = params['detection_iou_threshold']
+    model_name = params['detection_model']
+
     boxes_unfiltered, label_idxs_unfiltered, confs_unfiltered = get_detected_objects(image_capture=image_capture,
                                                                                      network_output=network_output,
                                                                                      conf_thresh=conf_thresh)
@@ -43,14 +133,18 @@ def detect_objects_cv(image_capture: np.ndarray,
                                                              confs_in=confs_unfiltered,
                                                              conf_thresh=conf_thresh,
                                                              iou_thresh=detection_iou_threshold)
+    if selected_label_mask is None and selected_labels is not None:
+        selected_label_mask = get_selected_label_mask(model_name=model_name,
+                                                      paths=paths,
+                                                      selected_labels=selected_labels)
+    if selected_label_mask is not None:
+        boxes, label_idxs, confs = choose_objects_of_selected_labels(bboxes_in=boxes,
+                                                                     label_idxs_in=label_idxs,
+                                                                     confs_in=confs,
+                                                                     selected_label_mask=selected_label_mask)
     labels = label_detections(model_name=model_name,
                               paths=paths,
                               label_idxs=label_idxs)
-    if selected_labels is not None:
-        boxes, labels, confs = choose_objects_of_selected_labels(bboxes_in=boxes,
-                                                                 labels_in=labels,
-                                                                 confs_in=confs,
-                                                                 selected_labels=selected_labels)
 
     return boxes, labels, confs
 
@@ -66,12 +160,58 @@ def populate_labels(model_name: str,
         labels (list(str)): list of object labels strings
     """
 
-    model_file_path = paths['local_detection_model']
-    labels_file_path = os.path.join(model_file_path, model_name, 'coco.names')
-    f = open(labels_file_path, 'r')
-    labels = [line.strip() for line in f.readlines()]
+    return get_label_table(model_name=model_name, paths=paths).tolist()
+
 
-    return labels
+def get_label_table(model_name: str,
+                    paths: dict) -> np.ndarray:
+    """Get the array of object labels of a detection model, indexed by class index. The
+    labels file is only read the first time it is requested.
+    Args:
+        model_name: name of the model to use, yolov3_tf uses the labels of yolov3
+        paths: dictionary of paths from yml file
+
+    Returns:
+        label_table (nparray(str)): object labels
+    """
+    if model_name == 'yolov3_tf':
+        model_name = 'yolov3'
+    labels_file_path = os.path.join(paths['local_detection_model'], model_name, 'coco.names')
+
+    return load_label_table(labels_file_path)
+
+
+@functools.lru_cache(maxsize=None)
+def load_label_table(labels_file_path: str) -> np.ndarray:
+    """Read the object labels from a labels file, one label per line. Cached per path.
+    """
+    with open(labels_file_path, 'r') as f:
+        label_table = np.array([line.strip() for line in f.readlines()])
+    # shared between callers, so don't allow changes
+    label_table.setflags(write=False)
+
+    return label_table
+
+
+def get_selected_label_mask(model_name: str,
+                            paths: dict,
+                            selected_labels: list) -> np.ndarray:
+    """Get a boolean mask over the class indices of a detection model, which is True for the
+    classes in selected_labels. Compute it once (e.g. when a detection backend is created) and pass
+    it to the detection functions, rather than per frame.
+    Args:
+        model_name: name of the model to use
+        paths: dictionary of paths from yml file
+        selected_labels (list(str)): labels to keep
+
+    Returns:
+        selected_label_mask (nparray(bool)): mask indexed by class index
+    """
+    label_table = get_label_table(model_name=model_name, paths=paths)
+    selected_label_mask = np.isin(label_table, np.array(selected_labels))
+    selected_label_mask.setflags(write=False)
+
+    return selected_label_mask
 
 
 def make_bbox_around_object(image_capture: np.ndarray,
@@ -116,12 +256,14 @@ def identify_most_probable_object(grid_cell_estimate: np.ndarray) -> (int, float
 
 def pass_image_through_nn(image_capture: np.ndarray,
                           model_name: str,
-                          paths: dict) -> list:
+                          paths: dict,
+                          registry: DarknetModelRegistry = model_registry) -> list:
     """Detection model generates scores (i.e., confidence) of each object existing in image
     Args:
         image_capture: numpy array containing the captured image (width, height, rbg)
         model_name: name of the model to use
         paths: dictionary of paths from yml file
+        registry: registry holding the loaded detection networks
 
     Returns:
         output_layers (list(nparray)): list of neural network output layers and scores of predicted objects
@@ -140,66 +282,111 @@ def pass_image_through_nn(image_capture: np.ndarray,
                                                 swapRB=True,
                                                 crop=False)
 
-    # read model as deep neural network in opencv
-    config_file_path = os.path.join(
-        paths['local_detection_model'], model_name, model_name + '.cfg')
-    weights_file_path = os.path.join(
-        paths['local_detection_model'], model_name, model_name + '.weights')
-    # can use other net, see documentation
-    net = cv2.dnn.readNetFromDarknet(config_file_path, weights_file_path)
+    # get model as deep neural network in opencv, only read from disk on first use
+    net, names_of_output_layers = registry.get_model(model_name=model_name,
+                                                     paths=paths)
 
     # input image to neural network
+    start_time = time.time()
     net.setInput(pre_processed_image)
 
     # forward pass of blob through neural network
-    layer_names = net.getLayerNames()
-    ids_of_output_layers = [i[0] for i in net.getUnconnectedOutLayers()]
-    # need to offset by 1 since Python starts counting at 0
-    names_of_output_layers = [layer_names[i - 1] for i in ids_of_output_layers]
-
     network_output = net.forward(names_of_output_layers)
+    registry.record_timing(model_key=registry.get_model_key(model_name=model_name, paths=paths),
+                           stat='inference',
+                           elapsed_time=time.time() - start_time)
 
     return network_output
 
 
+def pass_images_through_nn(images: np.ndarray,
+                           model_name: str,
+                           paths: dict,
+                           registry: DarknetModelRegistry = model_registry) -> list:
+    """Passes a batch of images through the detection model as one 4-D blob
+    Args:
+        images: numpy array (or list) of images, each in format (height, width, rbg)
+        model_name: name of the model to use
+        paths: dictionary of paths from yml file
+        registry: registry holding the loaded detection networks
+
+    Returns:
+        network_outputs (list(list(nparray))): for each image, the list of neural network output layers
+    """
+    n_images = len(images)
+    pre_processed_images = cv2.dnn.blobFromImages(images=list(images),
+                                                  scalefactor=0.00392,
+                                                  size=(416, 416),
+                                                  mean=(0, 0, 0),
+                                                  swapRB=True,
+                                                  crop=False)
+
+    net, names_of_output_layers = registry.get_model(model_name=model_name,
+                                                     paths=paths)
+    start_time = time.time()
+    net.setInput(pre_processed_images)
+    batch_output = net.forward(names_of_output_layers)
+    registry.record_timing(model_key=registry.get_model_key(model_name=model_name, paths=paths),
+                           stat='inference',
+                           elapsed_time=time.time() - start_time)
+
+    # yolo layers return (n_images * n_grid_cells, n_params) for a single image
+    # and (n_images, n_grid_cells, n_params) for a batch
+    batch_output = [output_layer.reshape(n_images, -1, output_layer.shape[-1])
+                    for output_layer in batch_output]
+    network_outputs = [[output_layer[i] for output_layer in batch_output]
+                       for i in range(n_images)]
+
+    return network_outputs
+
+
 def get_detected_objects(image_capture: np.ndarray,
                          network_output: list,
-                         conf_thresh: float) -> (list, list, list):
-    """Describes the detections that score above the confidence threshold
+                         conf_thresh: float) -> (np.ndarray, np.ndarray, np.ndarray):
+    """Describes the detections that score above the confidence threshold. The grid cells of all
+    output layers are processed together as one array.
     Args:
         image_capture: numpy array containing the captured image (width, height, rbg)
         network_output (list(nparray)): list of neural network outputs and scores of predicted objects
         conf_thresh: minimum confidence required in object detection, between 0 and 1
     Returns:
-        bboxes (list(list(int))): list of width, height, and bottom-left coordinates of detection bounding boxes
-        label_idxs (list(int)): list of indices corresponding to the detection labels
-        confs (list(float)): list of scores of detections
+        bboxes (nparray): (n_detections, 4) array of bottom-left coordinates, width, and height of
+                          detection bounding boxes
+        label_idxs (nparray): indices corresponding to the detection labels
+        confs (nparray): scores of detections
     """
-    bboxes = []
-    label_idxs = []
-    confs = []
-
-    for output_layer in network_output:  # loop through outputs from the different output layers
-        for grid_cell_estimates in output_layer:  # loop through grid cells in output layer
-
-            # find most likely object in specific grid cell of image
-            object_label_idx, max_conf = identify_most_probable_object(
-                grid_cell_estimate=grid_cell_estimates)
-
-            # append object to running list of objects if prediction score is above confidence threshold
-            if max_conf > conf_thresh:
-                object_bbox = make_bbox_around_object(image_capture=image_capture,
-                                                      unscaled_bbox=grid_cell_estimates)
-                bboxes.append(object_bbox)
-                label_idxs.append(object_label_idx)
-                confs.append(float(max_conf))
+    image_capture_height, image_capture_width = image_capture.shape[:2]
+    grid_cell_estimates = np.concatenate([output_layer.reshape(-1, output_layer.shape[-1])
+                                          for output_layer in network_output], axis=0)
+
+    # find most likely object in each grid cell of image, ignoring the physical parameters
+    scores = grid_cell_estimates[:, 5:]
+    label_idxs = np.argmax(scores, axis=1)
+    confs = scores[np.arange(scores.shape[0]), label_idxs]
+
+    # keep objects whose prediction score is above confidence threshold
+    mask = confs > conf_thresh
+    unscaled_bboxes = grid_cell_estimates[mask, :4].astype(np.float64)
+    label_idxs = label_idxs[mask]
+    confs = confs[mask].astype(np.float64)
+
+    # scale to the original size of the image, truncating to whole pixels as in make_bbox_around_object
+    # (in float64, so that the truncated values are the same as for the per grid cell computation)
+    centers_x = (unscaled_bboxes[:, 0] * image_capture_width).astype(int)
+    centers_y = (unscaled_bboxes[:, 1] * image_capture_height).astype(int)
+    widths = (unscaled_bboxes[:, 2] * image_capture_width).astype(int)
+    heights = (unscaled_bboxes[:, 3] * image_capture_height).astype(int)
+    bboxes = np.stack([centers_x - widths / 2,
+                       centers_y - heights / 2,
+                       widths,
+                       heights], axis=1)
 
     return bboxes, label_idxs, confs
 
 
-def reduce_overlapping_detections(bboxes_in: list,
-                                  label_idxs_in: list,
-                                  confs_in: list,
+def reduce_overlapping_detections(bboxes_in: np.ndarray,
+                                  label_idxs_in: np.ndarray,
+                                  confs_in: np.ndarray,
                                   conf_thresh: float,
                                   iou_thresh: float) -> (list, list, list):
     """ Femoves the detections that score above the nms threshold
@@ -209,9 +396,9 @@ def reduce_overlapping_detections(bboxes_in: list,
     3) Discard predictions with iou above the iou threshold
 
     Args:
-        bboxes_in (list(list(int))): list of width, height, and bottom-left coordinates of detection bboxes
-        label_idxs_in (list(int)): list of indices corresponding to the detection labels
-        confs_in (list(float)): list of scores of detections
+        bboxes_in (nparray): (n_detections, 4) array of bottom-left coordinates, width, and height of detection bboxes
+        label_idxs_in (nparray): indices corresponding to the detection labels
+        confs_in (nparray): scores of detections
         conf_thresh: minimum confidence required in object detection, between 0 and 1
         iou_thresh: non maximum suppression (nms) threshold to select for maximum overlap allowed between bboxes
     Returns:
@@ -219,24 +406,18 @@ def reduce_overlapping_detections(bboxes_in: list,
         label_idxs_out (list(int)): list of indices corresponding to the detection labels
         confs_out (list(float)): list of detection scores
     """
-    idx_boxes_nms = cv2.dnn.NMSBoxes(bboxes=bboxes_in,
-                                     scores=confs_in,
+    idx_boxes_nms = cv2.dnn.NMSBoxes(bboxes=np.asarray(bboxes_in),
+                                     scores=np.asarray(confs_in),
                                      score_threshold=conf_thresh,
                                      nms_threshold=iou_thresh)
-
-    # initialize output lists
-    bboxes_out = []
-    label_idxs_out = []
-    confs_out = []
+    # older opencv versions return the indices as a column vector
+    idx_boxes_nms = np.array(idx_boxes_nms, dtype=int).flatten()
 
     # select "ins" of the reported indices
-    for i in idx_boxes_nms:
-        i = i[0]
-        bbox = bboxes_in[i]
-        x, y, w, h = bbox[:4]
-        bboxes_out.append([round(x), round(y), round(w), round(h)])
-        label_idxs_out.append(label_idxs_in[i])
-        confs_out.append(confs_in[i])
+    bboxes_out = [[round(x), round(y), round(w), round(h)]
+                  for x, y, w, h in np.asarray(bboxes_in)[idx_boxes_nms, :4].tolist()]
+    label_idxs_out = np.asarray(label_idxs_in)[idx_boxes_nms].tolist()
+    confs_out = np.asarray(confs_in)[idx_boxes_nms].tolist()
 
     return bboxes_out, label_idxs_out, confs_out
 
@@ -253,55 +434,32 @@ def label_detections(label_idxs: list,
     Returns:
         labels (list(str)): labels of the reported object detections
     """
+    label_table = get_label_table(model_name=model_name, paths=paths)
 
-    # import the list of labels
-    if model_name == 'yolov3_tf':
-        model_origin = 'yolov3'
-    else:
-        model_origin = model_name
-    label_list = populate_labels(model_name=model_origin,
-                                 paths=paths)
-
-    # initialize the output list
-    labels = []
-
-    # select label names according to indices selected
-    for tick in label_idxs:
-        labels.append(str(label_list[tick]))
-
-    return labels
+    return label_table[np.asarray(label_idxs, dtype=int)].tolist()
 
 
 def choose_objects_of_selected_labels(bboxes_in: list,
-                                      labels_in: list,
+                                      label_idxs_in: list,
                                       confs_in: list,
-                                      selected_labels: list) -> (list, list, list):
-    """Removes detections that correspond to labels outside of selected ones, if specified
+                                      selected_label_mask: np.ndarray) -> (list, list, list):
+    """Removes detections whose class is not selected, working on the class indices so that only
+    the remaining detections need to be converted to label strings
     Args:
         bboxes_in (list(list(int))): width, height, and bottom-left coordinates of detection bboxes
-        labels_in (list(int)): indices corresponding to the detection labels
+        label_idxs_in (list(int)): indices corresponding to the detection labels
         confs_in (list(float)): detection scores
-        selected_labels (list(str)): labels; if supplied will only returns bboxes with these labels
+        selected_label_mask (nparray(bool)): mask indexed by class index, see get_selected_label_mask
     Returns:
         bboxes_out (list(list(int))): list of width, height, and bottom-left coordinates of detection bboxes
         label_idxs_out (list(int)): indices corresponding to the detection labels
         confs_out (list(float)): detection scores
     """
+    label_idxs_in = np.asarray(label_idxs_in, dtype=int)
+    keep_idxs = np.flatnonzero(selected_label_mask[label_idxs_in])
 
-    del_idxs = []
-    if selected_labels is not None:
-        for i, detected_label in enumerate(labels_in):
-            # specify object types to ignore
-            if detected_label not in selected_labels:
-                del_idxs.append(i)
-
-        bboxes_out = bboxes_in
-        labels_out = labels_in
-        confs_out = confs_in
-        # delete items from lists in reverse to avoid index shifting issue
-        for i in sorted(del_idxs, reverse=True):
-            del bboxes_out[i]
-            del labels_out[i]
-            del confs_out[i]
-
-    return bboxes_out, labels_out, confs_out
+    bboxes_out = [bboxes_in[i] for i in keep_idxs]
+    label_idxs_out = label_idxs_in[keep_idxs].tolist()
+    confs_out = [confs_in[i] for i in keep_idxs]
+
+    return bboxes_out, label_idxs_out, confs_out
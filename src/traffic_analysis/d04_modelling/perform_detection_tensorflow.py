@@ -11,7 +11,7 @@ from traffic_analysis.d04_modelling.transfer_learning.convert_darknet_to_tensorf
     yolov3_darknet_to_tensorflow
 from traffic_analysis.d04_modelling.transfer_learning.generate_tensorflow_model import YoloV3
 from traffic_analysis.d04_modelling.perform_detection_opencv import label_detections, \
-    choose_objects_of_selected_labels
+    choose_objects_of_selected_labels, get_selected_label_mask
 
 
 def initialize_tensorflow_model(params: dict, 
@@ -83,7 +83,8 @@ def detect_objects_tf(images: np.ndarray,
                       model_initializer: list, 
                       init_data: tf.placeholder, 
                       sess: tf.Session,
-                      selected_labels=None) -> (list, list, list):
+                      selected_labels=None,
+                      selected_label_mask: np.ndarray = None) -> (list, list, list):
     """Uses a tensorflow implementation of yolo to detect objects in a frame
     Args:
         image_capture: numpy array containing the captured image (width, height, rbg)
@@ -93,6 +94,7 @@ def detect_objects_tf(images: np.ndarray,
         init_data: initialized array of size of image to be passed through
         sess: tensorflow session (pre-load with sess = tf.Session())
         selected_labels: labels to return 
+        selected_label_mask: mask from get_selected_label_mask, computed from selected_labels if not given
     Returns:
         boxes(list(list(int))): width, height, and bottom-left coordinates of detection bboxes
         labels (list(str)): detection labels
@@ -114,6 +116,11 @@ def detect_objects_tf(images: np.ndarray,
     all_labels = []
     all_confs = []
 
+    if selected_label_mask is None and selected_labels is not None:
+        selected_label_mask = get_selected_label_mask(model_name=detection_model,
+                                                      paths=paths,
+                                                      selected_labels=selected_labels)
+
     for boxes, params, con, labels in zip(boxes_unscaled, formatting_params, confs, label_idxs):
         # rescale the coordinates to the original image
         boxes = np.expand_dims(boxes, axis=0)
@@ -122,15 +129,15 @@ def detect_objects_tf(images: np.ndarray,
         boxes = reformat_boxes(boxes, params)
         con = con.tolist()
 
+        if selected_label_mask is not None:
+            boxes, labels, con = choose_objects_of_selected_labels(bboxes_in=boxes,
+                                                                   label_idxs_in=labels,
+                                                                   confs_in=con,
+                                                                   selected_label_mask=selected_label_mask)
+
         labels = label_detections(label_idxs=labels,
                                   model_name=detection_model,
                                   paths=paths)
-
-        if selected_labels is not None:
-            boxes, labels, con = choose_objects_of_selected_labels(bboxes_in=boxes,
-                                                                   labels_in=labels,
-                                                                   confs_in=con,
-                                                                   selected_labels=selected_labels)
         all_boxes.append(boxes)
         all_labels.append(labels)
         all_confs.append(confs)
@@ -0,0 +1,83 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from traffic_analysis.d00_utils.bbox_helpers import bbox_intersection_over_union_matrix
+
+
+def match_greedy(ious: np.ndarray, iou_threshold: float) -> (np.ndarray, np.ndarray):
+    """Match detections to tracked objects one to one, taking the pairs with the highest iou first
+
+    Args:
+        ious -- iou matrix in format (detections, tracked objects)
+        iou_threshold -- pairs with an iou at or below this are never matched
+    Returns:
+        detection_inds, tracked_inds -- indices of the matched pairs
+    """
+    detection_inds, tracked_inds = np.nonzero(ious > iou_threshold)
+    order = np.argsort(-ious[detection_inds, tracked_inds], kind='stable')
+
+    matches = {}
+    matched_tracked = set()
+    for detection_ind, tracked_ind in zip(detection_inds[order], tracked_inds[order]):
+        if detection_ind not in matches and tracked_ind not in matched_tracked:
+            matches[detection_ind] = tracked_ind
+            matched_tracked.add(tracked_ind)
+
+    detection_inds = np.array(sorted(matches), dtype=int)
+    tracked_inds = np.array([matches[detection_ind] for detection_ind in detection_inds], dtype=int)
+    return detection_inds, tracked_inds
+
+
+def match_hungarian(ious: np.ndarray, iou_threshold: float) -> (np.ndarray, np.ndarray):
+    """Match detections to tracked objects one to one, maximising the total iou of the matched pairs
+
+    Args:
+        ious -- iou matrix in format (detections, tracked objects)
+        iou_threshold -- pairs with an iou at or below this are never matched
+    Returns:
+        detection_inds, tracked_inds -- indices of the matched pairs
+    """
+    detection_inds, tracked_inds = linear_sum_assignment(-ious)
+    is_match = ious[detection_inds, tracked_inds] > iou_threshold
+    return detection_inds[is_match], tracked_inds[is_match]
+
+
+# maps the association_method parameter to the matching function
+matching_methods = {'greedy': match_greedy,
+                    'hungarian': match_hungarian}
+
+
+def associate_detections(bboxes_detected,
+                         bboxes_tracked,
+                         iou_threshold: float,
+                         method: str = 'greedy') -> (list, np.ndarray, np.ndarray):
+    """Associate the objects detected in a frame with the objects currently tracked, using the iou
+    matrix of the two sets of boxes
+
+    Args:
+        bboxes_detected -- bboxes which are newly detected, in format (xmin,ymin,w,h)
+        bboxes_tracked -- bboxes which are currently tracked, in format (xmin,ymin,w,h)
+        iou_threshold -- a detected bbox with iou below the iou_threshold (as compared to all existing,
+                         tracked bboxes) will be considered new
+        method -- how detections are matched one to one to tracked objects, "greedy" or "hungarian"
+    Returns:
+        new_bboxes_inds -- indices of the detections which don't overlap any tracked object
+        matched_detection_inds -- indices of the detections matched to a tracked object
+        matched_tracked_inds -- indices of the tracked objects which were re-confirmed by these detections
+    """
+    if method not in matching_methods:
+        raise ValueError(f"Unknown association method {method}. "
+                         f"Available methods are: {', '.join(matching_methods.keys())}")
+
+    ious = bbox_intersection_over_union_matrix(bboxes_detected, bboxes_tracked, bbox_format="cv2")
+
+    # a detection overlapping any tracked box is an object which is already tracked, even if it is not
+    # the best match of that box (e.g. a duplicate detection)
+    is_new_bbox = ~(ious > iou_threshold).any(axis=1)
+    new_bboxes_inds = np.flatnonzero(is_new_bbox).tolist()
+
+    if ious.size == 0:
+        return new_bboxes_inds, np.array([], dtype=int), np.array([], dtype=int)
+
+    matched_detection_inds, matched_tracked_inds = matching_methods[method](ious, iou_threshold)
+    return new_bboxes_inds, matched_detection_inds, matched_tracked_inds
@@ -1,29 +1,34 @@
 import time
-import gc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
-import cv2
 import numpy as np
 import pandas as pd
-import tensorflow as tf
-
-from traffic_analysis.d00_utils.bbox_helpers import (bboxcv2_to_bboxcvlib,
-                                                     bboxcvlib_to_bboxcv2,
-                                                     display_bboxes_on_frame,
-                                                     color_bboxes,
-                                                     bbox_intersection_over_union)
-from traffic_analysis.d00_utils.video_helpers import write_mp4
+
+from traffic_analysis.d00_utils.bbox_helpers import display_bboxes_on_frame, color_bboxes
+from traffic_analysis.d00_utils.video_helpers import Mp4Writer
+from traffic_analysis.d00_utils.data_retrieval import read_video_frames, get_video_frames, StreamingVideo
+from traffic_analysis.d00_utils.stage_timer import StageTimer
 from traffic_analysis.d04_modelling.traffic_analyser_interface import TrafficAnalyserInterface
-from traffic_analysis.d04_modelling.tracking.vehicle_fleet import VehicleFleet
-from traffic_analysis.d04_modelling.perform_detection_opencv import detect_objects_cv
-from traffic_analysis.d04_modelling.perform_detection_tensorflow import detect_objects_tf
-from traffic_analysis.d04_modelling.perform_detection_tensorflow import initialize_tensorflow_model
+from traffic_analysis.d04_modelling.tracking.association import associate_detections
+from traffic_analysis.d04_modelling.tracking.tracking_backends import create_tracking_backend
+from traffic_analysis.d04_modelling.tracking.vehicle_fleet import (VehicleFleet,
+                                                                  construct_fleets_from_frame_level_df)
+from traffic_analysis.d04_modelling.detection_model_registry import DarknetModelRegistry, model_registry
+from traffic_analysis.d04_modelling.detection_backends import create_detection_backend
+from traffic_analysis.d04_modelling.detection_worker import DetectionWorker
 
 
 class TrackingAnalyser(TrafficAnalyserInterface):
-    def __init__(self, params: dict, paths: dict, blob_credentials: dict):
+    def __init__(self,
+                 params: dict,
+                 paths: dict,
+                 blob_credentials: dict,
+                 registry: DarknetModelRegistry = model_registry):
         """
         (General parameters):
         selected_labels -- labels which we wish to detect
+        registry -- registry of loaded opencv detection networks, shared by all analysers in the process
 
         Model-specific parameters initialized below:
 
@@ -33,10 +38,19 @@ class TrackingAnalyser(TrafficAnalyserInterface):
         detection_frequency -- each detection_frequency num of frames, run obj detection alg again to detect new objs
         detection_confidence_threshold -- conf above which to return label
         detection_nms_threshold -- yolo param
+        detection_batch_size -- number of frames passed through the opencv detector in one forward pass
+        pipelined_detection -- if true, detection runs in a background thread ahead of the tracker instead of
+                               on all the detection frames of a video (or chunk) before tracking
+        detection_queue_size -- number of frames the background detection can get ahead of the tracker
 
         (Object tracking parameters)
-        tracking_model -- specify name of model you want to use for tracking (currently only supports OpenCV trackers)
+        tracking_backend -- "opencv" to track each object with an opencv tracker of type opencv_tracker_type,
+                            "sort" to track objects from their detected boxes with a kalman filter
+        opencv_tracker_type -- type of the opencv trackers
+        sort_max_missed_detections -- detection frames in a row on which an object tracked by the sort
+                                      backend can be missed before it is considered gone
         iou_threshold -- specify threshold to use to decide whether two detected objs should be considered the same
+        association_method -- how detections are matched to tracked objects, "greedy" or "hungarian"
 
 
         (Stop start arguments:)
@@ -44,6 +58,12 @@ class TrackingAnalyser(TrafficAnalyserInterface):
                                   series for each vehicle)
         smoothing_method -- method to smooth the IOU time series for each vehicle
         stop_start_iou_threshold -- threshold to binarize the IOU time series into 0 or 1,denoting "moving" or "stopped"
+
+        (Parallelism arguments:)
+        n_workers -- number of worker processes analysing the videos of a chunk in parallel, 1 to analyse them
+                     in this process
+        background_video_writer -- if true, the videos made by detect_and_track_objects are encoded in a background
+                                   thread
         """
         super().__init__(params, paths)
         # general settings
@@ -59,19 +79,23 @@ class TrackingAnalyser(TrafficAnalyserInterface):
         self.detection_frequency = params['detection_frequency']
         self.detection_confidence_threshold = params['detection_confidence_threshold']
         self.detection_nms_threshold = params['detection_nms_threshold']
-
-        if self.detection_model == 'yolov3_tf':
-            self.sess = tf.Session()
-            self.model_initializer, self.init_data, self.detection_model = initialize_tensorflow_model(
-                params=self.params,
-                paths=self.paths,
-                s3_credentials=self.blob_credentials,
-                sess=self.sess)
+        self.detection_batch_size = params['detection_batch_size']
+        self.pipelined_detection = params['pipelined_detection']
+        self.detection_queue_size = params['detection_queue_size']
+        self.registry = registry
+
+        # the backend makes sure its model files are available locally, and only imports
+        # heavy dependencies (e.g. tensorflow) if it is the one selected
+        self.detector = create_detection_backend(params=params,
+                                                 paths=paths,
+                                                 blob_credentials=blob_credentials,
+                                                 registry=registry)
 
         # tracking settings
         self.tracker_type = params['opencv_tracker_type']
-        self.trackers = []
+        self.tracking_backend = create_tracking_backend(params=params)
         self.iou_threshold = params['iou_threshold']
+        self.association_method = params['association_method']
 
         # post-processing for stop-starts settings
         self.iou_convolution_window = params['iou_convolution_window']
@@ -80,182 +104,200 @@ class TrackingAnalyser(TrafficAnalyserInterface):
 
         # speedup settings
         self.skip_no_of_frames = params['skip_no_of_frames']
+        self.background_video_writer = params['background_video_writer']
+        self.n_workers = params['n_workers']
+        self.worker_pool = None
 
-    def add_tracker(self):
-        tracker = self.create_tracker_by_name(
-            tracker_type=self.tracker_type)
-        if tracker:
-            self.trackers.append(tracker)
-        return tracker
-
-    def create_tracker_by_name(self, tracker_type: str):
-        """Create tracker based on tracker name"""
-        tracker_types = {'boosting': cv2.TrackerBoosting_create(),
-                         'mil': cv2.TrackerMIL_create(),
-                         'kcf': cv2.TrackerKCF_create(),
-                         'tld': cv2.TrackerTLD_create(),
-                         'medianflow': cv2.TrackerMedianFlow_create(),
-                         'goturn': cv2.TrackerGOTURN_create(),
-                         'mosse': cv2.TrackerMOSSE_create(),
-                         'csrt': cv2.TrackerCSRT_create()}
-        try:
-            return tracker_types[tracker_type]
-        except Exception as e:
-            print('Incorrect tracker name')
-            print('Available trackers are:')
-            print("\n".join(tracker_types.keys()))
-            return None
+        # time spent per video in each stage of the analysis (for videos analysed in this process)
+        self.stage_timer = StageTimer(stages=['detection', 'tracker_update', 'fleet_update', 'reporting'])
 
-    def determine_new_bboxes(self, bboxes_tracked: list, bboxes_detected: list) -> list:
-        """Return the indices of "new" bboxes in bboxes_detected so that a new tracker can be added for that
+    def associate_detections(self, bboxes_tracked: list, bboxes_detected: list) -> (list, np.ndarray, np.ndarray):
+        """Associate newly detected bboxes with the currently tracked bboxes, to find the "new" bboxes in
+        bboxes_detected (so that a new tracker can be added for them) and the tracked vehicles which were
+        detected again
 
         Args:
             bboxes_tracked: bboxes which are currently tracked. bboxes should be passed in in format (xmin,ymin,w,h)
             bboxes_detected: bboxes which are newly detected. bboxes should be passed in in format (xmin,ymin,w,h)
-            iou_threshold: a detected bbox with iou below the iou_threshold (as compared to all existing, tracked bboxes)
-                           will be considered new.
         Returns:
             new_bbox_inds: indices of newly detected bounding boxes
+            matched_detection_inds: indices of detected bboxes matched to a tracked bbox
+            matched_tracked_inds: indices of the tracked bboxes they are matched to
         """
+        return associate_detections(bboxes_detected=bboxes_detected,
+                                    bboxes_tracked=bboxes_tracked,
+                                    iou_threshold=self.iou_threshold,
+                                    method=self.association_method)
 
-        new_bboxes_inds = set(range(len(bboxes_detected))
-                              )  # init with all inds
-        old_bboxes_inds = set()
-        for i, box_a in enumerate(bboxes_detected):
-            # if find a box which has high IOU with an already-tracked box, consider it an old box
-            for box_b in bboxes_tracked:
-                # format conversion needed
-                iou = bbox_intersection_over_union(
-                    bboxcv2_to_bboxcvlib(box_a), bboxcv2_to_bboxcvlib(box_b))
-                if iou > self.iou_threshold:  # assume bbox has already been tracked and is not new
-                    old_bboxes_inds.add(i)  # add to set
-
-        new_bboxes_inds = list(new_bboxes_inds.difference(old_bboxes_inds))
-        return new_bboxes_inds
-
-    def add_to_multi_tracker(self,
-                             multi_tracker: cv2.MultiTracker,
-                             frame: np.ndarray,
-                             frame_height: int,
-                             frame_width: int,
-                             bbox):
-        """Add bbox to the multitracker as a new tracker
+    def get_detection_frame_inds(self, n_frames: int) -> np.ndarray:
+        """Get the indices of the frames of a video on which object detection is run
+
+        Args:
+            n_frames -- number of frames in the video
+        Returns:
+            frame_detection_inds -- sorted frame indices, always starting with frame 0
         """
-        try:
-            multi_tracker.add(newTracker=self.add_tracker(),
-                              image=frame,
-                              boundingBox=tuple(bbox))
-        except Exception as e:
-            # convert bbox
-            if self.verbose:
-                print(e)
-                print(f"bbox is {bbox}")
-                print("Retrying with bbox formatting corrections...")
-
-            if (bbox[0] <= bbox[2]) and (bbox[1] <= bbox[3]):
-                # format: (xmin, ymin, width, height)
-                bbox = bboxcvlib_to_bboxcv2(bbox)
-
-            for i in range(4):
-                # correct neg coords
-                if bbox[i] < 0:
-                    bbox[i] = 0
-
-                # check ind coords don't go outside frame
-                if i % 2 == 0: # xmin and width
-                    if bbox[i] > frame_width:
-                        bbox[i] = frame_width
-                else: # ymin and height
-                    if bbox[i] > frame_height:
-                        bbox[i] = frame_height
-
-            # check sum of coords don't go outside frame
-            if bbox[0] + bbox[2] > frame_width:
-                bbox[2] = frame_width - bbox[0]
-
-            if bbox[1] + bbox[3] > frame_height:
-                bbox[3] = frame_height - bbox[1]
-
-            try:
-                multi_tracker.add(newTracker=self.add_tracker(),
-                                  image=frame,
-                                  boundingBox=tuple(bbox))
-            except:
-                raise
+        # TODO: Distangle the two parameters for length of tracking without detect and skip frames
+        frame_interval = self.skip_no_of_frames + 1
+        return np.arange(0, n_frames, max(1, self.skip_no_of_frames * frame_interval))
+
+    def get_processed_frame_inds(self, n_frames: int) -> np.ndarray:
+        """Get the indices of the frames of a video which are passed to the tracker, i.e. every
+        frame_interval-th frame and the frames at the end of the video
+
+        Args:
+            n_frames -- number of frames in the video
+        Returns:
+            processed_frame_inds -- sorted frame indices, always starting with frame 0
+        """
+        frame_interval = self.skip_no_of_frames + 1
+        frame_inds = np.arange(n_frames)
+        is_processed = (frame_inds % frame_interval == 0) | (frame_inds + frame_interval > n_frames)
+        return frame_inds[is_processed]
 
     def detect_and_track_objects(self,
-                                 video: np.ndarray,
+                                 video,
                                  video_name: str,
                                  video_time_length=10,
                                  make_video=False,
-                                 local_mp4_dir: str = None) -> VehicleFleet:
+                                 local_mp4_dir: str = None,
+                                 detections: tuple = None) -> VehicleFleet:
         """Code to track
-        This function will initialize a specified tracking algorithm
-        (currently only supports OpenCV's built in multitracker methods) with the specified object
-        detection algorithm. Each detection_frequency frames, the object detection will be run again
+        This function will initialize the tracking backend selected by the tracking_backend parameter
+        with the specified object detection algorithm. Each detection_frequency frames, the object detection will be run again
         to detect any new objects which have entered the frame. A VehicleFleet object is used to track the
         initial detection confidence and label for each vehicle as it is detected, and the updated locations
         of the bounding boxes for each vehicle each frame. The VehicleFleet object also performs IOU computations
         on the stored bounding box information to get counts and stop starts.
 
         Args:
-            video -- np array in format (frame_count,frame_height,frame_width,3)
+            video -- np array in format (frame_count,frame_height,frame_width,3), or StreamingVideo
+                     from which only the frames needed are decoded
             video_name -- name of video to run on (include .mp4 extension)
             video_time_length -- specify length of video
             make_video -- if true, will write video to local_mp4_dir with name local_mp4_name_tracked.mp4
             local_mp4_dir -- path to directory to store video in
+            detections -- (all_bboxes, all_labels, all_confs) for the frames given by get_detection_frame_inds,
+                          if already computed. If None, detection is run here, in a background thread
+                          ahead of the tracker if pipelined_detection is set.
         Returns:
             fleet -- VehicleFleet object containing bbox history for all vehicles tracked
         """
 
         start_time = time.time()
+        timer = self.stage_timer
         # Create a video capture object to read videos
         n_frames, frame_height, frame_width = video.shape[:3]
 
         # assumes vid_length in seconds
         video_frames_per_sec = int(n_frames / video_time_length)
 
-        # TODO: Distangle the two parameters for length of tracking without detect and skip frames
         frame_interval = self.skip_no_of_frames + 1
-        frame_detection_inds = np.arange(0, n_frames,
-                                         max(1, self.skip_no_of_frames * frame_interval))
-        frames = video[frame_detection_inds, :, :, :]
+        frame_detection_inds = self.get_detection_frame_inds(n_frames)
+
+        detection_worker = None
+        if detections is None and self.pipelined_detection:
+            # detection runs ahead of the tracker in a background thread
+            detection_worker = DetectionWorker(detect_objects_in_frames=self.detect_objects_in_frames,
+                                               video=video,
+                                               frame_inds=frame_detection_inds,
+                                               batch_size=self.detection_batch_size,
+                                               queue_size=self.detection_queue_size).start()
+            detection_results = iter(detection_worker)
+        else:
+            if detections is None:
+                with timer.time_stage(video_name, 'detection'):
+                    frames = get_video_frames(video, frame_detection_inds)
+                    detections = self.detect_objects_in_frames(frames)
+            detection_results = zip(*detections)
+
+        # the detections are used in frame order. Frames beyond the detections passed in use the last ones.
+        is_detection_frame = np.zeros(n_frames, dtype=bool)
+        is_detection_frame[frame_detection_inds] = True
+        # annotated frames are encoded as they are produced rather than kept until the end
+        video_writer = None
+        if make_video:
+            video_writer = Mp4Writer(local_mp4_dir=local_mp4_dir,
+                                     mp4_name=video_name + "_tracked.mp4",
+                                     fps=video_frames_per_sec,
+                                     background=self.background_video_writer)
+        try:
+            fleet = self.track_objects(video=video,
+                                       video_name=video_name,
+                                       detection_results=detection_results,
+                                       is_detection_frame=is_detection_frame,
+                                       video_writer=video_writer)
+        finally:
+            if detection_worker is not None:
+                detection_worker.stop()
+            if video_writer is not None:
+                video_writer.close()
+
+        timer.record_timing(video_name, 'total', time.time() - start_time)
+        print(
+            f'Run time of tracking analyser for one video is {time.time() - start_time} seconds. \nSkipped {frame_interval-1} frames.\nNumber of frames is {fleet.bboxes.shape[2]}.')
+        print('Run time of tracking analyser for one video is %s seconds' %
+              (time.time() - start_time))
+
+        return fleet
+
+    def track_objects(self,
+                      video,
+                      video_name: str,
+                      detection_results,
+                      is_detection_frame: np.ndarray,
+                      video_writer: Mp4Writer = None) -> VehicleFleet:
+        """Track the detected objects through the processed frames of a video
+
+        Args:
+            video -- np array in format (frame_count,frame_height,frame_width,3), or StreamingVideo
+            video_name -- name of video to run on (include .mp4 extension)
+            detection_results -- iterator of (bboxes, labels, confs) for the detection frames, in frame order
+            is_detection_frame -- for each frame of the video, whether detection was run on it
+            video_writer -- if given, the processed frames are annotated and written to it
+        Returns:
+            fleet -- VehicleFleet object containing bbox history for all vehicles tracked
+        """
+        make_video = video_writer is not None
+        timer = self.stage_timer
+        n_frames, frame_height, frame_width = video.shape[:3]
 
-        all_bboxes, all_labels, all_confs = self.detect_objects_in_frames(frames)
-        bboxes = all_bboxes[0]
-        labels = all_labels[0]
-        confs = all_confs[0]
+        with timer.time_stage(video_name, 'detection'):
+            # no detections if not even the first frame could be read
+            detection = next(detection_results, ([], [], []))
+        bboxes, labels, confs = detection
 
         # store info returned above in vehicleFleet object
         fleet = VehicleFleet(bboxes=np.array(bboxes),
                              labels=np.array(labels),
                              confs=np.array(confs),
-                             video_name=video_name.replace(".mp4", ""))
-
-        # Create MultiTracker object using bboxes, initialize multitracker
-        multi_tracker = cv2.MultiTracker_create()
-        for bbox in bboxes:
-            self.add_to_multi_tracker(multi_tracker=multi_tracker,
-                                      frame=video[0, :, :, :],
-                                      frame_height=frame_height,
-                                      frame_width=frame_width,
-                                      bbox=bbox)
-
-        if make_video:
-            processed_video = []
+                             video_name=video_name.replace(".mp4", ""),
+                             n_frames=n_frames)
+
+        # frames are read one at a time, and only those the tracker is updated on. Backends tracking
+        # boxes only don't need them at all.
+        processed_frame_inds = self.get_processed_frame_inds(n_frames)
+        if self.tracking_backend.requires_frames or make_video:
+            video_frames = read_video_frames(video, processed_frame_inds)
+        else:
+            video_frames = ((frame_ind, None) for frame_ind in processed_frame_inds)
+        _, first_frame = next(video_frames)
+
+        tracker = self.tracking_backend
+        with timer.time_stage(video_name, 'tracker_update'):
+            tracker.start_video(frame_height=frame_height, frame_width=frame_width)
+            tracker.add_objects(frame=first_frame, bboxes=bboxes)
 
         print(f"The number of frames is {n_frames}")
         previous_frame_index = 0
         # Process video and track objects
-        for frame_ind in range(1, n_frames):
-            if (frame_ind % frame_interval) and (frame_ind + frame_interval) <= n_frames:
-                continue
-            frame = video[frame_ind, :, :, :]
+        for frame_ind, frame in video_frames:
             # get updated location of objects in subsequent frames, update fleet obj
-            success, bboxes_tracked = multi_tracker.update(
-                image=frame)
-            for _ in range(frame_ind - previous_frame_index):
-                fleet.update_vehicles(np.array(bboxes_tracked))
+            with timer.time_stage(video_name, 'tracker_update'):
+                bboxes_tracked = tracker.update(frame=frame)
+            with timer.time_stage(video_name, 'fleet_update'):
+                for _ in range(frame_ind - previous_frame_index):
+                    fleet.update_vehicles(bboxes_tracked)
             previous_frame_index = frame_ind
 
             if make_video:
@@ -265,100 +307,142 @@ class TrackingAnalyser(TrafficAnalyserInterface):
                                         fleet.compute_label_confs())
 
             # every x frames, re-detect boxes
-            if frame_ind in frame_detection_inds.tolist():
-                ind = int(np.squeeze(
-                    np.where(frame_detection_inds == frame_ind)))
-                if(ind >= all_bboxes.__len__()):
-                    ind = -1
-                bboxes_detected = all_bboxes[ind]
-                labels_detected = all_labels[ind]
-                confs_detected = all_confs[ind]
-
-                # re-initialize MultiTracker
-                new_bbox_inds = self.determine_new_bboxes(bboxes_tracked,
-                                                          bboxes_detected)
-
-                # update fleet object
-                if len(new_bbox_inds) > 0:
-                    new_bboxes = [bboxes_detected[i] for i in new_bbox_inds]
-                    new_labels = [labels_detected[i] for i in new_bbox_inds]
-                    new_confs = [confs_detected[i] for i in new_bbox_inds]
-
-                    fleet.add_vehicles(np.array(new_bboxes),
-                                       np.array(new_labels),
-                                       np.array(new_confs))
-
-                    # iterate through new bboxes
-                    for new_bbox in new_bboxes:
-                        self.add_to_multi_tracker(multi_tracker=multi_tracker,
-                                                  frame=frame,
-                                                  frame_height=frame_height,
-                                                  frame_width=frame_width,
-                                                  bbox=new_bbox)
+            if is_detection_frame[frame_ind]:
+                with timer.time_stage(video_name, 'detection'):
+                    detection = next(detection_results, detection)
+                bboxes_detected, labels_detected, confs_detected = detection
+
+                with timer.time_stage(video_name, 'fleet_update'):
+                    new_bbox_inds, matched_detection_inds, matched_tracked_inds = self.associate_detections(
+                        bboxes_tracked, bboxes_detected)
+
+                    # vehicles are tracked in the same order as in the fleet. If the tracker moves the
+                    # vehicles which were detected again to their detected boxes, so does the fleet
+                    matched_bboxes = np.array(bboxes_detected).reshape(-1, 4)[matched_detection_inds]
+                    if tracker.corrects_tracked_bboxes and len(matched_tracked_inds) > 0:
+                        fleet.refresh_vehicles(matched_tracked_inds, matched_bboxes)
+
+                    # update fleet object
+                    if len(new_bbox_inds) > 0:
+                        new_bboxes = [bboxes_detected[i] for i in new_bbox_inds]
+                        new_labels = [labels_detected[i] for i in new_bbox_inds]
+                        new_confs = [confs_detected[i] for i in new_bbox_inds]
+
+                        fleet.add_vehicles(np.array(new_bboxes),
+                                           np.array(new_labels),
+                                           np.array(new_confs))
+
+                with timer.time_stage(video_name, 'tracker_update'):
+                    tracker.correct(matched_tracked_inds, matched_bboxes)
+                    if len(new_bbox_inds) > 0:
+                        tracker.add_objects(frame=frame, bboxes=new_bboxes)
 
             if make_video:
-                processed_video.append(frame)
+                video_writer.append(frame)
 
                 # code to display video frame by frame while it is being processed
                 # cv2.imshow('MultiTracker', frame)
                 # # quit on ESC button
                 # if cv2.waitKey(1) & 0xFF == 27:  # Esc pressed
                 #   break
-        if make_video:
-            write_mp4(local_mp4_dir=local_mp4_dir,
-                      mp4_name=video_name + "_tracked.mp4",
-                      video=np.array(processed_video),
-                      fps=video_frames_per_sec)
-
-        print(
-            f'Run time of tracking analyser for one video is {time.time() - start_time} seconds. \nSkipped {frame_interval-1} frames.\nNumber of frames is {fleet.bboxes.shape[2]}.')
-        print('Run time of tracking analyser for one video is %s seconds' %
-              (time.time() - start_time))
 
         return fleet
 
     def detect_objects_in_frames(self, frames):
+        return self.detector.detect_objects_in_frames(frames)
 
-        all_bboxes = []
-        all_labels = []
-        all_confs = []
-
-        if self.detection_model == 'yolov3' or self.detection_model == 'yolov3-tiny':
-            for frame in frames:
-                bboxes, labels, confs = detect_objects_cv(image_capture=frame,
-                                                          params=self.params,
-                                                          paths=self.paths,
-                                                          blob_credentials=self.blob_credentials,
-                                                          selected_labels=self.selected_labels)
-
-                all_bboxes.append(bboxes)
-                all_labels.append(labels)
-                all_confs.append(confs)
-
-        elif self.detection_model == 'yolov3_tf':
-            all_bboxes, all_labels, all_confs = detect_objects_tf(images=frames,
-                                                                  paths=self.paths,
-                                                                  detection_model=self.detection_model,
-                                                                  model_initializer=self.model_initializer,
-                                                                  init_data=self.init_data,
-                                                                  sess=self.sess,
-                                                                  selected_labels=self.selected_labels)
-
-        return all_bboxes, all_labels, all_confs
+    def detect_objects_in_videos(self, video_dict: dict) -> dict:
+        """Run detection on the detection frames of several videos. If the detection backend supports it,
+        batches of detection_batch_size frames are passed to it, which can span the end of one video and the
+        start of the next.
+
+        Args:
+            video_dict -- key is video filename, value is np array of video or StreamingVideo
+        Returns:
+            chunk_detections -- key is video filename, value is (all_bboxes, all_labels, all_confs)
+                                for the frames given by get_detection_frame_inds
+        """
+        frame_detection_inds = {video_name: self.get_detection_frame_inds(video.shape[0])
+                                for video_name, video in video_dict.items()}
+
+        if not self.detector.supports_chunk_batching:
+            chunk_detections = {}
+            for video_name, video in video_dict.items():
+                with self.stage_timer.time_stage(video_name, 'detection', add_to_total=True):
+                    chunk_detections[video_name] = self.detect_objects_in_frames(
+                        get_video_frames(video, frame_detection_inds[video_name]))
+            return chunk_detections
+
+        # frames are detected on as soon as a batch is full, so that at most detection_batch_size frames of
+        # the chunk are held in memory at a time. The frame count in the header of an mp4 can be larger
+        # than the number of frames which decode, so the results are split between the videos by the
+        # number of frames actually read from each
+        start_time = time.perf_counter()
+        all_bboxes, all_labels, all_confs = [], [], []
+        n_frames_read = dict.fromkeys(video_dict, 0)
+        batch = []
+        for video_name, video in video_dict.items():
+            for _, frame in read_video_frames(video, frame_detection_inds[video_name]):
+                batch.append(frame)
+                n_frames_read[video_name] += 1
+                if len(batch) == self.detection_batch_size:
+                    self.detect_objects_in_batch(batch, all_bboxes, all_labels, all_confs)
+                    batch = []
+        if batch:
+            self.detect_objects_in_batch(batch, all_bboxes, all_labels, all_confs)
+
+        # the time of the batched detection is shared between the videos by their number of detection frames
+        elapsed_time_per_frame = (time.perf_counter() - start_time) / max(1, len(all_bboxes))
+        for video_name, n_frames in n_frames_read.items():
+            self.stage_timer.record_timing(video_name, 'detection', elapsed_time_per_frame * n_frames,
+                                           add_to_total=True)
+
+        chunk_detections = {}
+        start = 0
+        for video_name, n_frames in n_frames_read.items():
+            end = start + n_frames
+            chunk_detections[video_name] = (all_bboxes[start:end],
+                                            all_labels[start:end],
+                                            all_confs[start:end])
+            start = end
+        return chunk_detections
+
+    def detect_objects_in_batch(self, frames: list, all_bboxes: list, all_labels: list, all_confs: list):
+        """Detect objects in a batch of frames and append the detections of each frame to the lists
+        """
+        bboxes, labels, confs = self.detect_objects_in_frames(frames)
+        all_bboxes += bboxes
+        all_labels += labels
+        all_confs += confs
+
+    def get_worker_pool(self) -> ProcessPoolExecutor:
+        """Start the worker processes on first use. The pool is kept for the lifetime of the analyser so that
+        each worker only loads its detection model once.
+        """
+        if self.worker_pool is None:
+            # spawn rather than fork, so workers don't inherit the opencv/tensorflow state of this process
+            self.worker_pool = ProcessPoolExecutor(max_workers=self.n_workers,
+                                                   mp_context=multiprocessing.get_context('spawn'),
+                                                   initializer=init_worker_analyser,
+                                                   initargs=(self.params, self.paths, self.blob_credentials))
+        return self.worker_pool
 
     def cleanup_on_finish(self):
-        if self.detection_model == 'yolov3_tf' or self.detection_model == 'traffic_tf':
-            self.sess.close()
-            tf.reset_default_graph()
-        gc.collect()
+        if self.worker_pool is not None:
+            self.worker_pool.shutdown()
+            self.worker_pool = None
+        self.detector.cleanup()
 
     def construct_frame_level_df(self, video_dict) -> pd.DataFrame:
-        """Construct frame level df for multiple videos
+        """Construct frame level df for multiple videos. The stage timer is reset first, so that afterwards
+        it reports the timings of these videos (including those analysed in worker processes).
         Args:
-            video_dict: key is video filename, key is np array of videos
+            video_dict: key is video filename, value is np array of video or StreamingVideo
         Returns:
             pd Dataframe of all frame level info
         """
+        self.stage_timer.reset()
+
         # Check that video doesn't come from in-use camera (some are)
         for video_name in list(video_dict.keys()):
             n_frames = video_dict[video_name].shape[0]
@@ -372,11 +456,44 @@ class TrackingAnalyser(TrafficAnalyserInterface):
         if not len(video_dict):
             return None
 
+        # workers open the videos from their local paths, so only streamed videos can be sent to them
+        if self.n_workers > 1 and all(isinstance(video, StreamingVideo) for video in video_dict.values()):
+            return self.construct_frame_level_df_parallel(video_dict)
+
+        # run detection for the whole chunk at once so that the opencv detector can fill its batches,
+        # unless detection is pipelined with tracking in each video
+        if self.pipelined_detection:
+            chunk_detections = dict.fromkeys(video_dict.keys())
+        else:
+            chunk_detections = self.detect_objects_in_videos(video_dict)
+
         for video_name, video in video_dict.items():
-            fleet = self.detect_and_track_objects(video, video_name)
-            single_frame_level_df = fleet.report_frame_level_info()
+            fleet = self.detect_and_track_objects(video, video_name,
+                                                  detections=chunk_detections[video_name])
+            with self.stage_timer.time_stage(video_name, 'reporting', add_to_total=True):
+                single_frame_level_df = fleet.report_frame_level_info()
             frame_info_list.append(single_frame_level_df)
-        return pd.concat(frame_info_list)
+        # labels of different videos are combined into one set of categories
+        return pd.concat(frame_info_list).astype({'vehicle_type': 'category'})
+
+    def construct_frame_level_df_parallel(self, video_dict: dict) -> pd.DataFrame:
+        """Construct frame level df for multiple videos, analysing each video in one of the worker processes
+
+        Args:
+            video_dict: key is video filename, value is StreamingVideo
+        Returns:
+            pd Dataframe of all frame level info
+        """
+        worker_pool = self.get_worker_pool()
+        futures = [worker_pool.submit(construct_video_frame_level_df, video_name, video.local_mp4_path)
+                   for video_name, video in video_dict.items()]
+
+        frame_info_list = []
+        for video_name, future in zip(video_dict, futures):
+            frame_level_df, timings = future.result()
+            self.stage_timer.add_timings(video_name, timings)
+            frame_info_list.append(frame_level_df)
+        return pd.concat(frame_info_list).astype({'vehicle_type': 'category'})
 
     def construct_video_level_df(self, frame_level_df) -> pd.DataFrame:
         """Construct video-level stats table using tracking techniques
@@ -390,9 +507,8 @@ class TrackingAnalyser(TrafficAnalyserInterface):
             return frame_level_df
 
         video_info_list = []
-        for _, single_frame_level_df in frame_level_df.groupby(['camera_id', 'video_upload_datetime']):
-            fleet = VehicleFleet(
-                frame_level_df=single_frame_level_df, load_from_pd=True)
+        # rebuild the fleets of all videos in one pass over the table
+        for fleet in construct_fleets_from_frame_level_df(frame_level_df):
             # compute the convolved IOU time series for each vehicle and smooth
             fleet.compute_iou_time_series(interval=self.iou_convolution_window)
             fleet.smooth_iou_time_series(
@@ -403,3 +519,34 @@ class TrackingAnalyser(TrafficAnalyserInterface):
                                                             *fleet.compute_stop_starts(self.stop_start_iou_threshold))
             video_info_list.append(video_level_df)
         return pd.concat(video_info_list)
+
+
+# analyser of a worker process, created once by the pool initializer
+worker_analyser = None
+
+
+def init_worker_analyser(params: dict, paths: dict, blob_credentials: dict):
+    """Create the analyser used by a worker process, which loads its own detection model
+    """
+    global worker_analyser
+    worker_analyser = TrackingAnalyser(params={**params, 'n_workers': 1},
+                                       paths=paths,
+                                       blob_credentials=blob_credentials)
+
+
+def construct_video_frame_level_df(video_name: str, local_mp4_path: str) -> pd.DataFrame:
+    """Run detection and tracking on one video in a worker process
+
+    Args:
+        video_name: name of the video (include .mp4 extension)
+        local_mp4_path: path of the video, which is read by the worker itself
+    Returns:
+        frame_level_df: frame level df of the video
+        timings: time in seconds spent in each stage of the analysis of the video, for the stage timer of
+                 the analyser which sent the video
+    """
+    fleet = worker_analyser.detect_and_track_objects(StreamingVideo(local_mp4_path), video_name)
+    with worker_analyser.stage_timer.time_stage(video_name, 'reporting', add_to_total=True):
+        frame_level_df = fleet.report_frame_level_info()
+    # the worker only keeps timings until they are sent back
+    return frame_level_df, worker_analyser.stage_timer.timings.pop(video_name)
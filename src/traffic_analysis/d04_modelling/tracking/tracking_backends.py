@@ -0,0 +1,276 @@
+from abc import ABC, abstractmethod
+
+import cv2
+import numpy as np
+
+from traffic_analysis.d00_utils.bbox_helpers import bboxcvlib_to_bboxcv2
+
+
+class TrackingBackend(ABC):
+    """
+    All object tracking backends should inherit from this interface. A backend is created once per
+    analyser and tracks the objects of one video at a time. Tracked objects keep the order in which
+    they were added, which is the order of the vehicles in the VehicleFleet.
+    """
+    # whether update needs the video frames. If not, the analyser doesn't decode the frames in
+    # between detections
+    requires_frames = True
+    # whether correct moves the tracked boxes to the detected ones. If so, the boxes of the vehicles
+    # detected again are also refreshed in the VehicleFleet, otherwise the fleet keeps the tracked boxes
+    corrects_tracked_bboxes = False
+
+    def __init__(self, params: dict):
+        """
+        Args:
+            params -- yaml with modelling parameters
+        """
+        self.params = params
+        self.frame_height = None
+        self.frame_width = None
+
+    def start_video(self, frame_height: int, frame_width: int):
+        """Forget the objects of the previous video
+        """
+        self.frame_height = frame_height
+        self.frame_width = frame_width
+
+    @abstractmethod
+    def add_objects(self, frame: np.ndarray, bboxes: list):
+        """Should start tracking the objects in bboxes (cv2 format), detected in frame
+        """
+        pass
+
+    @abstractmethod
+    def update(self, frame: np.ndarray) -> np.ndarray:
+        """Should return the bboxes (cv2 format) of all tracked objects in the next processed frame
+        """
+        pass
+
+    def correct(self, tracked_inds: np.ndarray, bboxes_detected: np.ndarray):
+        """Called on each detection frame with the tracked objects which were detected again and their
+        detected bboxes (cv2 format). Does nothing by default.
+        """
+        pass
+
+
+# maps the opencv_tracker_type parameter to the name of the opencv function creating the tracker
+tracker_constructor_names = {'boosting': 'TrackerBoosting_create',
+                             'mil': 'TrackerMIL_create',
+                             'kcf': 'TrackerKCF_create',
+                             'tld': 'TrackerTLD_create',
+                             'medianflow': 'TrackerMedianFlow_create',
+                             'goturn': 'TrackerGOTURN_create',
+                             'mosse': 'TrackerMOSSE_create',
+                             'csrt': 'TrackerCSRT_create'}
+
+
+def get_tracker_constructor(tracker_type: str):
+    """Get the opencv function creating trackers of type tracker_type, without creating one
+
+    Raises:
+        ValueError: if the tracker type is unknown or not available in the installed opencv
+    """
+    if tracker_type not in tracker_constructor_names:
+        raise ValueError(f"Incorrect tracker name {tracker_type}. "
+                         f"Available trackers are: {', '.join(tracker_constructor_names.keys())}")
+
+    tracker_constructor = getattr(cv2, tracker_constructor_names[tracker_type], None)
+    if tracker_constructor is None:
+        raise ValueError(f"Tracker {tracker_type} is not available in opencv {cv2.__version__}")
+    return tracker_constructor
+
+
+class OpenCVTrackingBackend(TrackingBackend):
+    """One opencv tracker of type opencv_tracker_type per object, updated on every processed frame
+    through a cv2.MultiTracker
+    """
+
+    def __init__(self, params: dict):
+        super().__init__(params)
+        self.tracker_type = params['opencv_tracker_type']
+        # fail early if the tracker is not available in this opencv build
+        self.tracker_constructor = get_tracker_constructor(self.tracker_type)
+        self.verbose = params.get('verbose', False)
+        self.multi_tracker = None
+
+    def start_video(self, frame_height: int, frame_width: int):
+        super().start_video(frame_height, frame_width)
+        self.multi_tracker = cv2.MultiTracker_create()
+
+    def add_objects(self, frame: np.ndarray, bboxes: list):
+        for bbox in bboxes:
+            self.add_to_multi_tracker(frame=frame, bbox=bbox)
+
+    def update(self, frame: np.ndarray) -> np.ndarray:
+        success, bboxes_tracked = self.multi_tracker.update(image=frame)
+        return np.array(bboxes_tracked)
+
+    def add_to_multi_tracker(self, frame: np.ndarray, bbox):
+        """Add bbox to the multitracker as a new tracker
+        """
+        frame_height, frame_width = self.frame_height, self.frame_width
+        try:
+            self.multi_tracker.add(newTracker=self.tracker_constructor(),
+                                   image=frame,
+                                   boundingBox=tuple(bbox))
+        except Exception as e:
+            # convert bbox
+            if self.verbose:
+                print(e)
+                print(f"bbox is {bbox}")
+                print("Retrying with bbox formatting corrections...")
+
+            if (bbox[0] <= bbox[2]) and (bbox[1] <= bbox[3]):
+                # format: (xmin, ymin, width, height)
+                bbox = bboxcvlib_to_bboxcv2(bbox)
+
+            for i in range(4):
+                # correct neg coords
+                if bbox[i] < 0:
+                    bbox[i] = 0
+
+                # check ind coords don't go outside frame
+                if i % 2 == 0: # xmin and width
+                    if bbox[i] > frame_width:
+                        bbox[i] = frame_width
+                else: # ymin and height
+                    if bbox[i] > frame_height:
+                        bbox[i] = frame_height
+
+            # check sum of coords don't go outside frame
+            if bbox[0] + bbox[2] > frame_width:
+                bbox[2] = frame_width - bbox[0]
+
+            if bbox[1] + bbox[3] > frame_height:
+                bbox[3] = frame_height - bbox[1]
+
+            self.multi_tracker.add(newTracker=self.tracker_constructor(),
+                                   image=frame,
+                                   boundingBox=tuple(bbox))
+
+
+# constant velocity model of SORT (Bewley et al. 2016) on the state (x centre, y centre, area,
+# aspect ratio) and the velocities of the first three, with its default noise levels
+kalman_transition = np.eye(7)
+kalman_transition[[0, 1, 2], [4, 5, 6]] = 1
+kalman_initial_covariance = np.diag([10., 10., 10., 10., 1e4, 1e4, 1e4])
+kalman_process_noise = np.diag([1., 1., 1., 1., 1e-2, 1e-2, 1e-4])
+kalman_measurement_noise = np.diag([1., 1., 10., 10.])
+
+
+def bboxcv2_to_kalman_measurement(bboxes: np.ndarray) -> np.ndarray:
+    """Convert bboxes in format (xmin, ymin, width, height) to (x centre, y centre, area, aspect ratio)
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    width, height = bboxes[:, 2], bboxes[:, 3]
+    return np.stack([bboxes[:, 0] + width / 2,
+                     bboxes[:, 1] + height / 2,
+                     width * height,
+                     width / np.maximum(height, 1)], axis=1)
+
+
+def kalman_state_to_bboxcv2(states: np.ndarray) -> np.ndarray:
+    """Convert kalman states (x centre, y centre, area, aspect ratio, ...) to bboxes in format
+    (xmin, ymin, width, height)
+    """
+    area = np.maximum(states[:, 2], 0)
+    width = np.sqrt(area * np.maximum(states[:, 3], 0))
+    height = np.divide(area, width, out=np.zeros_like(area), where=width > 0)
+    return np.stack([states[:, 0] - width / 2,
+                     states[:, 1] - height / 2,
+                     width,
+                     height], axis=1)
+
+
+class SortTrackingBackend(TrackingBackend):
+    """Detection driven tracker in the style of SORT: the boxes of all objects are predicted by a
+    constant velocity kalman filter, which is corrected with the detected boxes the objects are
+    associated with. Works on the box coordinates only, so the frames aren't needed.
+
+    An object which isn't detected again on sort_max_missed_detections detection frames in a row, or
+    whose predicted box leaves the frame, is lost and reported with a box of zeros from then on.
+    """
+    requires_frames = False
+    corrects_tracked_bboxes = True
+
+    def __init__(self, params: dict):
+        super().__init__(params)
+        self.max_missed_detections = params['sort_max_missed_detections']
+        self.states = np.zeros((0, 7))
+        self.covariances = np.zeros((0, 7, 7))
+        self.n_missed_detections = np.zeros(0, dtype=int)
+        self.is_lost = np.zeros(0, dtype=bool)
+
+    def start_video(self, frame_height: int, frame_width: int):
+        super().start_video(frame_height, frame_width)
+        self.states = np.zeros((0, 7))
+        self.covariances = np.zeros((0, 7, 7))
+        self.n_missed_detections = np.zeros(0, dtype=int)
+        self.is_lost = np.zeros(0, dtype=bool)
+
+    def add_objects(self, frame: np.ndarray, bboxes: list):
+        n_objects = len(bboxes)
+        if n_objects == 0:
+            return
+        new_states = np.zeros((n_objects, 7))
+        new_states[:, :4] = bboxcv2_to_kalman_measurement(bboxes)
+
+        self.states = np.concatenate((self.states, new_states), axis=0)
+        self.covariances = np.concatenate((self.covariances,
+                                           np.repeat(kalman_initial_covariance[np.newaxis], n_objects, axis=0)),
+                                          axis=0)
+        self.n_missed_detections = np.concatenate((self.n_missed_detections, np.zeros(n_objects, dtype=int)))
+        self.is_lost = np.concatenate((self.is_lost, np.zeros(n_objects, dtype=bool)))
+
+    def update(self, frame: np.ndarray) -> np.ndarray:
+        # the area can't shrink below zero
+        self.states[self.states[:, 2] + self.states[:, 6] <= 0, 6] = 0
+
+        self.states = self.states @ kalman_transition.T
+        self.covariances = kalman_transition @ self.covariances @ kalman_transition.T + kalman_process_noise
+
+        bboxes = kalman_state_to_bboxcv2(self.states)
+        is_outside = ((bboxes[:, 0] + bboxes[:, 2] <= 0) | (bboxes[:, 1] + bboxes[:, 3] <= 0) |
+                      (bboxes[:, 0] >= self.frame_width) | (bboxes[:, 1] >= self.frame_height))
+        self.is_lost |= is_outside
+        bboxes[self.is_lost] = 0
+        return bboxes
+
+    def correct(self, tracked_inds: np.ndarray, bboxes_detected: np.ndarray):
+        self.n_missed_detections += 1
+        self.n_missed_detections[tracked_inds] = 0
+        self.is_lost |= self.n_missed_detections > self.max_missed_detections
+        if len(tracked_inds) == 0:
+            return
+
+        # kalman update of the objects detected again, the measurement being the first four state variables
+        states = self.states[tracked_inds]
+        covariances = self.covariances[tracked_inds]
+        residuals = bboxcv2_to_kalman_measurement(bboxes_detected) - states[:, :4]
+        residual_covariances = covariances[:, :4, :4] + kalman_measurement_noise
+        gains = covariances[:, :, :4] @ np.linalg.inv(residual_covariances)
+
+        self.states[tracked_inds] = states + (gains @ residuals[:, :, np.newaxis])[:, :, 0]
+        self.covariances[tracked_inds] = covariances - gains @ covariances[:, :4, :]
+
+
+# maps the tracking_backend parameter to the backend class
+tracking_backends = {'opencv': OpenCVTrackingBackend,
+                     'sort': SortTrackingBackend}
+
+
+def create_tracking_backend(params: dict) -> TrackingBackend:
+    """Create the tracking backend selected by the tracking_backend parameter
+
+    Args:
+        params: dictionary of parameters from yml file
+    Returns:
+        backend: tracking backend, on which start_video is called before tracking each video
+    Raises:
+        ValueError: if the tracking backend is unknown
+    """
+    tracking_backend = params['tracking_backend']
+    if tracking_backend not in tracking_backends:
+        raise ValueError(f"Unknown tracking_backend {tracking_backend}. "
+                         f"Available backends are: {', '.join(tracking_backends.keys())}")
+    return tracking_backends[tracking_backend](params=params)
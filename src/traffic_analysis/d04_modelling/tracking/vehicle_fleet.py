@@ -6,7 +6,7 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
-from traffic_analysis.d00_utils.bbox_helpers import color_bboxes, bbox_intersection_over_union, bboxcv2_to_bboxcvlib
+from traffic_analysis.d00_utils.bbox_helpers import color_bboxes, bbox_intersection_over_union_paired
 from traffic_analysis.d00_utils.stats_helpers import time_series_smoother
 from traffic_analysis.d00_utils.video_helpers import parse_video_or_annotation_name
 
@@ -19,6 +19,10 @@ class VehicleFleet:
     convention that axis 0 corresponds to vehicle index, axis 1 corresponds to the information for each 
     vehicle we are interested in, and axis 2 corresponds to the frame/time dimension for the info 
     recorded by axis 1 (if relevant). 
+
+    The bbox history is stored in a preallocated buffer which is larger than needed, and grows by doubling
+    along the vehicle or time axis when it is full. self.bboxes is a view of the part of the buffer in use,
+    so adding a frame or a vehicle does not copy the whole history.
     """
 
     def __init__(self, bboxes: np.ndarray = None,
@@ -26,9 +30,11 @@ class VehicleFleet:
                        confs: np.ndarray = None,
                        video_name: str = None,
                        frame_level_df: pd.DataFrame = None,
-                       load_from_pd = False):
-        """Initialize the vehicleFleet object, either from a saved dataframe, or from the info returned by
-        running object detection algs on the first frame of a video.
+                       load_from_pd = False,
+                       n_frames: int = None,
+                       frame_level_arrays: dict = None):
+        """Initialize the vehicleFleet object, either from a saved dataframe (or its columns), or from the info
+        returned by running object detection algs on the first frame of a video.
 
         Args:
             bboxes -- pass in using cv2 format (xmin, ymin, width, height). Each vehicle should be axis 0,
@@ -40,29 +46,20 @@ class VehicleFleet:
                               frame-level stats df
             load_from_pd -- if this is True, will reconstruct VehicleFleet object from a frame-level stats
                             table. Else constructs it from scratch using bbox, label, confs, and video name
+            n_frames -- number of frames in the video, if known, so that the bbox history can be allocated
+                        once for the whole video
+            frame_level_arrays -- the columns of a frame-level stats df for one video as numpy arrays, see
+                                  get_frame_level_arrays. Used instead of frame_level_df if given.
         """
         # bool for tracking whether there is a fake head vehicle
         # used to handle case if no vehicles detected in video
         self.fake_head_vehicle = False
 
         if load_from_pd:
-            # sort to ensure that the ordering of self.labels and self.confs corresps to vehicle id
-            frame_level_df = frame_level_df.sort_values(by=['camera_id', 'frame_id'], axis='index')
-            self.labels = np.array(frame_level_df[frame_level_df["frame_id"] == 0]["vehicle_type"])
-            self.confs = np.array(frame_level_df[frame_level_df["frame_id"] == 0]["confidence"])
-            # get static info
-            self.camera_id = frame_level_df["camera_id"].iloc[0]
-            self.video_upload_datetime = frame_level_df["video_upload_datetime"].iloc[0]
-
-            # extract bbox info into np array
-            frame_level_df['bboxes'] = frame_level_df['bboxes'].apply(np.array)
-            bboxes_np = np.array(frame_level_df[['frame_id', 'bboxes']].groupby('frame_id')['bboxes'].apply(np.vstack))
-            num_vehicles, num_frames = bboxes_np[0].shape[0], bboxes_np.shape[0]
-
-            # reshape array
-            self.bboxes = np.zeros((num_vehicles, 4, num_frames))
-            for i in range(num_frames):
-                self.bboxes[:,:,i] = bboxes_np[i]
+            frame_level_arrays = get_frame_level_arrays(frame_level_df)
+
+        if frame_level_arrays is not None:
+            self.load_frame_level_arrays(**frame_level_arrays)
         else:
             # check if the bboxes are empty
             if bboxes.size == 0: 
@@ -74,26 +71,96 @@ class VehicleFleet:
                 self.fake_head_vehicle = True 
 
             assert bboxes.shape[1] == 4
-            # add a dimension for time
-            self.bboxes = np.expand_dims(bboxes, axis=2)
+            # allocate the bbox history for all frames up front, the first frame is filled in here
+            self.bbox_buffer = np.zeros((bboxes.shape[0], 4, max(1, n_frames or 1)))
+            self.bbox_buffer[:, :, 0] = bboxes
+            self.n_vehicles, self.n_frames = bboxes.shape[0], 1
             self.labels = labels
             self.confs = confs
             self.camera_id, self.video_upload_datetime = parse_video_or_annotation_name(video_name)
 
+    def load_frame_level_arrays(self,
+                                camera_id: str,
+                                video_upload_datetime,
+                                frame_ids: np.ndarray,
+                                vehicle_ids: np.ndarray,
+                                vehicle_types: np.ndarray,
+                                confidences: np.ndarray,
+                                bboxes: np.ndarray):
+        """Reconstruct the fleet from the rows of a frame-level stats table, scattering the bboxes
+        into the bbox history by vehicle and frame id
+
+        Args:
+            camera_id -- camera id of the video
+            video_upload_datetime -- upload datetime of the video
+            frame_ids, vehicle_ids, vehicle_types, confidences -- one entry per row of the table
+            bboxes -- bbox of each row of the table, in format (rows, 4) using cv2 format
+        """
+        self.camera_id = camera_id
+        self.video_upload_datetime = video_upload_datetime
+
+        frame_ids = frame_ids.astype(int)
+        vehicle_ids = vehicle_ids.astype(int)
+        num_vehicles, num_frames = vehicle_ids.max() + 1, frame_ids.max() + 1
+
+        self.bboxes = np.zeros((num_vehicles, 4, num_frames))
+        self.bboxes[vehicle_ids, :, frame_ids] = bboxes
+
+        self.labels = np.empty(num_vehicles, dtype=object)
+        self.labels[vehicle_ids] = vehicle_types
+        self.confs = np.zeros(num_vehicles)
+        self.confs[vehicle_ids] = confidences
+
+    @property
+    def bboxes(self) -> np.ndarray:
+        """Bbox history of all vehicles, in format (vehicles, 4, frames). This is a view of the buffer.
+        """
+        return self.bbox_buffer[:self.n_vehicles, :, :self.n_frames]
+
+    @bboxes.setter
+    def bboxes(self, bboxes: np.ndarray):
+        self.bbox_buffer = bboxes
+        self.n_vehicles, _, self.n_frames = bboxes.shape
+
+    def reserve(self, n_vehicles: int, n_frames: int):
+        """Make sure the buffer can hold n_vehicles vehicles and n_frames frames. If not, a new buffer is
+        allocated, at least doubling the size of each axis which is too small.
+        """
+        vehicle_capacity, _, frame_capacity = self.bbox_buffer.shape
+        if n_vehicles <= vehicle_capacity and n_frames <= frame_capacity:
+            return
+
+        if n_vehicles > vehicle_capacity:
+            vehicle_capacity = max(n_vehicles, 2 * vehicle_capacity)
+        if n_frames > frame_capacity:
+            frame_capacity = max(n_frames, 2 * frame_capacity)
+
+        bbox_buffer = np.zeros((vehicle_capacity, 4, frame_capacity))
+        bbox_buffer[:self.n_vehicles, :, :self.n_frames] = self.bboxes
+        self.bbox_buffer = bbox_buffer
+
+    def remove_fake_head_vehicle(self):
+        """Drop the fake head vehicle from the front of the fleet
+        """
+        self.bbox_buffer = self.bbox_buffer[1:, :, :]
+        self.n_vehicles -= 1
+        self.confs = self.confs[1:]
+        self.labels = self.labels[1:]
+        self.fake_head_vehicle = False
+
     def add_vehicles(self, new_bboxes: np.ndarray, new_labels: np.ndarray, new_confs: np.ndarray):
         """Adds new vehicles to the vehicleFleet, creating appropriate bbox location "history" for the 
         self.bboxes numpy array 
 
         Args: should be in same format as for the init
         """
-        current_time_t = self.bboxes.shape[2]
         num_new_vehicles = new_bboxes.shape[0]
-        # create bboxes of all zeros to denote that the vehicle didn't exist at previous times
-        new_vehicle_history = np.zeros((num_new_vehicles, 4, current_time_t-1))
-        new_bboxes = np.concatenate((np.expand_dims(new_bboxes, axis=2),
-                                     new_vehicle_history), axis=2)
+        self.reserve(n_vehicles=self.n_vehicles + num_new_vehicles, n_frames=self.n_frames)
+        # the history of the new vehicles is all zeros (unused part of the buffer) to denote that the
+        # vehicle didn't exist at previous times, apart from the bbox which goes in the first slot
+        self.bbox_buffer[self.n_vehicles:self.n_vehicles + num_new_vehicles, :, 0] = new_bboxes
+        self.n_vehicles += num_new_vehicles
 
-        self.bboxes = np.concatenate((self.bboxes, new_bboxes), axis=0)
         self.labels = np.concatenate((self.labels, new_labels), axis=0)
         self.confs = np.concatenate((self.confs, new_confs), axis=0)
 
@@ -111,24 +178,31 @@ class VehicleFleet:
         if bboxes_time_t.size == 0: 
             # create bboxes of 0s to append to self.bboxes to ensure 
             # that each frame in a video corresponds to a subarray in self.bboxes
-            num_vehicles = self.bboxes.shape[0]
-            bboxes_time_t = np.zeros((num_vehicles,4))
+            bboxes_time_t = np.zeros((self.n_vehicles, 4))
 
         else: # check tracking format is correct 
             assert bboxes_time_t.shape[1] == 4
 
-        if(self.bboxes.shape[0] > 1 and self.fake_head_vehicle):
-            self.fake_head_vehicle = False
-            self.bboxes = self.bboxes[1:, :, :]
-            self.confs = self.confs[1:]
-            self.labels = self.labels[1:]
+        if(self.n_vehicles > 1 and self.fake_head_vehicle):
+            self.remove_fake_head_vehicle()
+
+        assert self.n_vehicles == bboxes_time_t.shape[0], "Error! " \
+                                                          "Number of vehicles in multitracker " \
+                                                          "and fleet do not match!"
 
-        assert self.bboxes.shape[0] == bboxes_time_t.shape[0], "Error! " \
-                                                               "Number of vehicles in multitracker " \
-                                                               "and fleet do not match!"
+        self.reserve(n_vehicles=self.n_vehicles, n_frames=self.n_frames + 1)
+        self.bbox_buffer[:self.n_vehicles, :, self.n_frames] = bboxes_time_t
+        self.n_frames += 1
 
-        self.bboxes = np.concatenate((self.bboxes, np.expand_dims(bboxes_time_t, axis=2)),
-                                        axis=2)
+    def refresh_vehicles(self, vehicle_inds: np.ndarray, bboxes_time_t: np.ndarray):
+        """Overwrite the bbox location of some vehicles at the latest frame, e.g. with the bboxes
+        of vehicles which were detected again
+
+        Args:
+            vehicle_inds -- indices of the vehicles to refresh
+            bboxes_time_t -- new location of their bboxes. pass in using cv2 format (xmin, ymin, width, height)
+        """
+        self.bbox_buffer[vehicle_inds, :, self.n_frames - 1] = bboxes_time_t
 
     def compute_counts(self) -> dict:
         """Get counts of each vehicle type 
@@ -147,18 +221,14 @@ class VehicleFleet:
         """
         self.iou_interval = interval
 
-        num_vehicles, _, num_frames = self.bboxes.shape
-        iou_time_series = np.zeros((num_vehicles, num_frames - interval))
-
-        # compare bboxes at timepoints t0,t1 for each vehicle; compute iou
-        # t0, t1 are separated by the interval parameter
-        for i in range(0, num_frames-interval):
-            bboxes_time_t0 = self.bboxes[:, :, i]
-            bboxes_time_t1 = self.bboxes[:, :, i+interval]
-
-            for j in range(num_vehicles):
-                iou_time_series[j, i] = bbox_intersection_over_union(bboxcv2_to_bboxcvlib(bboxes_time_t0[j]),
-                                                                     bboxcv2_to_bboxcvlib(bboxes_time_t1[j]))
+        num_frames = self.bboxes.shape[2]
+        # compare bboxes at timepoints t0,t1 for all vehicles and frames at once; compute iou
+        # t0, t1 are separated by the interval parameter. The iou is 0 for the all-zero boxes of
+        # vehicles which are not in the frame.
+        bboxes_time_t0 = self.bboxes[:, :, :num_frames - interval].transpose(0, 2, 1)
+        bboxes_time_t1 = self.bboxes[:, :, interval:].transpose(0, 2, 1)
+        iou_time_series = bbox_intersection_over_union_paired(bboxes_time_t0, bboxes_time_t1,
+                                                              bbox_format="cv2")
         self.iou_time_series = iou_time_series
 
     def smooth_iou_time_series(self, smoothing_method: str, **smoothing_settings):
@@ -178,46 +248,65 @@ class VehicleFleet:
                                                              method=smoothing_method,
                                                              **default_settings)
 
-    def compute_stop_starts(self, stop_start_iou_threshold: float = 0.85, from_smoothed=True) -> dict:
-        """ Compute the stop starts by thresholding the IOU time series data. Performance is best 
-        when using the smoothed IOU time series. 
+    def compute_motion_transitions(self, stop_start_iou_threshold: float = 0.85,
+                                   from_smoothed=True) -> (np.ndarray, np.ndarray):
+        """ Find the changes of motion status of each vehicle by thresholding the IOU time series data.
 
         Args:
             stop_start_iou_threshold -- above this threshold, IOU is rounded to 1. Under this threshold, IOU is rounded 
                                         to 0. 1 indicates that the vehicle is in motion, 0 indicates it is stopped. 
             from_smoothed -- Whether or not to use the smoothed IOU time series data in computing stop starts.
+        Returns:
+            stops -- boolean array in format (vehicles, iou time series length - 1), True at [i, t] if the motion
+                     status of vehicle i changes from 0 between t and t + 1 (counted as a stop)
+            starts -- same as stops, for changes from 1 (counted as a start)
         """
-        motion_array = np.copy(
-            self.smoothed_iou_time_series) if from_smoothed else np.copy(self.iou_time_series)
+        iou_time_series = self.smoothed_iou_time_series if from_smoothed else self.iou_time_series
 
         # don't need to worry about fake head vehicle bc iou_time_series for
         # this vehicle should always be 0 
         if self.fake_head_vehicle: 
-            assert np.sum(motion_array[0,:]) == 0
+            assert np.sum(iou_time_series[0,:]) == 0
 
-        # round iou values to binary values
-        motion_array[motion_array > stop_start_iou_threshold] = 1
-        motion_array[motion_array <= stop_start_iou_threshold] = 0
+        # round iou values to binary values, nans are kept
+        motion_array = np.where(iou_time_series > stop_start_iou_threshold, 1., 0.)
+        motion_array[np.isnan(iou_time_series)] = np.nan
 
-        # iterate over vehicles, frames axes of the motion_array
-        num_vehicles, num_frames = motion_array.shape
-        stop_counter, start_counter = [], []
-        for vehicle_idx in range(num_vehicles):
-            # initialize the "motion status" by looking at first iou value
-            motion_status_prev = motion_array[vehicle_idx, 0]
+        # compare each motion status with the previous one
+        motion_status_prev, motion_status_current = motion_array[:, :-1], motion_array[:, 1:]
+        changed = motion_status_current != motion_status_prev
+        stops = changed & (motion_status_prev == 0)
+        starts = changed & (motion_status_prev == 1)
+        return stops, starts
+
+    def compute_stop_starts(self, stop_start_iou_threshold: float = 0.85, from_smoothed=True) -> dict:
+        """ Compute the stop starts by thresholding the IOU time series data. Performance is best 
+        when using the smoothed IOU time series. The IOU time series index at which each vehicle stops or
+        starts is saved in self.stop_frame_inds and self.start_frame_inds (one array per vehicle).
+
+        Args:
+            stop_start_iou_threshold -- above this threshold, IOU is rounded to 1. Under this threshold, IOU is rounded 
+                                        to 0. 1 indicates that the vehicle is in motion, 0 indicates it is stopped. 
+            from_smoothed -- Whether or not to use the smoothed IOU time series data in computing stop starts.
+        """
+        stops, starts = self.compute_motion_transitions(stop_start_iou_threshold=stop_start_iou_threshold,
+                                                        from_smoothed=from_smoothed)
 
-            for frame_idx in range(num_frames):
-                motion_status_current = motion_array[vehicle_idx, frame_idx]
-                if motion_status_current != motion_status_prev:
-                    if motion_status_prev == 0:
-                        # get the type of the object that just stopped
-                        stop_counter.append(self.labels[vehicle_idx])
-                    elif motion_status_prev == 1:
-                        start_counter.append(self.labels[vehicle_idx])
+        vehicle_stop_counts, vehicle_start_counts = stops.sum(axis=1), starts.sum(axis=1)
+        # nonzero returns the transitions ordered by vehicle, so they can be split using the counts
+        self.stop_frame_inds = np.split(np.nonzero(stops)[1] + 1, np.cumsum(vehicle_stop_counts)[:-1])
+        self.start_frame_inds = np.split(np.nonzero(starts)[1] + 1, np.cumsum(vehicle_start_counts)[:-1])
 
-                    motion_status_prev = motion_status_current
+        # sum the stops/starts of each vehicle by label, using integer codes for the labels
+        label_names, label_codes = np.unique(self.labels, return_inverse=True)
+        stop_counts = np.bincount(label_codes, weights=vehicle_stop_counts, minlength=len(label_names))
+        start_counts = np.bincount(label_codes, weights=vehicle_start_counts, minlength=len(label_names))
 
-        return collections.Counter(stop_counter), collections.Counter(start_counter)
+        stop_counter = collections.Counter({label: int(count)
+                                            for label, count in zip(label_names, stop_counts) if count > 0})
+        start_counter = collections.Counter({label: int(count)
+                                             for label, count in zip(label_names, start_counts) if count > 0})
+        return stop_counter, start_counter
 
     def compute_label_confs(self):
         """Append label, id, and confidence for each vehicle for plotting purposes
@@ -259,66 +348,43 @@ class VehicleFleet:
         plt.close()
 
     def report_frame_level_info(self) -> pd.DataFrame:
-        """Converts the information stored in the VehicleFleet class to a frame level pd dataframe.
+        """Converts the information stored in the VehicleFleet class to a frame level pd dataframe, with one
+        row per vehicle per frame. The table is built column by column from the bbox history.
         Fake head vehicles are removed here, so that report_video_level_info doesn't have to handle
         this.
         """
         column_names = ['camera_id', 'video_upload_datetime',
                         'frame_id', 'vehicle_id', 'vehicle_type', 
-                        'confidence', 'bboxes']
+                        'confidence', 'bbox_x', 'bbox_y', 'bbox_w', 'bbox_h']
         if self.fake_head_vehicle: # handle fake head before reporting 
-            if self.bboxes.shape[0] == 1: #only a fake head vehicle, no other vehicles in fleet 
-                return pd.DataFrame([[self.camera_id, self.video_upload_datetime, 
-                                      math.nan, math.nan, math.nan, 
-                                      math.nan, math.nan]], columns=column_names)
+            if self.n_vehicles == 1: #only a fake head vehicle, no other vehicles in fleet 
+                return pd.DataFrame([[self.camera_id, self.video_upload_datetime] + [math.nan] * 8],
+                                    columns=column_names)
             else: 
-                self.bboxes = self.bboxes[1:,:,:] # remove fake head vehicle
-                self.labels = self.labels[1:]
-                self.confs = self.confs[1:]
-
-                self.fake_head_vehicle = False
+                self.remove_fake_head_vehicle()
 
         num_vehicles, _, num_frames = self.bboxes.shape
 
-        def add_vehicle_ids(bboxes, vehicle_ids):
-            return np.concatenate([bboxes,
-                                   np.tile(vehicle_ids, (num_frames, 1, 1)).transpose()],
-                                  axis=1)
-
-        def add_frame_id(single_frame, frame_id):
-            return np.concatenate([single_frame,
-                                   (np.ones(num_vehicles) * frame_id)[:, np.newaxis]],
-                                  axis=1)
-
-        # add vehicle index for each frame to all frames at once
-        vehicle_ids = np.arange(0, num_vehicles)
-
-        # add the frame id to each frame
-        frame_info_all = add_vehicle_ids(bboxes=self.bboxes,
-                                         vehicle_ids=vehicle_ids)
-        frame_info_list = [add_frame_id(single_frame=frame_info_all[:, :, frame_id],
-                                        frame_id=frame_id) for frame_id in range(num_frames)]
-
-        # convert 3d array into 2d pd dataframe
-        frame_level_info_df = pd.DataFrame(np.vstack(frame_info_list))
-
-        frame_level_info_df["bboxes"] = frame_level_info_df.iloc[:, :4].values.tolist()
-        # drop the numeric columns used above, rename the rest
-        frame_level_info_df = frame_level_info_df.drop(columns=[0, 1, 2, 3]).rename({4: "vehicle_id",
-                                                                                     5: "frame_id"},
-                                                                                    axis="columns")
-        # column type conversions
-        frame_level_info_df["vehicle_id"] = frame_level_info_df["vehicle_id"].astype('int')
-        frame_level_info_df["frame_id"] = frame_level_info_df["frame_id"].astype('int')
-
-        # add vehicle types and confidences
-        frame_level_info_df["vehicle_type"] = frame_level_info_df.apply(lambda row: self.labels[row['vehicle_id']], axis = 1)
-        frame_level_info_df["confidence"] = frame_level_info_df.apply(lambda row: self.confs[row['vehicle_id']], axis = 1)
-        frame_level_info_df["video_upload_datetime"] = self.video_upload_datetime
-        frame_level_info_df["camera_id"] = self.camera_id
-
-        # reorder columns
-        frame_level_info_df = frame_level_info_df[column_names]
+        # rows are ordered by frame, then by vehicle
+        frame_ids = np.repeat(np.arange(num_frames), num_vehicles)
+        vehicle_ids = np.tile(np.arange(num_vehicles), num_frames)
+        # (vehicles, 4, frames) -> (frames * vehicles, 4). The boxes are kept as they were tracked, they are
+        # only converted to the integers of the database table when it is written
+        bboxes = self.bboxes.transpose(2, 0, 1).reshape(-1, 4)
+
+        label_names, label_codes = np.unique(self.labels, return_inverse=True)
+
+        frame_level_info_df = pd.DataFrame({
+            'camera_id': self.camera_id,
+            'video_upload_datetime': self.video_upload_datetime,
+            'frame_id': frame_ids,
+            'vehicle_id': vehicle_ids,
+            'vehicle_type': pd.Categorical.from_codes(label_codes[vehicle_ids], categories=label_names),
+            'confidence': np.asarray(self.confs)[vehicle_ids],
+            'bbox_x': bboxes[:, 0],
+            'bbox_y': bboxes[:, 1],
+            'bbox_w': bboxes[:, 2],
+            'bbox_h': bboxes[:, 3]}, columns=column_names)
 
         return frame_level_info_df
 
@@ -355,3 +421,49 @@ class VehicleFleet:
         # reorder columns
         video_level_stats_df = video_level_stats_df[column_names]
         return video_level_stats_df
+
+
+def get_frame_level_arrays(frame_level_df: pd.DataFrame) -> dict:
+    """Get the columns of a frame-level stats df for one video as numpy arrays, as taken by
+    VehicleFleet.load_frame_level_arrays
+    """
+    return {'camera_id': frame_level_df["camera_id"].iloc[0],
+            'video_upload_datetime': frame_level_df["video_upload_datetime"].iloc[0],
+            'frame_ids': frame_level_df["frame_id"].values,
+            'vehicle_ids': frame_level_df["vehicle_id"].values,
+            'vehicle_types': np.asarray(frame_level_df["vehicle_type"], dtype=object),
+            'confidences': frame_level_df["confidence"].values,
+            'bboxes': frame_level_df[['bbox_x', 'bbox_y', 'bbox_w', 'bbox_h']].values}
+
+
+def construct_fleets_from_frame_level_df(frame_level_df: pd.DataFrame) -> list:
+    """Reconstruct the VehicleFleet of every video in a frame-level stats df. The columns are converted
+    to numpy arrays once and split by video, instead of handling each video's rows in pandas.
+
+    Args:
+        frame_level_df -- frame-level stats df for any number of videos
+    Returns:
+        fleets -- one VehicleFleet per (camera_id, video_upload_datetime), in sorted order
+    """
+    if frame_level_df.empty:
+        return []
+
+    # order the rows by video, and find where the rows of each video start
+    video_ids = frame_level_df.groupby(['camera_id', 'video_upload_datetime'], sort=True).ngroup().values
+    order = np.argsort(video_ids, kind='stable')
+    video_starts = np.flatnonzero(np.diff(video_ids[order])) + 1
+    first_rows = order[np.concatenate(([0], video_starts))]
+
+    frame_level_arrays = get_frame_level_arrays(frame_level_df)
+    row_columns = {name: np.split(frame_level_arrays[name][order], video_starts)
+                   for name in ['frame_ids', 'vehicle_ids', 'vehicle_types', 'confidences', 'bboxes']}
+    camera_ids = frame_level_df["camera_id"].iloc[first_rows]
+    video_upload_datetimes = frame_level_df["video_upload_datetime"].iloc[first_rows]
+
+    fleets = []
+    for i, (camera_id, video_upload_datetime) in enumerate(zip(camera_ids, video_upload_datetimes)):
+        video_arrays = {name: split_column[i] for name, split_column in row_columns.items()}
+        fleets.append(VehicleFleet(frame_level_arrays={'camera_id': camera_id,
+                                                       'video_upload_datetime': video_upload_datetime,
+                                                       **video_arrays}))
+    return fleets
@@ -0,0 +1,204 @@
+import os
+import sys
+import json
+import time
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+from traffic_analysis.d04_modelling.perform_detection_opencv import (pass_images_through_nn,
+                                                                     get_detected_objects,
+                                                                     identify_most_probable_object,
+                                                                     make_bbox_around_object)
+
+
+def get_detected_objects_loop(image_capture: np.ndarray,
+                              network_output: list,
+                              conf_thresh: float) -> (list, list, list):
+    """Reference implementation of get_detected_objects which walks every grid cell of every
+    output layer in python. Only used to benchmark and check the vectorized decoder.
+    """
+    bboxes = []
+    label_idxs = []
+    confs = []
+
+    for output_layer in network_output:
+        for grid_cell_estimates in output_layer:
+            object_label_idx, max_conf = identify_most_probable_object(
+                grid_cell_estimate=grid_cell_estimates)
+
+            if max_conf > conf_thresh:
+                object_bbox = make_bbox_around_object(image_capture=image_capture,
+                                                      unscaled_bbox=grid_cell_estimates)
+                bboxes.append(object_bbox)
+                label_idxs.append(object_label_idx)
+                confs.append(float(max_conf))
+
+    return bboxes, label_idxs, confs
+
+
+def record_network_outputs(images: np.ndarray,
+                           model_name: str,
+                           paths: dict,
+                           save_path: str):
+    """Pass images through the detection model and save the raw network outputs, so that
+    the decoding benchmark can be rerun without the network
+
+    Args:
+        images: numpy array of images, each in format (height, width, rbg)
+        model_name: name of the model to use
+        paths: dictionary of paths from yml file
+        save_path: path of the .npz file to write
+    """
+    network_outputs = pass_images_through_nn(images=images,
+                                             model_name=model_name,
+                                             paths=paths)
+    arrays = {'image_shape': np.array(images[0].shape)}
+    for i, network_output in enumerate(network_outputs):
+        for j, output_layer in enumerate(network_output):
+            arrays[f"image{i}_layer{j}"] = output_layer
+    np.savez(save_path, **arrays)
+
+
+def load_network_outputs(save_path: str) -> (list, tuple):
+    """Load network outputs saved by record_network_outputs
+
+    Returns:
+        network_outputs (list(list(nparray))): for each image, the list of network output layers
+        image_shape: shape of the images the outputs were recorded on
+    """
+    arrays = np.load(save_path)
+    network_outputs = {}
+    for key in arrays.files:
+        if key == 'image_shape':
+            continue
+        image_key, layer_key = key.split('_')
+        network_outputs.setdefault(int(image_key[5:]), {})[int(layer_key[5:])] = arrays[key]
+
+    network_outputs = [[layers[j] for j in sorted(layers)]
+                       for i, layers in sorted(network_outputs.items())]
+    return network_outputs, tuple(arrays['image_shape'])
+
+
+def benchmark_output_decoding(network_outputs: list,
+                              image_shape: tuple,
+                              conf_thresh: float,
+                              n_repeats: int = 5) -> pd.DataFrame:
+    """Time the vectorized yolo output decoder against the python loop on recorded network outputs,
+    and check that both return the same detections
+
+    Args:
+        network_outputs: as returned by load_network_outputs
+        image_shape: shape of the images the outputs were recorded on
+        conf_thresh: minimum confidence required in object detection, between 0 and 1
+        n_repeats: number of times each decoder is run on every image
+    Returns:
+        benchmark_df: mean time per image for each decoder, with the speedup of the vectorized one
+    """
+    image_capture = np.zeros(image_shape, dtype=np.uint8)
+    decoders = {'loop': get_detected_objects_loop,
+                'vectorized': get_detected_objects}
+
+    times = {}
+    for decoder_name, decoder in decoders.items():
+        start_time = time.perf_counter()
+        for _ in range(n_repeats):
+            for network_output in network_outputs:
+                decoder(image_capture=image_capture,
+                        network_output=network_output,
+                        conf_thresh=conf_thresh)
+        times[decoder_name] = (time.perf_counter() - start_time) / (n_repeats * len(network_outputs))
+
+    for network_output in network_outputs:
+        bboxes_loop, label_idxs_loop, confs_loop = get_detected_objects_loop(image_capture=image_capture,
+                                                                             network_output=network_output,
+                                                                             conf_thresh=conf_thresh)
+        bboxes, label_idxs, confs = get_detected_objects(image_capture=image_capture,
+                                                         network_output=network_output,
+                                                         conf_thresh=conf_thresh)
+        assert np.allclose(np.array(bboxes_loop).reshape(-1, 4), bboxes), "Decoded bboxes do not match"
+        assert np.array_equal(label_idxs_loop, label_idxs), "Decoded labels do not match"
+        assert np.allclose(confs_loop, confs), "Decoded confidences do not match"
+
+    n_grid_cells = np.mean([sum(output_layer.shape[0] for output_layer in network_output)
+                            for network_output in network_outputs])
+    benchmark_df = pd.DataFrame({'decoder': list(times.keys()),
+                                 'time_per_image': list(times.values())})
+    benchmark_df['n_grid_cells'] = n_grid_cells
+    benchmark_df['speedup'] = times['loop'] / benchmark_df['time_per_image']
+    return benchmark_df
+
+
+# run in a fresh interpreter, so that the import cost of each backend is measured from scratch
+STARTUP_BENCHMARK_SCRIPT = """
+import sys
+import json
+import time
+
+import numpy as np
+
+config = json.loads(sys.argv[1])
+
+start_time = time.perf_counter()
+from traffic_analysis.d04_modelling.tracking.tracking_analyser import TrackingAnalyser
+import_time = time.perf_counter() - start_time
+
+start_time = time.perf_counter()
+analyser = TrackingAnalyser(params=config['params'],
+                            paths=config['paths'],
+                            blob_credentials=config['blob_credentials'])
+init_time = time.perf_counter() - start_time
+
+frame = np.zeros(config['frame_shape'], dtype=np.uint8)
+start_time = time.perf_counter()
+analyser.detect_objects_in_frames(frame[np.newaxis])
+first_frame_time = time.perf_counter() - start_time
+
+start_time = time.perf_counter()
+analyser.detect_objects_in_frames(frame[np.newaxis])
+second_frame_time = time.perf_counter() - start_time
+
+print(json.dumps({'import_time': import_time,
+                  'init_time': init_time,
+                  'first_frame_time': first_frame_time,
+                  'second_frame_time': second_frame_time,
+                  'tensorflow_imported': 'tensorflow' in sys.modules}))
+"""
+
+
+def benchmark_detection_backend_startup(detection_models: list,
+                                        params: dict,
+                                        paths: dict,
+                                        blob_credentials: dict,
+                                        frame_shape: tuple = (288, 352, 3)) -> pd.DataFrame:
+    """Measure the startup cost of each detection backend in a fresh python process: the time to
+    import the analyser module, to construct the analyser (and so the backend), and to run detection
+    on the first and second frame
+
+    Args:
+        detection_models: values of the detection_model parameter to benchmark
+        params: dictionary of parameters from yml file
+        paths: dictionary of paths from yml file
+        blob_credentials: blob credentials
+        frame_shape: shape of the blank frame passed through the detector
+    Returns:
+        startup_df: one row per detection model with the timings in seconds, and whether
+                    tensorflow ended up being imported
+    """
+    src_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([src_dir, env.get('PYTHONPATH', '')])
+
+    rows = []
+    for detection_model in detection_models:
+        config = {'params': {**params, 'detection_model': detection_model},
+                  'paths': paths,
+                  'blob_credentials': blob_credentials,
+                  'frame_shape': list(frame_shape)}
+        result = subprocess.run([sys.executable, '-c', STARTUP_BENCHMARK_SCRIPT, json.dumps(config)],
+                                env=env, stdout=subprocess.PIPE, check=True)
+        timings = json.loads(result.stdout.decode().strip().split('\n')[-1])
+        rows.append({'detection_model': detection_model, **timings})
+
+    return pd.DataFrame(rows)
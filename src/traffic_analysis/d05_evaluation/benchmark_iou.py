@@ -0,0 +1,113 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from traffic_analysis.d00_utils.bbox_helpers import (bbox_intersection_over_union,
+                                                     bbox_intersection_over_union_matrix,
+                                                     bbox_intersection_over_union_paired,
+                                                     bboxcv2_to_bboxcvlib)
+
+
+def generate_random_bboxes(n_bboxes: int,
+                           frame_width: int = 352,
+                           frame_height: int = 288,
+                           zero_fraction: float = 0.1,
+                           rng: np.random.Generator = None) -> np.ndarray:
+    """Generate random bboxes in cv2 format (xmin, ymin, width, height), with a fraction of them all
+    zero like the boxes of vehicles which are not in the frame
+
+    Returns:
+        bboxes -- array of shape (n_bboxes, 4)
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    xmin = rng.integers(0, frame_width, n_bboxes)
+    ymin = rng.integers(0, frame_height, n_bboxes)
+    width = rng.integers(0, frame_width // 4, n_bboxes)
+    height = rng.integers(0, frame_height // 4, n_bboxes)
+    bboxes = np.stack([xmin, ymin, width, height], axis=1).astype(float)
+    bboxes[rng.random(n_bboxes) < zero_fraction] = 0
+    return bboxes
+
+
+def compute_iou_matrix_loop(bboxes_a: np.ndarray, bboxes_b: np.ndarray) -> np.ndarray:
+    """Reference iou matrix for boxes in cv2 format, calling the scalar iou function for every pair
+    """
+    ious = np.zeros((len(bboxes_a), len(bboxes_b)))
+    for i, bbox_a in enumerate(bboxes_a):
+        for j, bbox_b in enumerate(bboxes_b):
+            ious[i, j] = bbox_intersection_over_union(bboxcv2_to_bboxcvlib(bbox_a),
+                                                      bboxcv2_to_bboxcvlib(bbox_b))
+    return ious
+
+
+def check_iou_equivalence(n_bboxes: int = 200, seed: int = 0):
+    """Check that the vectorized iou functions give the same ious as the scalar function, for both
+    bbox formats and float types
+
+    Raises:
+        AssertionError: if any of the vectorized ious doesn't match
+    """
+    rng = np.random.default_rng(seed)
+    bboxes_a = generate_random_bboxes(n_bboxes, rng=rng)
+    bboxes_b = generate_random_bboxes(n_bboxes + 1, rng=rng)
+    # shift copies of some boxes a little, so that there are pairs with high overlap
+    bboxes_b[:n_bboxes // 2] = bboxes_a[:n_bboxes // 2] + rng.integers(-3, 4, (n_bboxes // 2, 4))
+    bboxes_b = np.maximum(bboxes_b, 0)
+
+    ious_loop = compute_iou_matrix_loop(bboxes_a, bboxes_b)
+    bboxes_a_cvlib = bboxcv2_to_bboxcvlib(bboxes_a, vectorized=True)
+    bboxes_b_cvlib = bboxcv2_to_bboxcvlib(bboxes_b, vectorized=True)
+
+    for dtype, tolerance in [(np.float64, 0), (np.float32, 1e-6)]:
+        ious_cv2 = bbox_intersection_over_union_matrix(bboxes_a, bboxes_b, bbox_format="cv2", dtype=dtype)
+        ious_cvlib = bbox_intersection_over_union_matrix(bboxes_a_cvlib, bboxes_b_cvlib, dtype=dtype)
+        assert ious_cv2.dtype == dtype and ious_cv2.shape == (len(bboxes_a), len(bboxes_b))
+        assert np.allclose(ious_cv2, ious_loop, rtol=0, atol=tolerance), f"cv2 iou matrix does not match ({dtype})"
+        assert np.allclose(ious_cvlib, ious_loop, rtol=0, atol=tolerance), \
+            f"cvlib iou matrix does not match ({dtype})"
+
+        ious_paired = bbox_intersection_over_union_paired(bboxes_a, bboxes_b[:n_bboxes], bbox_format="cv2", dtype=dtype)
+        assert np.allclose(ious_paired, np.diag(ious_loop), rtol=0, atol=tolerance), \
+            f"paired ious do not match ({dtype})"
+
+    # empty inputs give empty matrices
+    assert bbox_intersection_over_union_matrix(bboxes_a, [], bbox_format="cv2").shape == (n_bboxes, 0)
+
+
+def benchmark_iou_matrix(box_counts: list, n_repeats: int = 5, seed: int = 0) -> pd.DataFrame:
+    """Time the iou matrix between n detected and n tracked boxes with the scalar function and with
+    the vectorized one
+
+    Args:
+        box_counts: numbers of boxes on each side of the matrix
+        n_repeats: number of times each method is run
+        seed: seed of the random generator
+    Returns:
+        benchmark_df: one row per box count with the mean time taken by each method in seconds
+    """
+    check_iou_equivalence(seed=seed)
+
+    rng = np.random.default_rng(seed)
+    rows = []
+    for n_bboxes in box_counts:
+        bboxes_a = generate_random_bboxes(n_bboxes, rng=rng)
+        bboxes_b = generate_random_bboxes(n_bboxes, rng=rng)
+
+        times = {}
+        methods = {'loop': lambda: compute_iou_matrix_loop(bboxes_a, bboxes_b),
+                   'float64': lambda: bbox_intersection_over_union_matrix(bboxes_a, bboxes_b, "cv2", np.float64),
+                   'float32': lambda: bbox_intersection_over_union_matrix(bboxes_a, bboxes_b, "cv2", np.float32)}
+        for method_name, method in methods.items():
+            start_time = time.perf_counter()
+            for _ in range(n_repeats):
+                method()
+            times[method_name] = (time.perf_counter() - start_time) / n_repeats
+
+        rows.append({'n_bboxes': n_bboxes,
+                     'loop_time': times['loop'],
+                     'float64_time': times['float64'],
+                     'float32_time': times['float32'],
+                     'speedup': times['loop'] / times['float64']})
+
+    return pd.DataFrame(rows)
@@ -0,0 +1,78 @@
+import time
+
+import pandas as pd
+
+from traffic_analysis.d00_utils.data_retrieval import load_videos_as_streams
+from traffic_analysis.d04_modelling.tracking.tracking_analyser import TrackingAnalyser
+
+
+def benchmark_frame_level_workers(video_folder: str,
+                                  worker_counts: list,
+                                  params: dict,
+                                  paths: dict,
+                                  blob_credentials: dict) -> pd.DataFrame:
+    """Measure the throughput of TrackingAnalyser.construct_frame_level_df for different numbers of
+    worker processes. The videos are analysed twice for each worker count: the first run includes
+    starting the workers and loading their models, the second one only the analysis.
+
+    Args:
+        video_folder: local folder with the mp4 files to analyse (including trailing slash)
+        worker_counts: values of the n_workers parameter to benchmark
+        params: dictionary of parameters from yml file
+        paths: dictionary of paths from yml file
+        blob_credentials: blob credentials
+    Returns:
+        benchmark_df: one row per worker count with the run times in seconds and the
+                      videos per minute of the warm run
+    """
+    rows = []
+    for n_workers in worker_counts:
+        analyser = TrackingAnalyser(params={**params, 'n_workers': n_workers},
+                                    paths=paths,
+                                    blob_credentials=blob_credentials)
+
+        run_times = []
+        for _ in range(2):
+            video_dict = load_videos_as_streams(video_folder)
+            start_time = time.perf_counter()
+            analyser.construct_frame_level_df(video_dict)
+            run_times.append(time.perf_counter() - start_time)
+        analyser.cleanup_on_finish()
+
+        rows.append({'n_workers': n_workers,
+                     'n_videos': len(video_dict),
+                     'cold_run_time': run_times[0],
+                     'warm_run_time': run_times[1],
+                     'videos_per_minute': 60 * len(video_dict) / run_times[1]})
+
+    return pd.DataFrame(rows)
+
+
+def benchmark_pipelined_detection(video_folder: str,
+                                  params: dict,
+                                  paths: dict,
+                                  blob_credentials: dict) -> pd.DataFrame:
+    """Compare the time to analyse each video when detection runs on all detection frames before tracking,
+    and when it runs in a background thread ahead of the tracker
+
+    Args:
+        video_folder: local folder with the mp4 files to analyse (including trailing slash)
+        params: dictionary of parameters from yml file
+        paths: dictionary of paths from yml file
+        blob_credentials: blob credentials
+    Returns:
+        benchmark_df: one row per video and mode with the time in seconds of each stage of the analysis,
+                      "detection" being the time the tracker waited for the detections when pipelined
+    """
+    timings_dfs = []
+    for pipelined_detection in [False, True]:
+        analyser = TrackingAnalyser(params={**params, 'pipelined_detection': pipelined_detection, 'n_workers': 1},
+                                    paths=paths,
+                                    blob_credentials=blob_credentials)
+        for video_name, video in load_videos_as_streams(video_folder).items():
+            analyser.detect_and_track_objects(video, video_name)
+        analyser.cleanup_on_finish()
+        timings_dfs.append(analyser.stage_timer.report_timings()
+                           .assign(pipelined_detection=pipelined_detection))
+
+    return pd.concat(timings_dfs, ignore_index=True)
@@ -0,0 +1,413 @@
+import time
+import collections
+
+import numpy as np
+import pandas as pd
+
+from traffic_analysis.d00_utils.data_retrieval import get_video_frames
+from traffic_analysis.d00_utils.bbox_helpers import bbox_intersection_over_union, bboxcv2_to_bboxcvlib
+from traffic_analysis.d04_modelling.tracking.tracking_analyser import TrackingAnalyser
+from traffic_analysis.d04_modelling.tracking.tracking_backends import OpenCVTrackingBackend
+from traffic_analysis.d05_evaluation.chunk_evaluator import ChunkEvaluator
+from traffic_analysis.d04_modelling.tracking.vehicle_fleet import VehicleFleet
+
+
+def generate_synthetic_tracks(n_frames: int,
+                              n_initial_vehicles: int,
+                              n_new_vehicles: int,
+                              detection_interval: int,
+                              seed: int = 0) -> (np.ndarray, dict):
+    """Generate random bbox tracks for a synthetic video
+
+    Args:
+        n_frames: number of frames in the video
+        n_initial_vehicles: number of vehicles detected in the first frame
+        n_new_vehicles: number of vehicles added at every detection frame
+        detection_interval: number of frames between two detection frames
+        seed: seed of the random generator
+    Returns:
+        tracks: bboxes of all vehicles at every frame (cv2 format), in format (vehicles, 4, frames)
+        new_vehicle_frames: key is frame index, value is number of vehicles added at that frame
+    """
+    new_vehicle_frames = {frame_ind: n_new_vehicles
+                          for frame_ind in range(detection_interval, n_frames, detection_interval)}
+    n_vehicles = n_initial_vehicles + sum(new_vehicle_frames.values())
+
+    rng = np.random.default_rng(seed)
+    tracks = rng.integers(0, 300, size=(n_vehicles, 4, n_frames)).astype(float)
+    return tracks, new_vehicle_frames
+
+
+def track_with_concatenation(tracks: np.ndarray,
+                             n_initial_vehicles: int,
+                             new_vehicle_frames: dict) -> np.ndarray:
+    """Reference bbox history built the way VehicleFleet used to, concatenating the whole
+    history on every update. Only used to benchmark and check the preallocated buffer.
+    """
+    bboxes = np.expand_dims(tracks[:n_initial_vehicles, :, 0], axis=2)
+    for frame_ind in range(1, tracks.shape[2]):
+        n_vehicles = bboxes.shape[0]
+        bboxes = np.concatenate((bboxes, tracks[:n_vehicles, :, frame_ind:frame_ind + 1]), axis=2)
+
+        n_new = new_vehicle_frames.get(frame_ind, 0)
+        if n_new:
+            new_bboxes = np.concatenate((tracks[n_vehicles:n_vehicles + n_new, :, frame_ind:frame_ind + 1],
+                                         np.zeros((n_new, 4, frame_ind))), axis=2)
+            bboxes = np.concatenate((bboxes, new_bboxes), axis=0)
+    return bboxes
+
+
+def track_with_fleet(tracks: np.ndarray,
+                     n_initial_vehicles: int,
+                     new_vehicle_frames: dict,
+                     n_frames: int = None) -> VehicleFleet:
+    """Build the bbox history of the synthetic tracks with a VehicleFleet, in the same order of
+    updates as the tracking analyser
+    """
+    fleet = VehicleFleet(bboxes=tracks[:n_initial_vehicles, :, 0],
+                         labels=np.array(['car'] * n_initial_vehicles),
+                         confs=np.ones(n_initial_vehicles),
+                         video_name='2019-06-20_13-25-31_00001.03604',
+                         n_frames=n_frames)
+    for frame_ind in range(1, tracks.shape[2]):
+        fleet.update_vehicles(tracks[:fleet.n_vehicles, :, frame_ind])
+
+        n_new = new_vehicle_frames.get(frame_ind, 0)
+        if n_new:
+            fleet.add_vehicles(tracks[fleet.n_vehicles:fleet.n_vehicles + n_new, :, frame_ind],
+                               np.array(['car'] * n_new),
+                               np.ones(n_new))
+    return fleet
+
+
+def benchmark_fleet_updates(frame_counts: list,
+                            n_initial_vehicles: int = 20,
+                            n_new_vehicles: int = 5,
+                            detection_interval: int = 12) -> pd.DataFrame:
+    """Time building the bbox history of synthetic videos of increasing length, with the preallocated
+    VehicleFleet buffer (with and without the frame count known up front) and with the old concatenation,
+    and check that all of them give the same history
+
+    Args:
+        frame_counts: numbers of frames of the synthetic videos
+        n_initial_vehicles: number of vehicles detected in the first frame
+        n_new_vehicles: number of vehicles added at every detection frame
+        detection_interval: number of frames between two detection frames
+    Returns:
+        benchmark_df: one row per video length with the time taken by each method in seconds
+    """
+    rows = []
+    for n_frames in frame_counts:
+        tracks, new_vehicle_frames = generate_synthetic_tracks(n_frames=n_frames,
+                                                               n_initial_vehicles=n_initial_vehicles,
+                                                               n_new_vehicles=n_new_vehicles,
+                                                               detection_interval=detection_interval)
+
+        start_time = time.perf_counter()
+        bboxes_concatenated = track_with_concatenation(tracks, n_initial_vehicles, new_vehicle_frames)
+        concatenate_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        fleet_growing = track_with_fleet(tracks, n_initial_vehicles, new_vehicle_frames)
+        buffer_growing_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        fleet_preallocated = track_with_fleet(tracks, n_initial_vehicles, new_vehicle_frames, n_frames=n_frames)
+        buffer_preallocated_time = time.perf_counter() - start_time
+
+        assert np.array_equal(bboxes_concatenated, fleet_growing.bboxes), "Bbox histories do not match"
+        assert np.array_equal(bboxes_concatenated, fleet_preallocated.bboxes), "Bbox histories do not match"
+
+        rows.append({'n_frames': n_frames,
+                     'n_vehicles': bboxes_concatenated.shape[0],
+                     'concatenate_time': concatenate_time,
+                     'buffer_growing_time': buffer_growing_time,
+                     'buffer_preallocated_time': buffer_preallocated_time,
+                     'speedup': concatenate_time / buffer_preallocated_time})
+
+    return pd.DataFrame(rows)
+
+
+def compute_iou_time_series_loop(bboxes: np.ndarray, interval: int) -> np.ndarray:
+    """Reference implementation of VehicleFleet.compute_iou_time_series which calls the scalar iou
+    function for every vehicle and frame. Only used to benchmark and check the vectorized version.
+    """
+    num_vehicles, _, num_frames = bboxes.shape
+    iou_time_series = np.zeros((num_vehicles, num_frames - interval))
+
+    for i in range(0, num_frames - interval):
+        bboxes_time_t0 = bboxes[:, :, i]
+        bboxes_time_t1 = bboxes[:, :, i + interval]
+
+        for j in range(num_vehicles):
+            iou_time_series[j, i] = bbox_intersection_over_union(bboxcv2_to_bboxcvlib(bboxes_time_t0[j]),
+                                                                 bboxcv2_to_bboxcvlib(bboxes_time_t1[j]))
+    return iou_time_series
+
+
+def benchmark_iou_time_series(frame_level_df: pd.DataFrame, interval: int = 15) -> pd.DataFrame:
+    """Time the vectorized iou time series against the scalar loop on the fleets of saved frame level
+    results, and check that both give the same iou time series
+
+    Args:
+        frame_level_df: frame level table, e.g. loaded from the database or returned by
+                        TrackingAnalyser.construct_frame_level_df
+        interval: convolution window size, as for VehicleFleet.compute_iou_time_series
+    Returns:
+        benchmark_df: one row per video with the size of its fleet and the time taken by each method
+                      in seconds
+    """
+    rows = []
+    for (camera_id, video_upload_datetime), single_frame_level_df in frame_level_df.groupby(
+            ['camera_id', 'video_upload_datetime']):
+        fleet = VehicleFleet(frame_level_df=single_frame_level_df, load_from_pd=True)
+
+        start_time = time.perf_counter()
+        iou_time_series_loop = compute_iou_time_series_loop(fleet.bboxes, interval=interval)
+        loop_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        fleet.compute_iou_time_series(interval=interval)
+        vectorized_time = time.perf_counter() - start_time
+
+        assert np.array_equal(iou_time_series_loop, fleet.iou_time_series), "IOU time series do not match"
+
+        n_vehicles, _, n_frames = fleet.bboxes.shape
+        rows.append({'camera_id': camera_id,
+                     'video_upload_datetime': video_upload_datetime,
+                     'n_vehicles': n_vehicles,
+                     'n_frames': n_frames,
+                     'loop_time': loop_time,
+                     'vectorized_time': vectorized_time,
+                     'speedup': loop_time / vectorized_time})
+
+    return pd.DataFrame(rows)
+
+
+def compute_stop_starts_loop(motion_array: np.ndarray, labels: np.ndarray) -> (dict, dict):
+    """Reference implementation of the stop/start counting in VehicleFleet.compute_stop_starts, which walks
+    every vehicle and frame of the binarized iou time series. Only used to benchmark and check the
+    vectorized version.
+    """
+    num_vehicles, num_frames = motion_array.shape
+    stop_counter, start_counter = [], []
+    for vehicle_idx in range(num_vehicles):
+        motion_status_prev = motion_array[vehicle_idx, 0]
+
+        for frame_idx in range(num_frames):
+            motion_status_current = motion_array[vehicle_idx, frame_idx]
+            if motion_status_current != motion_status_prev:
+                if motion_status_prev == 0:
+                    stop_counter.append(labels[vehicle_idx])
+                elif motion_status_prev == 1:
+                    start_counter.append(labels[vehicle_idx])
+
+                motion_status_prev = motion_status_current
+
+    return collections.Counter(stop_counter), collections.Counter(start_counter)
+
+
+def benchmark_stop_starts(vehicle_counts: list,
+                          n_frames: int = 250,
+                          stop_start_iou_threshold: float = 0.8,
+                          labels: list = ("car", "truck", "bus", "motorbike"),
+                          seed: int = 0) -> pd.DataFrame:
+    """Time the vectorized stop/start counting against the nested loops on random iou time series of
+    fleets of increasing size, and check that both give the same counts
+
+    Args:
+        vehicle_counts: numbers of vehicles in the synthetic fleets
+        n_frames: length of the iou time series
+        stop_start_iou_threshold: as for VehicleFleet.compute_stop_starts
+        labels: vehicle types assigned at random to the vehicles
+        seed: seed of the random generator
+    Returns:
+        benchmark_df: one row per fleet size with the time taken by each method in seconds
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for n_vehicles in vehicle_counts:
+        fleet = VehicleFleet(bboxes=np.ones((n_vehicles, 4)),
+                             labels=rng.choice(labels, size=n_vehicles),
+                             confs=np.ones(n_vehicles),
+                             video_name='2019-06-20_13-25-31_00001.03604')
+        # random walks of iou values, so that vehicles switch between moving and stopped a few times
+        fleet.iou_time_series = np.clip(0.8 + np.cumsum(rng.normal(scale=0.05, size=(n_vehicles, n_frames)),
+                                                        axis=1), 0, 1)
+
+        start_time = time.perf_counter()
+        motion_array = np.copy(fleet.iou_time_series)
+        motion_array[motion_array > stop_start_iou_threshold] = 1
+        motion_array[motion_array <= stop_start_iou_threshold] = 0
+        counts_loop = compute_stop_starts_loop(motion_array, fleet.labels)
+        loop_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        counts = fleet.compute_stop_starts(stop_start_iou_threshold, from_smoothed=False)
+        vectorized_time = time.perf_counter() - start_time
+
+        assert counts_loop == counts, "Stop/start counts do not match"
+
+        rows.append({'n_vehicles': n_vehicles,
+                     'n_frames': n_frames,
+                     'n_stops': sum(counts[0].values()),
+                     'n_starts': sum(counts[1].values()),
+                     'loop_time': loop_time,
+                     'vectorized_time': vectorized_time,
+                     'speedup': loop_time / vectorized_time})
+
+    return pd.DataFrame(rows)
+
+
+def benchmark_tracker_types(video,
+                            tracker_types: list,
+                            params: dict,
+                            paths: dict,
+                            blob_credentials: dict,
+                            n_frames: int = 50) -> pd.DataFrame:
+    """Measure the cost of creating each type of opencv tracker and of updating it, using the objects
+    detected in the first frame of a video
+
+    Args:
+        video: numpy video or StreamingVideo
+        tracker_types: values of the opencv_tracker_type parameter to benchmark
+        params: dictionary of parameters from yml file
+        paths: dictionary of paths from yml file
+        blob_credentials: blob credentials
+        n_frames: number of frames the trackers are updated on
+    Returns:
+        benchmark_df: one row per tracker type with the mean time to create and add one tracker and the
+                      mean time to update all trackers on one frame, in seconds
+    """
+    frames = get_video_frames(video, np.arange(min(n_frames, video.shape[0])))
+    frame_height, frame_width = frames.shape[1:3]
+
+    analyser = TrackingAnalyser(params=params,
+                                paths=paths,
+                                blob_credentials=blob_credentials)
+    bboxes = analyser.detect_objects_in_frames(frames[:1])[0][0]
+    analyser.cleanup_on_finish()
+
+    rows = []
+    for tracker_type in tracker_types:
+        tracker = OpenCVTrackingBackend(params={**params, 'opencv_tracker_type': tracker_type})
+        tracker.start_video(frame_height=frame_height, frame_width=frame_width)
+
+        start_time = time.perf_counter()
+        tracker.add_objects(frame=frames[0], bboxes=[list(bbox) for bbox in bboxes])
+        creation_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        for frame in frames[1:]:
+            tracker.update(frame=frame)
+        update_time = time.perf_counter() - start_time
+
+        rows.append({'tracker_type': tracker_type,
+                     'n_trackers': len(bboxes),
+                     'creation_time_per_tracker': creation_time / max(1, len(bboxes)),
+                     'update_time_per_frame': update_time / max(1, len(frames) - 1)})
+
+    return pd.DataFrame(rows)
+
+
+def benchmark_tracking_backends(video_dict: dict,
+                                annotation_xml_paths: list,
+                                tracking_backends: list,
+                                params: dict,
+                                paths: dict,
+                                blob_credentials: dict,
+                                video_level_column_order: list) -> (pd.DataFrame, pd.DataFrame):
+    """Compare the accuracy of the video level statistics (counts, stops, starts) and the speed of
+    tracking backends. Detection is run once and shared by all backends, so the frames per second
+    only include tracking and updating the VehicleFleet.
+
+    Args:
+        video_dict: key is video filename, value is np array of video or StreamingVideo
+        annotation_xml_paths: paths of the annotations of the videos
+        tracking_backends: values of the tracking_backend parameter to compare
+        params: dictionary of parameters from yml file
+        paths: dictionary of paths from yml file
+        blob_credentials: blob credentials
+        video_level_column_order: column order of the video level table from the reporting parameters
+    Returns:
+        speed_df: one row per backend with the tracking time and frames per second
+        performance_df: video level performance from the VideoLevelEvaluator, with a tracking_backend column
+    """
+    analyser = TrackingAnalyser(params=params,
+                                paths=paths,
+                                blob_credentials=blob_credentials)
+    chunk_detections = analyser.detect_objects_in_videos(video_dict)
+    analyser.cleanup_on_finish()
+    n_frames = sum(video.shape[0] for video in video_dict.values())
+
+    speed_rows = []
+    performance_dfs = []
+    for tracking_backend in tracking_backends:
+        analyser = TrackingAnalyser(params={**params, 'tracking_backend': tracking_backend},
+                                    paths=paths,
+                                    blob_credentials=blob_credentials)
+
+        start_time = time.perf_counter()
+        fleets = [analyser.detect_and_track_objects(video, video_name,
+                                                    detections=chunk_detections[video_name])
+                  for video_name, video in video_dict.items()]
+        tracking_time = time.perf_counter() - start_time
+
+        frame_level_df = pd.concat([fleet.report_frame_level_info() for fleet in fleets], sort=True)
+        video_level_df = analyser.construct_video_level_df(frame_level_df)
+        analyser.cleanup_on_finish()
+
+        chunk_evaluator = ChunkEvaluator(annotation_xml_paths=annotation_xml_paths,
+                                         selected_labels=params['selected_labels'],
+                                         video_level_df=video_level_df,
+                                         video_level_column_order=video_level_column_order)
+        performance_df, _ = chunk_evaluator.evaluate_video_level()
+        performance_dfs.append(performance_df.assign(tracking_backend=tracking_backend))
+
+        speed_rows.append({'tracking_backend': tracking_backend,
+                           'n_frames': n_frames,
+                           'tracking_time': tracking_time,
+                           'frames_per_second': n_frames / tracking_time})
+
+    return pd.DataFrame(speed_rows), pd.concat(performance_dfs, ignore_index=True)
+
+
+def check_video_level_stats(video_dict: dict,
+                            params: dict,
+                            paths: dict,
+                            blob_credentials: dict,
+                            reference_video_level_df: pd.DataFrame,
+                            tracking_backend: str = 'opencv') -> pd.DataFrame:
+    """Check that the video level counts, stops and starts of a tracking backend are unchanged from a
+    reference, e.g. the video level table of the same videos produced before a change to the tracking
+
+    Args:
+        video_dict: key is video filename, value is np array of video or StreamingVideo
+        params: dictionary of parameters from yml file
+        paths: dictionary of paths from yml file
+        blob_credentials: blob credentials
+        reference_video_level_df: video level table of the videos to compare with
+        tracking_backend: value of the tracking_backend parameter to check
+    Returns:
+        comparison_df: the reference and current counts, stops and starts of each video and vehicle type
+    """
+    analyser = TrackingAnalyser(params={**params, 'tracking_backend': tracking_backend},
+                                paths=paths,
+                                blob_credentials=blob_credentials)
+    fleets = [analyser.detect_and_track_objects(video, video_name)
+              for video_name, video in video_dict.items()]
+    frame_level_df = pd.concat([fleet.report_frame_level_info() for fleet in fleets], sort=True)
+    video_level_df = analyser.construct_video_level_df(frame_level_df)
+    analyser.cleanup_on_finish()
+
+    key_columns = ['camera_id', 'video_upload_datetime', 'vehicle_type']
+    stat_columns = ['counts', 'stops', 'starts']
+    comparison_df = pd.merge(reference_video_level_df[key_columns + stat_columns],
+                             video_level_df[key_columns + stat_columns],
+                             on=key_columns, how='outer', suffixes=('_reference', ''))
+
+    for column in stat_columns:
+        assert comparison_df[column + '_reference'].equals(comparison_df[column]), \
+            f"Video level {column} differ from the reference for the {tracking_backend} backend"
+
+    return comparison_df
@@ -20,7 +20,7 @@ import numpy as np
 import pandas as pd
 import seaborn as sns
 
-from traffic_analysis.d00_utils.bbox_helpers import bbox_intersection_over_union
+from traffic_analysis.d00_utils.bbox_helpers import bbox_intersection_over_union_matrix
 
 sns.set_style("white")
 sns.set_context("poster")
@@ -75,16 +75,10 @@ def get_single_frame_results(gt_bboxes: list,
         fn = 0
         return {"true_pos": tp, "false_pos": fp, "false_neg": fn}
 
-    gt_idx_thr = []
-    pred_idx_thr = []
-    ious = []
-    for ipb, pred_bbox in enumerate(pred_bboxes):
-        for igb, gt_bbox in enumerate(gt_bboxes):
-            iou = bbox_intersection_over_union(pred_bbox, gt_bbox)
-            if iou > iou_thr:
-                gt_idx_thr.append(igb)
-                pred_idx_thr.append(ipb)
-                ious.append(iou)
+    # iou of every predicted box with every ground truth box, keep the pairs above the threshold
+    iou_matrix = bbox_intersection_over_union_matrix(pred_bboxes, gt_bboxes)
+    pred_idx_thr, gt_idx_thr = np.nonzero(iou_matrix > iou_thr)
+    ious = iou_matrix[pred_idx_thr, gt_idx_thr]
 
     args_desc = np.argsort(ious)[::-1]
     if len(args_desc) == 0:
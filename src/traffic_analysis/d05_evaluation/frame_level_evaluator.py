@@ -72,8 +72,7 @@ class FrameLevelEvaluator:
                                        on=['camera_id', 'video_upload_datetime'],
                                        how='inner')
 
-        zeros_mask = frame_level_df_filt.bboxes.apply(
-            lambda x: all(True if bbox_entry == 0.0 else False for bbox_entry in x))
+        zeros_mask = (frame_level_df_filt[['bbox_x', 'bbox_y', 'bbox_w', 'bbox_h']] == 0).all(axis=1)
 
         frame_level_df_filt = (frame_level_df_filt[~zeros_mask]
                                .sort_values(by=["camera_id", "video_upload_datetime"])
@@ -107,7 +106,7 @@ class FrameLevelEvaluator:
 
         Args: 
             df: frame_level_df which contains bboxes corresponding to each frame of
-                a video. 
+                a video, either in a bboxes column or in bbox_x, bbox_y, bbox_w, bbox_h columns. 
             include_confidence: If this df contains the confidence corresponding to 
                                 the bbox predictions, this should be specified (the 
                                 reparser will construct a sub-dict for this case)
@@ -119,13 +118,16 @@ class FrameLevelEvaluator:
         """
         # dict of dict of dicts, with outermost layer being the vehicle type
         n_frames = df["frame_id"].nunique()
-        bboxes_np = np.array(df["bboxes"].values.tolist())
+        if "bboxes" in df.columns:
+            bboxes_np = np.array(df["bboxes"].values.tolist())
+        else:
+            bboxes_np = df[["bbox_x", "bbox_y", "bbox_w", "bbox_h"]].values
         assert bboxes_np.shape[1] == 4
 
         if bbox_format == "cv2":
             # convert to format cvlib
-            bboxes_cvlib = pd.Series(bboxcv2_to_bboxcvlib(bboxes_np, vectorized=True).tolist()).values
-            df.loc[:, "bboxes"] = bboxes_cvlib
+            bboxes_np = bboxcv2_to_bboxcvlib(bboxes_np, vectorized=True)
+        df = df.assign(bboxes=pd.Series(bboxes_np.tolist(), index=df.index))
 
         # initialize dictionaries to correct shape
         if include_confidence:
@@ -144,7 +146,7 @@ class FrameLevelEvaluator:
             }
 
         for (vehicle_type, frame_id), vehicle_frame_df in df.groupby(
-                ["vehicle_type", "frame_id"]):
+                ["vehicle_type", "frame_id"], observed=True):
             if vehicle_type not in self.selected_labels: 
                 continue
 
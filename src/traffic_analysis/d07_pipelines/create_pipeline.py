@@ -1,4 +1,6 @@
 
+import pandas as pd
+
 from traffic_analysis.d00_utils.data_retrieval import delete_and_recreate_dir
 from traffic_analysis.d00_utils.load_confs import (load_credentials,
                                                    load_parameters, load_paths)
@@ -6,13 +8,16 @@ from traffic_analysis.d02_ref.load_video_names_from_blob import \
     load_video_names_from_blob
 from traffic_analysis.d02_ref.retrieve_and_upload_video_names_to_s3 import \
     retrieve_and_upload_video_names_to_s3
-from traffic_analysis.d03_processing.update_frame_level_table import \
-    update_frame_level_table
-from traffic_analysis.d03_processing.update_video_level_table import \
-    update_video_level_table
+from traffic_analysis.d03_processing.update_frame_level_table import (
+    update_frame_level_table, download_videos, analyse_videos, write_frame_level_table)
+from traffic_analysis.d03_processing.update_video_level_table import (
+    update_video_level_table, write_video_level_table)
 from traffic_analysis.d04_modelling.tracking.tracking_analyser import \
     TrackingAnalyser
 from traffic_analysis.d00_utils.data_loader_blob import DataLoaderBlob
+from traffic_analysis.d00_utils.blob_deletion_queue import BlobDeletionQueue
+from traffic_analysis.d00_utils.blob_client_pool import blob_client_pool
+from traffic_analysis.d07_pipelines.staged_pipeline import StagedPipeline
 
 
 def create_pipeline(output_file_name,
@@ -47,13 +52,42 @@ def create_pipeline(output_file_name,
     analyser = TrackingAnalyser(
         params=params, paths=paths, blob_credentials=blob_credentials)
 
+    # the processed folder is cleaned up once, after all chunks are processed
+    deletion_queue = BlobDeletionQueue(data_loader=dl, n_threads=params['delete_threads'])
+    if delete_processed_videos:
+        deletion_queue.add_prefix(paths['blob_processed_videos'])
+
+    # the analyser's stage timer is reset for every chunk, so the timings are collected after each one
+    stage_timings = []
+
+    if params['staged_pipeline']:
+        chunks = [selected_videos[i:i + chunk_size] for i in range(0, len(selected_videos), chunk_size)]
+        pipeline = run_staged_pipeline(analyser=analyser,
+                                       dl=dl,
+                                       chunks=chunks,
+                                       params=params,
+                                       paths=paths,
+                                       creds=creds,
+                                       move_to_processed_folder=move_to_processed_folder,
+                                       stage_timings=stage_timings)
+        print(pipeline.report_utilisation())
+        print(report_stage_timings(stage_timings))
+        deletion_queue.flush()
+        print(blob_client_pool.report_metrics())
+        analyser.cleanup_on_finish()
+        return
+
     # select chunks of videos and classify objects
     while selected_videos:
         file_names = selected_videos[:chunk_size]
         frame_level_df = update_frame_level_table(analyser=analyser,
                                                   file_names=file_names,
                                                   paths=paths,
-                                                  creds=creds)
+                                                  creds=creds,
+                                                  data_loader=dl,
+                                                  n_download_threads=params['download_threads'],
+                                                  n_download_retries=params['download_retries'])
+        stage_timings.append(analyser.stage_timer.report_timings())
         update_video_level_table(analyser=analyser,
                                  frame_level_df=frame_level_df,
                                  file_names=selected_videos[:chunk_size],
@@ -61,22 +95,136 @@ def create_pipeline(output_file_name,
                                  creds=creds,
                                  return_data=False)
 
-        # move processed videos to processed folder
-        if move_to_processed_folder:
-            delete_and_recreate_dir(paths["temp_video"])
+        move_processed_videos(dl=dl,
+                              file_names=file_names,
+                              paths=paths,
+                              move_to_processed_folder=move_to_processed_folder,
+                              n_move_threads=params['move_threads'])
 
-            for filename in file_names:
-                dl.copy_blob(file_to_move=filename, new_file=filename.replace(
-                    paths['blob_video'], paths['blob_processed_videos']), paths=paths)
+        # Move on to next chunk
+        selected_videos = selected_videos[chunk_size:]
+        delete_and_recreate_dir(paths["temp_video"])
 
-            dl.delete_blobs(blobs=file_names)
-            delete_and_recreate_dir(paths["temp_video"])
+    print(report_stage_timings(stage_timings))
+    deletion_queue.flush()
+    print(blob_client_pool.report_metrics())
+    analyser.cleanup_on_finish()
 
-        # delete processed videos if true
-        if delete_processed_videos is True:
-            blobs, elapsed_time = dl.list_blobs(prefix=paths['blob_processed_videos'])
-            dl.delete_blobs(blobs=blobs)
 
-        # Move on to next chunk
-        selected_videos = selected_videos[chunk_size:]
+def report_stage_timings(stage_timings: list) -> pd.DataFrame:
+    """Summarise the time spent in each stage of the analysis over all the chunks of a run
+
+    Args:
+        stage_timings: timings reported by the stage timer of the analyser after each chunk
+    Returns:
+        summary_df: one row per stage with the total time in seconds and its share of the total time
+    """
+    if not stage_timings:
+        return pd.DataFrame(columns=['stage', 'time', 'share'])
+
+    stage_times = pd.concat(stage_timings, ignore_index=True).drop(columns='item').sum()
+    return pd.DataFrame({'stage': stage_times.index,
+                         'time': stage_times.values,
+                         'share': stage_times.values / max(stage_times['total'], 1e-9)})
+
+
+def move_processed_videos(dl,
+                          file_names: list,
+                          paths: dict,
+                          move_to_processed_folder=False,
+                          n_move_threads=8):
+    """Move the processed videos to the processed folder on blob storage
+
+    Args:
+        dl: DataLoaderBlob or DataLoaderLocal
+        file_names: paths of the processed videos on blob storage
+        paths: dictionary of paths from yml file
+        move_to_processed_folder: if true, move the videos to the processed folder
+        n_move_threads: maximum number of videos moved at a time
+    """
+    # move processed videos to processed folder, copied by the storage service where possible
+    if move_to_processed_folder:
+        moves_df = dl.move_blobs(files_to_move=file_names,
+                                 new_files=[filename.replace(paths['blob_video'], paths['blob_processed_videos'])
+                                            for filename in file_names],
+                                 n_threads=n_move_threads)
+        if not moves_df['success'].all():
+            print(f"Could not move {(~moves_df['success']).sum()} processed videos")
+
+
+def run_staged_pipeline(analyser,
+                        dl,
+                        chunks: list,
+                        params: dict,
+                        paths: dict,
+                        creds: dict,
+                        move_to_processed_folder=False,
+                        stage_timings=None) -> StagedPipeline:
+    """Process chunks of videos in three stages running at the same time: chunk N+1 is downloaded while
+    chunk N is analysed and the results of chunk N-1 are written to the database (and its videos moved).
+    At most pipeline_queue_size chunks wait between two stages.
+
+    Args:
+        analyser: analyser object for doing traffic analysis
+        dl: DataLoaderBlob or DataLoaderLocal the videos are downloaded from
+        chunks: lists of paths of the videos on blob storage, one list per chunk
+        params: dictionary of parameters from yml file
+        paths: dictionary of paths from yml file
+        creds: dictionary of credentials from yml file
+        move_to_processed_folder: if true, move the videos to the processed folder once they are persisted
+        stage_timings: if given, the timings of the analyser's stage timer are appended to it after each chunk
+    Returns:
+        pipeline: the pipeline which was run, to report the utilisation of the stages
+    """
+    def download_chunk(chunk):
+        chunk_ind, file_names = chunk
+        # chunks in flight are downloaded to separate folders
+        local_folder = paths["temp_video"] + f"chunk_{chunk_ind}/"
+        download_videos(data_loader=dl,
+                        file_names=file_names,
+                        local_folder=local_folder,
+                        n_download_threads=params['download_threads'],
+                        n_download_retries=params['download_retries'])
+        return file_names, local_folder
+
+    def analyse_chunk(downloaded_chunk):
+        file_names, local_folder = downloaded_chunk
+        frame_level_df = analyse_videos(analyser=analyser, local_folder=local_folder)
+        if stage_timings is not None:
+            stage_timings.append(analyser.stage_timer.report_timings())
+        video_level_df = None
+        if frame_level_df is not None:
+            video_level_df = analyser.construct_video_level_df(frame_level_df)
+        return file_names, frame_level_df, video_level_df
+
+    def persist_chunk(analysed_chunk):
+        file_names, frame_level_df, video_level_df = analysed_chunk
+        if frame_level_df is not None:
+            write_frame_level_table(frame_level_df=frame_level_df, paths=paths, creds=creds)
+            if not video_level_df.empty:
+                write_video_level_table(video_level_df=video_level_df, paths=paths, creds=creds)
+        else:
+            # as in the sequential pipeline, the video level table is built from the frame level table
+            update_video_level_table(analyser=analyser,
+                                     frame_level_df=None,
+                                     file_names=file_names,
+                                     paths=paths,
+                                     creds=creds)
+
+        move_processed_videos(dl=dl,
+                              file_names=file_names,
+                              paths=paths,
+                              move_to_processed_folder=move_to_processed_folder,
+                              n_move_threads=params['move_threads'])
+        return file_names
+
+    pipeline = StagedPipeline(stages=[('download', download_chunk),
+                                      ('analyse', analyse_chunk),
+                                      ('persist', persist_chunk)],
+                              queue_size=params['pipeline_queue_size'])
+    try:
+        pipeline.run(enumerate(chunks))
+    finally:
         delete_and_recreate_dir(paths["temp_video"])
+
+    return pipeline
@@ -0,0 +1,148 @@
+import queue
+import threading
+import time
+
+import pandas as pd
+
+# marks the end of the items passed from one stage to the next
+end_of_items = object()
+
+
+class StagedPipeline:
+    """
+    Passes items through a sequence of stages, each running in its own thread, so that the stages work
+    on consecutive items at the same time (e.g. downloading chunk N+1 while chunk N is analysed and chunk
+    N-1 is persisted). Stages are connected by queues of at most queue_size items: a stage which gets
+    ahead blocks until the next stage has taken an item, which bounds the memory and disk used by items
+    in flight.
+
+    The time each stage spends working, waiting for its input and waiting for room in its output queue
+    is recorded, so that the bottleneck stage can be identified.
+    """
+
+    def __init__(self, stages: list, queue_size: int = 1):
+        """
+        Args:
+            stages -- list of (name, function) in pipeline order. The function of each stage is called with
+                      the output of the previous one (the items themselves for the first stage)
+            queue_size -- maximum number of items waiting between two stages
+        """
+        assert len(stages) > 0
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.timings = {}
+        self.run_time = 0.
+        self.errors = []
+        # set to stop a stage early
+        self.stop_events = [threading.Event() for _ in stages]
+
+    def run(self, items) -> list:
+        """Pass all items through the stages
+
+        Args:
+            items: iterable of the inputs of the first stage
+        Returns:
+            outputs: outputs of the last stage, in the order of the items
+        Raises:
+            The first exception raised by a stage, after all stages have stopped. The earlier stages stop
+            straight away, the later ones finish the items they were passed before the failure.
+        """
+        self.timings = {name: {'n_items': 0, 'busy_time': 0., 'input_wait_time': 0., 'output_wait_time': 0.}
+                        for name, _ in self.stages}
+        self.errors = []
+        for stop_event in self.stop_events:
+            stop_event.clear()
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) - 1)]
+        outputs = []
+        threads = []
+        for stage_ind, (name, function) in enumerate(self.stages):
+            input_queue = queues[stage_ind - 1] if stage_ind > 0 else None
+            output_queue = queues[stage_ind] if stage_ind < len(queues) else None
+            threads.append(threading.Thread(target=self.run_stage,
+                                            args=(stage_ind, function, items if input_queue is None else None,
+                                                  input_queue, output_queue, outputs),
+                                            daemon=True))
+
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.run_time = time.time() - start
+
+        if self.errors:
+            raise self.errors[0]
+        return outputs
+
+    def run_stage(self, stage_ind, function, items, input_queue, output_queue, outputs):
+        name = self.stages[stage_ind][0]
+        stop_event = self.stop_events[stage_ind]
+        timings = self.timings[name]
+        inputs = iter(items) if input_queue is None else self.iterate_queue(input_queue, stop_event)
+        try:
+            while not stop_event.is_set():
+                start = time.time()
+                item = next(inputs, end_of_items)
+                timings['input_wait_time'] += time.time() - start
+                if item is end_of_items:
+                    break
+
+                start = time.time()
+                output = function(item)
+                timings['busy_time'] += time.time() - start
+                timings['n_items'] += 1
+
+                start = time.time()
+                if output_queue is None:
+                    outputs.append(output)
+                else:
+                    self.put(output_queue, output, stop_event)
+                timings['output_wait_time'] += time.time() - start
+
+        except Exception as e:
+            print(f"Pipeline stage {name} failed due to {e}")
+            self.errors.append(e)
+            # the earlier stages stop instead of waiting for this one
+            for earlier_stop_event in self.stop_events[:stage_ind]:
+                earlier_stop_event.set()
+
+        finally:
+            if output_queue is not None:
+                self.put(output_queue, end_of_items, stop_event)
+
+    def iterate_queue(self, input_queue, stop_event):
+        while not stop_event.is_set():
+            try:
+                item = input_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is end_of_items:
+                return
+            yield item
+
+    def put(self, output_queue, item, stop_event):
+        # wait for room in the queue, unless the stage is stopping
+        while not stop_event.is_set():
+            try:
+                output_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def report_utilisation(self) -> pd.DataFrame:
+        """Report how each stage spent the time of the last run
+
+        Returns:
+            utilisation_df: one row per stage with the number of items processed, the time in seconds spent
+                            working on them, waiting for input and waiting for the next stage, and the fraction
+                            of the run time spent working
+        """
+        column_names = ['stage', 'n_items', 'busy_time', 'input_wait_time', 'output_wait_time', 'utilisation']
+        rows = []
+        for name, _ in self.stages:
+            timings = self.timings[name]
+            rows.append([name, timings['n_items'], timings['busy_time'], timings['input_wait_time'],
+                         timings['output_wait_time'], timings['busy_time'] / max(self.run_time, 1e-6)])
+
+        return pd.DataFrame(rows, columns=column_names)